@@ -17,13 +17,38 @@ Fecha: Julio 23, 2025
 Equipo: Mauricio, Maggie, Ceci, Flor, Ignacio
 """
 
-from flask import Flask, render_template, request, jsonify, redirect, send_file
+from flask import Flask, Response, render_template, request, jsonify, redirect, send_file, stream_with_context
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from db import get_db, create_indexes
+from change_notifier import BatchChangeNotifier
+from batch_loader import iter_chunks, iter_manifest_batches, iter_ndjson_batches, upsert_batches, replace_collection
+from batch_counters import UNASSIGNED_FILTER, apply_counter_changes, ensure_counters, rebuild_counters
+from batch_metrics import compute_batch_metrics
+from batch_events import record_batch_events
+from batch_forecast import BACKLOG_STATUSES, daily_completions, forecast, local_midnight_utc, local_today
+from daily_progress import (apply_progress_changes, ensure_daily_progress, find_daily_progress,
+                            read_daily_progress, rebuild_daily_progress)
+from csv_export import ListCell, iter_csv
+from batch_id_extraction import extract_batch_ids
+from mask_index import MASK_INDEX_COLLECTION, batch_file_summary, index_masks
+from mask_sync_scheduler import SCHEDULER_COLLECTION, MaskSyncScheduler
+from jobs import JOBS_COLLECTION, JobRunner
+from metrics_cache import MetricsCache, DEFAULT_PATH as METRICS_CACHE_DEFAULT_PATH
 import json
 import os
-import csv
-import io
-from datetime import datetime
+import base64
+import gzip
+import re
+import time
+import zlib
+import copy
+import functools
+import itertools
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
 
 app = Flask(__name__)
 
@@ -36,6 +61,12 @@ db = None
 batches_col = None
 masks_col = None
 segmentadores_col = None
+counters_col = None
+batch_changes_col = None
+jobs_col = None
+batch_counters_col = None
+daily_progress_col = None
+batch_events_col = None
 
 # Nuevas conexiones para Quality_dashboard y training_metrics
 quality_db = None
@@ -44,7 +75,7 @@ training_db = None
 training_masks_col = None
 
 def init_db():
-    global db, batches_col, masks_col, segmentadores_col, CREW_MEMBERS
+    global db, batches_col, masks_col, segmentadores_col, counters_col, batch_changes_col, jobs_col, batch_counters_col, daily_progress_col, batch_events_col, CREW_MEMBERS
     global quality_db, quality_segmentadores_col, training_db, training_masks_col
 
     # Conexión a segmentacion_db (batches principales)
@@ -53,7 +84,18 @@ def init_db():
         batches_col = db["batches"]
         masks_col = db["masks"]
         segmentadores_col = db["segmentadores"]
+        counters_col = db["counters"]
+        batch_changes_col = db["batch_changes"]
+        jobs_col = db[JOBS_COLLECTION]
+        batch_counters_col = db["batch_counters"]
+        daily_progress_col = db["daily_progress"]
+        batch_events_col = db["batch_events"]
         create_indexes()
+        try:
+            ensure_counters(db)
+            ensure_daily_progress(db)
+        except Exception as e:
+            print(f"⚠️ No se pudieron inicializar batch_counters/daily_progress: {e}")
         print("✅ Conectado a segmentacion_db")
     else:
         print("⚠️ segmentacion_db no disponible")
@@ -77,6 +119,12 @@ def init_db():
     else:
         print("⚠️ QUALITY_IEMSA no disponible")
 
+    # Planificador de sincronización de máscaras (un hilo por worker, corre uno solo)
+    # y cola de trabajos en segundo plano (retoma los que dejó un worker reciclado)
+    if db is not None:
+        mask_sync_scheduler.ensure_started()
+        job_runner.ensure_started()
+
 def load_segmentadores_from_db():
     """Cargar lista de segmentadores desde Quality_dashboard.segmentadores"""
     global CREW_MEMBERS, quality_segmentadores_col
@@ -113,6 +161,360 @@ def load_segmentadores_from_db():
 # Lista de miembros del equipo (será cargada desde MongoDB en init_db)
 CREW_MEMBERS = []
 
+# ============================================
+# VERSIÓN DE LA COLECCIÓN DE BATCHES (ETag / 304 / DELTAS)
+# ============================================
+
+# Segundos que un worker reutiliza la versión leída de Mongo antes de volver a consultarla.
+# Las escrituras del propio worker actualizan el valor al instante.
+BATCHES_VERSION_TTL = float(os.environ.get("BATCHES_VERSION_TTL", "1.0"))
+
+# Máximo de IDs por entrada del log de cambios; por encima se registra un "reset"
+# y los clientes recargan el tablero completo.
+BATCH_CHANGES_MAX_IDS = int(os.environ.get("BATCH_CHANGES_MAX_IDS", "5000"))
+# Segundos tras los cuales una entrada "pending" sin cerrar (proceso caído a mitad
+# de la escritura) se cierra como "reset": los clientes recargan, no se salta nada
+BATCH_CHANGES_PENDING_SECONDS = int(os.environ.get("BATCH_CHANGES_PENDING_SECONDS", "900"))
+# Entradas revisadas por llamada al publicar la versión
+BATCH_CHANGES_PUBLISH_SCAN = 1000
+
+_batches_version = {"value": None, "read_at": 0.0}
+_batches_version_lock = threading.Lock()
+# Secuencias abiertas por el hilo actual (petición, trabajo o sincronización)
+_open_batch_changes = threading.local()
+
+def bump_batches_version():
+    """Reservar el número de secuencia de una escritura de batches.
+
+    Llamar ANTES de cada escritura para estampar el seq en los documentos: deja
+    una entrada "pending" en batch_changes que record_batch_change(seq, ...)
+    cierra después de aplicar la escritura. La versión que ven los lectores
+    (get_batches_version) solo avanza sobre entradas cerradas.
+    """
+    global counters_col
+    if counters_col is None:
+        return None
+    try:
+        doc = counters_col.find_one_and_update(
+            {"_id": "batches_version"},
+            {"$inc": {"seq": 1}, "$setOnInsert": {"published": 0}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        seq = doc["seq"]
+    except Exception as e:
+        print(f"⚠️ No se pudo incrementar la versión de batches: {e}")
+        return None
+    if batch_changes_col is not None:
+        now = datetime.utcnow()
+        try:
+            batch_changes_col.insert_one({"seq": seq, "state": "pending", "ts": now, "started_at": now})
+        except Exception as e:
+            # Queda un hueco: publish_batch_changes lo cierra como reset al vencer
+            print(f"⚠️ No se pudo registrar el cambio pendiente {seq}: {e}")
+    if not hasattr(_open_batch_changes, "seqs"):
+        _open_batch_changes.seqs = []
+    _open_batch_changes.seqs.append(seq)
+    return seq
+
+def _abandon_batch_change(seq):
+    """Cerrar como reset una secuencia que nadie va a completar (o un hueco sin entrada)"""
+    try:
+        batch_changes_col.update_one(
+            {"seq": seq, "state": {"$in": ["pending", None]}},
+            {"$set": {"state": "done", "reset": True, "abandoned": True, "ts": datetime.utcnow()}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        pass  # Se cerró mientras tanto
+    print(f"⚠️ Cambio {seq} abandonado sin cerrar: se publica como reset")
+
+def publish_batch_changes():
+    """Avanzar la versión publicada hasta la última secuencia cerrada contigua.
+
+    Una entrada "pending" detiene el avance (escritura en curso) hasta que se
+    cierra o hasta BATCH_CHANGES_PENDING_SECONDS, cuando se cierra como reset.
+    Devuelve la versión publicada (counters.batches_version.published).
+    """
+    doc = counters_col.find_one({"_id": "batches_version"}) or {}
+    latest = doc.get("seq", 0)
+    published = doc.get("published")
+    if published is None:
+        # Contador anterior a la versión publicada: todo lo registrado hasta ahora ya estaba cerrado
+        if doc:
+            counters_col.update_one({"_id": "batches_version", "published": {"$exists": False}},
+                                    {"$set": {"published": latest}})
+        return latest
+    if published >= latest or batch_changes_col is None:
+        return published
+
+    entries = list(batch_changes_col.find(
+        {"seq": {"$gt": published, "$lte": latest}}, {"_id": 0, "seq": 1, "state": 1, "started_at": 1, "ts": 1}
+    ).sort("seq", 1).limit(BATCH_CHANGES_PUBLISH_SCAN))
+    by_seq = {entry["seq"]: entry for entry in entries}
+    cutoff = datetime.utcnow() - timedelta(seconds=BATCH_CHANGES_PENDING_SECONDS)
+
+    version = published
+    while version < latest and version + 1 <= published + BATCH_CHANGES_PUBLISH_SCAN:
+        entry = by_seq.get(version + 1)
+        if entry is not None and entry.get("state") != "pending":
+            version += 1
+            continue
+        if entry is not None:
+            started = entry.get("started_at") or entry["ts"]
+        else:
+            # Hueco sin entrada: se reservó antes que cualquier secuencia posterior
+            later = [e.get("started_at") or e["ts"] for seq, e in by_seq.items() if seq > version + 1]
+            started = min(later) if later else None
+        if started is None or started > cutoff:
+            break
+        _abandon_batch_change(version + 1)
+        version += 1
+
+    if version > published:
+        counters_col.update_one({"_id": "batches_version"}, {"$max": {"published": version}})
+    return version
+
+def _set_local_batches_version(value):
+    with _batches_version_lock:
+        _batches_version["value"] = value
+        _batches_version["read_at"] = time.monotonic()
+
+def get_batches_version(fresh=False):
+    """Versión publicada de batches (todas las escrituras <= versión ya aplicadas).
+
+    Usa caché local de BATCHES_VERSION_TTL segundos (fresh=True la ignora).
+    """
+    with _batches_version_lock:
+        if (not fresh and _batches_version["value"] is not None and
+                time.monotonic() - _batches_version["read_at"] < BATCHES_VERSION_TTL):
+            return _batches_version["value"]
+    if counters_col is None:
+        return None
+    try:
+        value = publish_batch_changes()
+    except Exception as e:
+        print(f"⚠️ No se pudo leer la versión de batches: {e}")
+        return None
+    _set_local_batches_version(value)
+    return value
+
+def batch_change_stamp(seq):
+    """Campos que cada escritura agrega al batch: número de secuencia y fecha de actualización"""
+    stamp = {"updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    if seq is not None:
+        stamp["seq"] = seq
+    return stamp
+
+# Revisión por batch (control de concurrencia optimista): toda escritura la incrementa.
+# Los batches nuevos nacen con rev 1; los anteriores a este campo cuentan como rev 0.
+REV_INCREMENT = {"rev": 1}
+
+def rev_filter(rev):
+    """Condición de filtro para "el batch sigue en la revisión `rev`" """
+    return {"rev": {"$in": [None, 0]}} if rev == 0 else {"rev": rev}
+
+def parse_expected_rev(data):
+    """Revisión esperada desde If-Match (ETag "<rev>") o el campo "rev" del cuerpo; None = sin control"""
+    header = request.headers.get("If-Match", "").strip()
+    if header and header != "*":
+        value = header[2:] if header.startswith("W/") else header
+        value = value.strip('"')
+    elif isinstance(data, dict) and data.get("rev") is not None:
+        value = data["rev"]
+    else:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Revisión inválida: {value}")
+
+def record_batch_change(seq, upserted=(), deleted=(), reset=False):
+    """Cerrar en batch_changes la mutación con número de secuencia `seq` y publicar la versión.
+
+    Se registra aunque la escritura no haya afectado documentos: una entrada
+    "pending" sin cerrar detiene la versión que ven los lectores.
+    """
+    seqs = getattr(_open_batch_changes, "seqs", [])
+    if seq in seqs:
+        seqs.remove(seq)
+    if seq is None or batch_changes_col is None:
+        return
+    upserted = list(upserted)
+    deleted = list(deleted)
+    if len(upserted) + len(deleted) > BATCH_CHANGES_MAX_IDS:
+        reset = True
+    entry = {"state": "done", "ts": datetime.utcnow(), "reset": reset}
+    if not reset:
+        entry["upserted"] = upserted
+        entry["deleted"] = deleted
+    try:
+        result = batch_changes_col.update_one({"seq": seq, "state": "pending"}, {"$set": entry})
+        if not result.matched_count:
+            try:
+                batch_changes_col.insert_one({"seq": seq, **entry})
+            except DuplicateKeyError:
+                # Ya se publicó como abandonada: los clientes pasaron de largo, recargan con un reset nuevo
+                record_batch_change(bump_batches_version(), reset=True)
+                return
+        _set_local_batches_version(publish_batch_changes())
+    except Exception as e:
+        print(f"⚠️ No se pudo registrar el cambio {seq} en batch_changes: {e}")
+    invalidate_metrics_cache()
+
+def close_open_batch_changes():
+    """Cerrar como reset las secuencias que el hilo reservó y no registró (escritura que falló a medias)"""
+    for seq in list(getattr(_open_batch_changes, "seqs", [])):
+        print(f"⚠️ Cambio {seq} sin registrar al terminar: se publica como reset")
+        record_batch_change(seq, reset=True)
+
+@app.teardown_request
+def _close_request_batch_changes(exc):
+    close_open_batch_changes()
+
+def update_batch_counters(removed=(), added=()):
+    """Actualizar los datos derivados con el estado anterior (`removed`) y el nuevo (`added`) de los batches.
+
+    - $inc en batch_counters y daily_progress
+    - eventos de transición (status/assignee) en batch_events
+
+    Los estados necesitan id, assignee, status y metadata.assigned_at. Un fallo
+    no revierte la escritura del batch; rebuild_counters.py corrige la deriva.
+    """
+    if batch_counters_col is None:
+        return
+    removed, added = list(removed), list(added)
+    try:
+        apply_counter_changes(batch_counters_col, removed, added)
+        apply_progress_changes(daily_progress_col, removed, added)
+    except Exception as e:
+        print(f"⚠️ No se pudieron actualizar batch_counters/daily_progress: {e}")
+    try:
+        record_batch_events(batch_events_col, removed, added)
+    except Exception as e:
+        print(f"⚠️ No se pudieron registrar eventos en batch_events: {e}")
+    invalidate_metrics_cache()
+
+def refresh_batch_counters():
+    """Recalcular batch_counters y daily_progress completos (tras reemplazar la colección de batches)"""
+    if db is None:
+        return
+    try:
+        rebuild_counters(db)
+        rebuild_daily_progress(db)
+    except Exception as e:
+        print(f"⚠️ No se pudo reconstruir batch_counters/daily_progress: {e}")
+    invalidate_metrics_cache()
+
+def crew_fingerprint():
+    """Hash corto de la lista de segmentadores (las métricas dependen también de ella)"""
+    return f"{zlib.crc32(','.join(CREW_MEMBERS).encode('utf-8')):08x}"
+
+# Vistas cuya respuesta depende del día actual (ventanas "últimos N días", ETA)
+DATE_RELATIVE_VIEWS = set()
+
+def date_relative(view):
+    """Decorador: marcar una vista que depende de la fecha local (su ETag y clave de caché cambian cada día)"""
+    DATE_RELATIVE_VIEWS.add(view.__name__)
+    return view
+
+def response_fingerprint():
+    """Lo que el ETag y la clave de caché agregan a la versión: segmentadores y, si aplica, el día local"""
+    fingerprint = crew_fingerprint()
+    if request.endpoint in DATE_RELATIVE_VIEWS:
+        fingerprint += f"-{local_today(METRICS_TIMEZONE):%Y%m%d}"
+    return fingerprint
+
+# ============================================
+# CACHÉ DE MÉTRICAS COMPARTIDA ENTRE WORKERS
+# ============================================
+
+# Segundos de vida de una respuesta cacheada (0 = caché desactivada)
+METRICS_CACHE_TTL = int(os.environ.get("METRICS_CACHE_TTL", "60"))
+metrics_cache = MetricsCache(
+    path=os.environ.get("METRICS_CACHE_PATH", METRICS_CACHE_DEFAULT_PATH),
+    ttl=METRICS_CACHE_TTL
+)
+
+def invalidate_metrics_cache():
+    """Descartar respuestas calculadas con la versión publicada o anteriores.
+
+    Se llama DESPUÉS de registrar cada escritura, cuando la versión publicada ya
+    la incluye. Es limpieza: una entrada solo se sirve con la versión publicada
+    actual, así que las de versiones anteriores ya no se usaban.
+    """
+    if not metrics_cache.enabled:
+        return
+    with _batches_version_lock:
+        version = _batches_version["value"]
+    if version is not None:
+        metrics_cache.invalidate(version)
+
+def metrics_cached(view):
+    """Decorador: servir la respuesta desde la caché compartida si la versión publicada no cambió.
+
+    La clave usa la versión leída antes de calcular (como el ETag). Va debajo de
+    @batches_etag: un 304 no llega a consultar la caché.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != "GET" or not metrics_cache.enabled:
+            return view(*args, **kwargs)
+        version = get_batches_version()
+        if version is None:
+            return view(*args, **kwargs)
+
+        query = urlencode(sorted(request.args.items(multi=True)))
+        key = f"{request.path}?{query}#{response_fingerprint()}"
+        cached = metrics_cache.get(key, request.path, version)
+        if cached:
+            body, content_type, disposition = cached
+            response = app.response_class(body, content_type=content_type)
+            if disposition:
+                response.headers["Content-Disposition"] = disposition
+            response.headers["X-Metrics-Cache"] = "HIT"
+            return response
+
+        response = app.make_response(view(*args, **kwargs))
+        # Guardar solo si nadie publicó una escritura mientras se calculaba: si no,
+        # la entrada quedaría con una versión que el invalidate ya pasó
+        if (response.status_code == 200 and not response.direct_passthrough and not response.is_streamed
+                and get_batches_version(fresh=True) == version):
+            metrics_cache.set(key, request.path, version, response.get_data(),
+                              response.content_type, response.headers.get("Content-Disposition"))
+        response.headers["X-Metrics-Cache"] = "MISS"
+        return response
+    return wrapper
+
+def batches_etag(view):
+    """Decorador: ETag derivado de la versión publicada de batches y respuesta 304 con If-None-Match.
+
+    La versión se lee ANTES de ejecutar la vista y solo incluye escrituras ya
+    aplicadas (ver publish_batch_changes), así que el cuerpo es al menos tan
+    nuevo como su ETag. Una escritura en curso durante la vista se publica
+    después con una versión mayor y la siguiente revalidación recibe un 200.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != "GET":
+            return view(*args, **kwargs)
+        version = get_batches_version()
+        if version is None:
+            return view(*args, **kwargs)
+
+        etag = f"b{version}-{response_fingerprint()}"
+
+        if etag in request.if_none_match:
+            response = app.response_class(status=304)
+        else:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    return wrapper
+
 @app.route("/")
 def index():
     return render_template("team.html", crew=CREW_MEMBERS)
@@ -173,9 +575,33 @@ def logout():
     # Implementar autenticación en el futuro
     return redirect("/")
 
+def _encode_cursor(last_id):
+    """Cursor opaco para paginación keyset: último id visto + su llave de orden"""
+    raw = json.dumps({"k": "id", "v": last_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor):
+    """Decodificar un cursor de _encode_cursor; lanza ValueError si es inválido"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except Exception:
+        raise ValueError("Cursor inválido")
+    if not isinstance(data, dict) or data.get("k") != "id" or not isinstance(data.get("v"), str):
+        raise ValueError("Cursor inválido")
+    return data["v"]
+
 @app.route("/api/batches", methods=["GET"])
+@batches_etag
 def get_batches():
-    """Endpoint paginado: ?page=1&per_page=50"""
+    """Endpoint paginado.
+
+    - Modo página (compatibilidad): ?page=1&per_page=50
+    - Modo cursor (keyset): ?cursor=&per_page=50 -> devuelve next_cursor.
+      Cada página es un range scan sobre el índice único de "id", por lo que
+      la página N cuesta lo mismo que la página 1. El total es opcional
+      (?include_total=1) y sale de estimated_document_count().
+    """
     global batches_col
     if batches_col is None:
         # intentar reconectar a demanda
@@ -188,23 +614,55 @@ def get_batches():
             return jsonify({"error":"No DB connection"}), 503
 
     try:
-        page = max(1, int(request.args.get("page", 1)))
         per_page = int(request.args.get("per_page", 50))
         per_page = min(max(5, per_page), 1000)  # límites razonables aumentados
 
-        skip = (page - 1) * per_page
-
         # Proyección para evitar traer campos pesados
         projection = {"_id": 0}
 
+        # Versión publicada leída antes de consultar: todo lo anterior ya está en los datos.
+        # Es el punto de partida para /api/batches/changes
+        version = get_batches_version()
+
+        if "cursor" in request.args:
+            # MODO CURSOR: range scan sobre el índice único de "id"
+            cursor_param = request.args.get("cursor", "").strip()
+            query = {}
+            if cursor_param:
+                try:
+                    query = {"id": {"$gt": _decode_cursor(cursor_param)}}
+                except ValueError as cursor_error:
+                    return jsonify({"error": str(cursor_error)}), 400
+
+            # Pedir un elemento extra para saber si hay otra página sin contar
+            items = list(batches_col.find(query, projection).sort("id", 1).limit(per_page + 1))
+            has_more = len(items) > per_page
+            items = items[:per_page]
+
+            pagination = {
+                "version": version,
+                "per_page": per_page,
+                "has_more": has_more,
+                "next_cursor": _encode_cursor(items[-1]["id"]) if has_more and items else None
+            }
+            if request.args.get("include_total", "false").lower() in ("1", "true"):
+                pagination["total_estimate"] = batches_col.estimated_document_count()
+
+            return jsonify({"batches": items, "pagination": pagination})
+
+        page = max(1, int(request.args.get("page", 1)))
+        skip = (page - 1) * per_page
+
         cursor = batches_col.find({}, projection).sort("id", 1).skip(skip).limit(per_page)
         items = list(cursor)
 
-        total = batches_col.count_documents({})
+        # Sin filtro, el conteo estimado (metadata de la colección) evita recorrer el índice
+        total = batches_col.estimated_document_count()
 
         return jsonify({
             "batches": items,
             "pagination": {
+                "version": version,
                 "page": page,
                 "per_page": per_page,
                 "total": total,
@@ -215,18 +673,424 @@ def get_batches():
         print("❌ Error en get_batches:", e)
         return jsonify({"error": str(e)}), 500
 
+# Columnas que la tabla de DataTables puede ordenar/filtrar en el servidor.
+# Solo se ordena por campos con índice (ver db.create_indexes).
+DATATABLE_ORDERABLE = {"id", "assignee", "status", "metadata.assigned_at"}
+DATATABLE_FILTERABLE = {
+    "id", "assignee", "status", "mongo_uploaded",
+    "metadata.assigned_at", "metadata.review_status", "comments"
+}
+# Orden de columnas de la tabla del dashboard (para clientes que no envían columns[i][data])
+DATATABLE_DEFAULT_COLUMNS = [
+    "id", "assignee", "mongo_uploaded", "status",
+    "metadata.assigned_at", "metadata.review_status", "comments"
+]
+
+def _datatable_column_filter(field, value):
+    """Traducir el filtro de una columna de DataTables a una condición Mongo indexable"""
+    if field == "id":
+        # Prefijo anclado: usa el índice único de "id"
+        return {"id": {"$regex": f"^{re.escape(value)}"}}
+    if field == "assignee":
+        if value in ("Sin asignar", "__none__"):
+            # Mismo criterio que los contadores (null o solo espacios)
+            return UNASSIGNED_FILTER
+        return {"assignee": value}
+    if field == "mongo_uploaded":
+        return {"mongo_uploaded": value.lower() in ("true", "1", "si", "sí")}
+    if field == "metadata.assigned_at":
+        # Fechas YYYY-MM-DD: un prefijo ("2025-10") es un rango sobre el índice
+        return {"metadata.assigned_at": {"$regex": f"^{re.escape(value)}"}}
+    if field == "metadata.review_status" and value.lower() == "pendiente":
+        # Pendiente = sin revisión (campo ausente, null o vacío)
+        return {"metadata.review_status": {"$in": [None, ""]}}
+    if field == "comments":
+        # Búsqueda de texto libre: sin índice, solo se aplica si el usuario filtra por comentarios
+        return {"comments": {"$regex": re.escape(value), "$options": "i"}}
+    return {field: value}
+
+@app.route("/api/batches/datatable", methods=["GET", "POST"])
+@batches_etag
+def get_batches_datatable():
+    """Procesamiento server-side para DataTables (draw/start/length/search/order/columns).
+
+    Solo se transfieren las filas visibles; el filtrado y el orden se
+    resuelven en Mongo sobre assignee, status, metadata.assigned_at e id.
+    """
+    global batches_col
+    if batches_col is None:
+        db_local = get_db(raise_on_fail=False)
+        if db_local is not None:
+            batches_col = db_local["batches"]
+        else:
+            return jsonify({"error": "No DB connection"}), 503
+
+    try:
+        params = request.values
+        draw = int(params.get("draw", 0))
+        start = max(0, int(params.get("start", 0)))
+        length = int(params.get("length", 25))
+        if length < 0:
+            length = 1000  # "Todos" en DataTables: mismo límite que /api/batches
+        length = min(max(1, length), 1000)
+
+        # Columnas enviadas por DataTables (columns[i][data]); si no vienen, usar las del dashboard
+        columns = []
+        index = 0
+        while f"columns[{index}][data]" in params:
+            columns.append(params.get(f"columns[{index}][data]", ""))
+            index += 1
+        if not columns:
+            columns = list(DATATABLE_DEFAULT_COLUMNS)
+
+        conditions = []
+
+        # Filtro por responsable fijo (vista /dashboard/<assignee>)
+        if params.get("assignee"):
+            conditions.append(_datatable_column_filter("assignee", params["assignee"]))
+
+        # Filtros por columna
+        for i, field in enumerate(columns):
+            value = params.get(f"columns[{i}][search][value]", "").strip()
+            if value and field in DATATABLE_FILTERABLE:
+                conditions.append(_datatable_column_filter(field, value))
+
+        # Búsqueda global: prefijo de ID (con o sin "batch_") o responsable exacto
+        search_value = params.get("search[value]", "").strip()
+        if search_value:
+            escaped = re.escape(search_value)
+            conditions.append({"$or": [
+                {"id": {"$regex": f"^{escaped}"}},
+                {"id": {"$regex": f"^batch_{escaped}"}},
+                {"assignee": search_value}
+            ]})
+
+        query = {"$and": conditions} if len(conditions) > 1 else (conditions[0] if conditions else {})
+
+        # Orden: solo columnas indexadas, con "id" como desempate estable
+        sort = []
+        index = 0
+        while f"order[{index}][column]" in params:
+            raw_column = params.get(f"order[{index}][column]")
+            try:
+                column_index = int(raw_column)
+            except ValueError:
+                column_index = -1
+            # Un índice negativo no debe contar desde el final de la lista
+            if not 0 <= column_index < len(columns):
+                return jsonify({
+                    "draw": draw,
+                    "error": f"order[{index}][column] inválido: {raw_column} (0..{len(columns) - 1})"
+                }), 400
+            field = columns[column_index]
+            direction = -1 if params.get(f"order[{index}][dir]", "asc") == "desc" else 1
+            if field in DATATABLE_ORDERABLE and field not in [s[0] for s in sort]:
+                sort.append((field, direction))
+            index += 1
+        if not any(field == "id" for field, _ in sort):
+            sort.append(("id", 1))
+
+        rows = list(batches_col.find(query, {"_id": 0}).sort(sort).skip(start).limit(length))
+
+        records_total = batches_col.estimated_document_count()
+        records_filtered = batches_col.count_documents(query) if query else records_total
+
+        return jsonify({
+            "draw": draw,
+            "recordsTotal": records_total,
+            "recordsFiltered": records_filtered,
+            "data": rows
+        })
+    except Exception as e:
+        print(f"❌ Error en get_batches_datatable: {e}")
+        return jsonify({"draw": request.values.get("draw", 0), "error": str(e)}), 500
+
+def collect_batch_changes(since, limit=500, current=None):
+    """Calcular el delta de batches desde la versión `since` a partir de batch_changes.
+
+    Devuelve un dict con version, reset, upserted (documentos actuales),
+    deleted (IDs) y has_more. Lo usan /api/batches/changes y el stream SSE.
+    Solo se leen entradas hasta la versión publicada (`current`, por defecto
+    get_batches_version()): todas están cerradas y son contiguas, así que una
+    escritura en curso nunca se salta.
+    """
+    if current is None:
+        current = get_batches_version() or 0
+    reset_result = {
+        "since": since, "version": current, "reset": True,
+        "upserted": [], "deleted": [], "has_more": False
+    }
+
+    if since > current:
+        # Versión del cliente desconocida (p.ej. contador reiniciado)
+        return reset_result
+
+    # ¿El historial retenido todavía cubre `since`?
+    oldest = batch_changes_col.find_one({}, {"seq": 1}, sort=[("seq", 1)])
+    if since < current and (oldest is None or oldest["seq"] > since + 1):
+        return reset_result
+
+    entries = list(batch_changes_col.find(
+        {"seq": {"$gt": since, "$lte": current}}, {"_id": 0}
+    ).sort("seq", 1).limit(limit))
+
+    version = since
+    upserted_ids = set()
+    deleted_ids = set()
+    for entry in entries:
+        if entry.get("reset"):
+            return reset_result
+        for batch_id in entry.get("deleted", []):
+            upserted_ids.discard(batch_id)
+            deleted_ids.add(batch_id)
+        for batch_id in entry.get("upserted", []):
+            deleted_ids.discard(batch_id)
+            upserted_ids.add(batch_id)
+        version = entry["seq"]
+
+    upserted = []
+    if upserted_ids:
+        upserted = list(batches_col.find({"id": {"$in": list(upserted_ids)}}, {"_id": 0}))
+        # Los que ya no existen fueron borrados después del horizonte
+        deleted_ids.update(upserted_ids - {b["id"] for b in upserted})
+
+    return {
+        "since": since,
+        "version": version,
+        "reset": False,
+        "upserted": upserted,
+        "deleted": sorted(deleted_ids),
+        "has_more": len(entries) == limit and version < current
+    }
+
+@app.route("/api/batches/changes", methods=["GET"])
+def get_batch_changes():
+    """Feed de deltas: ?since=<version> -> batches modificados e IDs eliminados desde esa versión.
+
+    El cliente aplica primero "deleted" y luego "upserted" (ambos idempotentes) y
+    usa "version" como siguiente `since`. Si "reset" es true el historial ya no
+    alcanza (o hubo una recarga masiva) y debe recargar el tablero completo.
+    """
+    global batches_col
+    if batches_col is None:
+        db_local = get_db(raise_on_fail=False)
+        if db_local is not None:
+            batches_col = db_local["batches"]
+        else:
+            return jsonify({"error": "No DB connection"}), 503
+    if batch_changes_col is None:
+        return jsonify({"success": False, "error": "batch_changes no disponible"}), 503
+
+    try:
+        try:
+            since = int(request.args.get("since", ""))
+        except ValueError:
+            return jsonify({"success": False, "error": "Parámetro 'since' inválido"}), 400
+        limit = min(max(1, int(request.args.get("limit", 500))), 1000)
+
+        return jsonify({"success": True, **collect_batch_changes(since, limit)})
+    except Exception as e:
+        print(f"❌ Error en get_batch_changes: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# ============================================
+# PUSH DE CAMBIOS (Server-Sent Events)
+# ============================================
+
+# Conexiones SSE simultáneas por worker: cada una ocupa un hilo de gunicorn,
+# así que se deja margen para las peticiones normales (ver gunicorn_config.py).
+SSE_MAX_STREAMS = int(os.environ.get("SSE_MAX_STREAMS", "5"))
+# Duración máxima de una conexión; EventSource reconecta solo con Last-Event-ID
+SSE_MAX_SECONDS = int(os.environ.get("SSE_MAX_SECONDS", "300"))
+SSE_HEARTBEAT_SECONDS = 15
+
+_sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+batch_change_notifier = BatchChangeNotifier(lambda: counters_col)
+
+@app.route("/api/stream/batches", methods=["GET"])
+def stream_batches():
+    """Stream SSE con los deltas de batches (mismo formato que /api/batches/changes).
+
+    ?since=<version> (o cabecera Last-Event-ID al reconectar). Si el worker ya
+    tiene SSE_MAX_STREAMS conexiones responde 503 y el cliente vuelve al polling.
+    """
+    if batches_col is None or batch_changes_col is None:
+        return jsonify({"success": False, "error": "No DB connection"}), 503
+
+    try:
+        since = int(request.headers.get("Last-Event-ID") or request.args.get("since", ""))
+    except ValueError:
+        since = get_batches_version() or 0
+
+    if not _sse_slots.acquire(blocking=False):
+        response = jsonify({"success": False, "error": "Demasiadas conexiones de stream, usar polling"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "30"
+        return response
+
+    batch_change_notifier.ensure_started()
+
+    def generate():
+        version = since
+        started = time.monotonic()
+        try:
+            yield "retry: 3000\n\n"
+            while time.monotonic() - started < SSE_MAX_SECONDS:
+                latest = batch_change_notifier.wait_for_change(version, SSE_HEARTBEAT_SECONDS)
+                if latest is None:
+                    # Heartbeat: mantiene viva la conexión y detecta clientes desconectados
+                    yield ": ping\n\n"
+                    continue
+
+                # Leer hasta la versión que avisó el notificador (la caché local de
+                # get_batches_version puede ir unos segundos atrás)
+                delta = collect_batch_changes(version, current=latest)
+                if delta["reset"] or delta["upserted"] or delta["deleted"]:
+                    payload = json.dumps(delta, default=str, ensure_ascii=False)
+                    yield f"id: {delta['version']}\nevent: batches\ndata: {payload}\n\n"
+                if delta["version"] == version and not delta["reset"]:
+                    # Nada legible todavía: esperar el siguiente aviso en lugar de sondear
+                    if batch_change_notifier.wait_for_change(latest, SSE_HEARTBEAT_SECONDS) is None:
+                        yield ": ping\n\n"
+                version = delta["version"]
+        finally:
+            _sse_slots.release()
+
+    response = Response(generate(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # evitar buffering en proxies (nginx/ngrok)
+    return response
+
+# ============================================
+# TRABAJOS EN SEGUNDO PLANO (colección jobs)
+# ============================================
+
+# Archivos subidos que esperan su trabajo: compartido por los workers del host
+# (con varios hosts, apuntar a un volumen común)
+JOBS_SPOOL_DIR = os.environ.get("JOBS_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "segmentacion_jobs"))
+JOB_DATE_FIELDS = ("created_at", "started_at", "heartbeat_at", "finished_at")
+
+# Un trabajo que falla a mitad de una escritura cierra su secuencia como reset
+job_runner = JobRunner(lambda: jobs_col, after_job=close_open_batch_changes)
+
+def serialize_job(job):
+    """Documento de un trabajo listo para JSON (sin el checkpoint interno)"""
+    job = {key: value for key, value in job.items() if key != "checkpoint"}
+    job["job_id"] = job.pop("_id")
+    for key in JOB_DATE_FIELDS:
+        if isinstance(job.get(key), datetime):
+            job[key] = job[key].strftime("%Y-%m-%d %H:%M:%S")
+    return job
+
+def submit_job(kind, params=None, message=None):
+    """Encolar un trabajo y responder 202 con su id (el cliente consulta GET /api/jobs/<id>)"""
+    job = job_runner.submit(kind, params)
+    print(f"📋 Trabajo {job['_id']} ({kind}) en cola")
+    response = jsonify({
+        "success": True,
+        "job_id": job["_id"],
+        "job": serialize_job(job),
+        "message": message or "Trabajo en cola"
+    })
+    response.status_code = 202
+    response.headers["Location"] = f"/api/jobs/{job['_id']}"
+    return response
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Estado, progreso y resultado de un trabajo en segundo plano"""
+    if jobs_col is None:
+        return jsonify({"success": False, "error": "No DB connection"}), 503
+
+    job = job_runner.get(job_id)
+    if not job:
+        return jsonify({"success": False, "error": "Trabajo no encontrado"}), 404
+    return jsonify({"success": True, "job": serialize_job(job)})
+
+@app.route("/api/jobs/<job_id>/download", methods=["GET"])
+def download_job_file(job_id):
+    """Descargar el archivo generado por un trabajo terminado (respaldo completo o de borrado)"""
+    if jobs_col is None:
+        return jsonify({"success": False, "error": "No DB connection"}), 503
+
+    job = job_runner.get(job_id)
+    if not job:
+        return jsonify({"success": False, "error": "Trabajo no encontrado"}), 404
+    if job.get("status") != "done":
+        return jsonify({"success": False, "error": "El trabajo no ha terminado"}), 409
+
+    path = (job.get("result") or {}).get("backup_file")
+    if not path or not os.path.exists(path):
+        return jsonify({"success": False, "error": "El trabajo no generó un archivo disponible"}), 404
+    return send_file(path, as_attachment=True, download_name=os.path.basename(path))
+
+# ============================================
+# ASIGNACIÓN ATÓMICA DE IDS (colección counters)
+# ============================================
+
+# Series de IDs generados automáticamente: patrón para sembrar desde los datos
+# existentes y formato del nuevo ID.
+BATCH_ID_SERIES = {
+    "numeric": {"pattern": re.compile(r"^batch_(\d+)$"), "format": "batch_{n}"},          # batch_123
+    "T": {"pattern": re.compile(r"^batch_T(\d+)$"), "format": "batch_T{n:06d}"},         # batch_T000123
+    "F": {"pattern": re.compile(r"^batch_(\d+)F$"), "format": "batch_{n:06d}F"},         # batch_000040F
+}
+
+# Series ya sembradas por este worker (evita consultar el flag en cada creación)
+_seeded_series = set()
+
+def seed_batch_id_counter(series):
+    """Sembrar el contador de una serie con el máximo número existente.
+
+    Usa $max, así que es idempotente y seguro si varios workers siembran a la vez.
+    """
+    pattern = BATCH_ID_SERIES[series]["pattern"]
+    prefix = "batch_T" if series == "T" else "batch_"
+    max_num = 0
+    # Prefijo anclado: recorre solo el rango del índice único de "id"
+    for batch in batches_col.find({"id": {"$regex": f"^{prefix}"}}, {"id": 1, "_id": 0}):
+        match = pattern.match(batch["id"])
+        if match:
+            max_num = max(max_num, int(match.group(1)))
+    counters_col.update_one(
+        {"_id": f"batch_id:{series}"},
+        {"$max": {"seq": max_num}, "$set": {"seeded": True}},
+        upsert=True
+    )
+    _seeded_series.add(series)
+    return max_num
+
+def allocate_batch_id(series="numeric"):
+    """Reservar el siguiente ID de la serie con find_one_and_update($inc) (O(1), sin carreras)"""
+    counter_id = f"batch_id:{series}"
+    if series not in _seeded_series:
+        if counters_col.find_one({"_id": counter_id, "seeded": True}, {"_id": 1}) is None:
+            seed_batch_id_counter(series)
+        _seeded_series.add(series)
+    doc = counters_col.find_one_and_update(
+        {"_id": counter_id},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return BATCH_ID_SERIES[series]["format"].format(n=doc["seq"])
+
 @app.route("/api/batches", methods=["POST"])
 def create_batch():
     try:
         data = request.json
         print(f"📝 Datos recibidos para crear batch: {data}")
         
-        # Generar nuevo ID si no se proporciona
-        if "id" not in data or not data["id"]:
-            existing_batches = list(batches_col.find({}, {"id": 1}))
-            existing_ids = [int(b["id"].replace("batch_", "")) for b in existing_batches if "batch_" in b["id"]]
-            new_id = max(existing_ids) + 1 if existing_ids else 1
-            batch_id = f"batch_{new_id}"
+        # Generar nuevo ID si no se proporciona (contador atómico por serie)
+        auto_id = "id" not in data or not data["id"]
+        series = data.get("series", "numeric")
+        if auto_id:
+            if series not in BATCH_ID_SERIES:
+                return jsonify({
+                    "success": False,
+                    "error": f"Serie inválida '{series}'. Usa: {', '.join(BATCH_ID_SERIES)}"
+                }), 400
+            batch_id = allocate_batch_id(series)
         else:
             batch_id = data["id"]
         
@@ -249,7 +1113,25 @@ def create_batch():
         
         print(f"✅ Batch creado: {batch}")
 
-        batches_col.insert_one(batch)
+        seq = bump_batches_version()
+        batch.update(batch_change_stamp(seq), **REV_INCREMENT)
+        # Si el ID asignado ya existe (creado a mano con ese número), re-sembrar y reintentar
+        for attempt in range(5):
+            try:
+                batches_col.insert_one(batch)
+                break
+            except DuplicateKeyError:
+                if not auto_id or attempt == 4:
+                    record_batch_change(seq)
+                    raise
+                seed_batch_id_counter(series)
+                batch_id = allocate_batch_id(series)
+                batch.pop("_id", None)
+                batch["id"] = batch_id
+                if "folder" not in data:
+                    batch["folder"] = f"{DATA_DIRECTORY}/{batch_id}"
+        record_batch_change(seq, upserted=[batch_id])
+        update_batch_counters(added=[batch])
 
         # Remover el ObjectId para la respuesta JSON
         batch_response = batch.copy()
@@ -269,17 +1151,92 @@ def create_batch():
             "error": str(e)
         }), 500
 
-@app.route("/api/batches/<batch_id>", methods=["PUT"])
-def update_batch(batch_id):
-    data = request.json
-
+# Campos de un batch de los que dependen batch_counters y daily_progress
+COUNTER_STATE_FIELDS = {"assignee", "status", "metadata.assigned_at"}
+COUNTER_STATE_PROJECTION = {"id": 1, "assignee": 1, "status": 1, "metadata.assigned_at": 1, "_id": 0}
+
+def counter_state_filter(state):
+    """Condición de filtro para "el batch sigue con este assignee/status/assigned_at" (None = ausente)"""
+    return {
+        "assignee": state.get("assignee"),
+        "status": state.get("status"),
+        "metadata.assigned_at": (state.get("metadata") or {}).get("assigned_at"),
+    }
+
+def counter_state(batch):
+    """Estado de un batch completo con solo los campos de COUNTER_STATE_PROJECTION"""
+    return {
+        "id": batch.get("id"),
+        "assignee": batch.get("assignee"),
+        "status": batch.get("status"),
+        "metadata": {"assigned_at": (batch.get("metadata") or {}).get("assigned_at")}
+    }
+
+def delete_read_batches(states, extra_filter=None):
+    """Borrar batches exigiendo el estado leído: un DeleteOne por batch en un solo bulk_write.
+
+    Un batch que cambió entre la lectura y el borrado no coincide y se borra
+    después con find_one_and_delete, que devuelve su estado real. Devuelve
+    (estados borrados, exacto); exacto=False si otra petición borró alguno
+    entretanto y ya no se sabe cuáles borró esta (hay que recalcular contadores).
+    """
+    if not states:
+        return [], True
+
+    def delete_filter(condition):
+        return {"$and": [extra_filter, condition]} if extra_filter else condition
+
+    result = batches_col.bulk_write(
+        [DeleteOne(delete_filter({"id": state["id"], **counter_state_filter(state)})) for state in states],
+        ordered=False
+    )
+    if result.deleted_count == len(states):
+        return list(states), True
+
+    # Solo si no coinciden todos se consulta cuáles siguen en la colección (caso raro)
+    ids = [state["id"] for state in states]
+    remaining = {b["id"] for b in batches_col.find({"id": {"$in": ids}}, {"id": 1, "_id": 0})}
+    deleted = [state for state in states if state["id"] not in remaining]
+    # Faltan más de los que borró el bulk_write: otra petición borró alguno
+    exact = len(deleted) == result.deleted_count
+    for batch_id in ids:
+        if batch_id in remaining:
+            before = batches_col.find_one_and_delete(
+                delete_filter({"id": batch_id}), projection=COUNTER_STATE_PROJECTION
+            )
+            if before is not None:
+                deleted.append(before)
+    return deleted, exact
+
+def apply_set_fields(doc, fields):
+    """Aplicar en memoria un dict de $set (con claves en notación de punto) sobre `doc`"""
+    for key, value in fields.items():
+        target = doc
+        parts = key.split(".")
+        for part in parts[:-1]:
+            if not isinstance(target.get(part), dict):
+                target[part] = {}
+            target = target[part]
+        target[parts[-1]] = value
+    return doc
+
+# Campos de metadata que se pueden escribir desde PUT y bulk (otras claves se rechazan)
+METADATA_FIELDS = ("assigned_at", "due_date", "priority", "reviewed_at", "review_status", "approved_at")
+
+def build_batch_update(data):
+    """Traducir el cuerpo de un PUT (o el `set` de una operación bulk) a un dict para $set.
+
+    Lanza ValueError si `data` o `metadata` no son objetos o traen un campo de
+    metadata desconocido.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Los cambios deben ser un objeto JSON")
     update_data = {}
 
     # Campos directos
     if "assignee" in data:
         # Permitir explícitamente None/null para desasignar
         update_data["assignee"] = data["assignee"] if data["assignee"] else None
-        print(f"🔄 Actualizando assignee de {batch_id} a: {update_data['assignee']}")
 
     if "status" in data:
         update_data["status"] = data["status"]
@@ -291,9 +1248,22 @@ def update_batch(batch_id):
     # Campos de metadata - nueva forma estructurada
     if "metadata" in data:
         metadata = data["metadata"]
+        if not isinstance(metadata, dict):
+            raise ValueError("'metadata' debe ser un objeto")
         for key, value in metadata.items():
             update_data[f"metadata.{key}"] = value
 
+    # Campos de metadata en notación de punto ("metadata.assigned_at")
+    for key, value in data.items():
+        if key.startswith("metadata."):
+            update_data[key] = value
+
+    unknown = sorted(key[len("metadata."):] for key in update_data
+                     if key.startswith("metadata.") and key[len("metadata."):] not in METADATA_FIELDS)
+    if unknown:
+        raise ValueError(f"Campos de metadata no permitidos: {', '.join(unknown)} "
+                         f"(permitidos: {', '.join(METADATA_FIELDS)})")
+
     # Campos individuales de metadata (retrocompatibilidad)
     if "due_date" in data:
         update_data["metadata.due_date"] = data["due_date"]
@@ -302,13 +1272,418 @@ def update_batch(batch_id):
     if "reviewed_at" in data:
         update_data["metadata.reviewed_at"] = data["reviewed_at"]
 
-    result = batches_col.update_one({"id": batch_id}, {"$set": update_data})
+    return update_data
 
-    if result.modified_count > 0 or batches_col.find_one({"id": batch_id}):
-        print(f"✅ Batch {batch_id} actualizado correctamente")
-        return jsonify({"success": True, "message": f"Batch {batch_id} actualizado"})
-    else:
-        return jsonify({"success": False, "error": "Batch no encontrado"}), 404
+@app.route("/api/batches/<batch_id>", methods=["PUT"])
+def update_batch(batch_id):
+    """Actualizar un batch. Con If-Match: "<rev>" (o "rev" en el cuerpo) solo se aplica
+    si nadie lo modificó desde esa revisión; si no, 409 con la versión actual."""
+    data = request.json or {}
+
+    try:
+        expected_rev = parse_expected_rev(data)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    try:
+        update_data = build_batch_update(data)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    if "assignee" in update_data:
+        print(f"🔄 Actualizando assignee de {batch_id} a: {update_data['assignee']}")
+
+    query = {"id": batch_id}
+    if expected_rev is not None:
+        query.update(rev_filter(expected_rev))
+
+    seq = bump_batches_version()
+    update_data.update(batch_change_stamp(seq))
+    # Una sola ida y vuelta: filtra por rev e incrementa. Se pide el documento ANTERIOR
+    # (para los contadores) y el actualizado se obtiene aplicando el mismo $set en memoria.
+    previous = batches_col.find_one_and_update(
+        query,
+        {"$set": update_data, "$inc": REV_INCREMENT},
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE
+    )
+    record_batch_change(seq, upserted=[batch_id] if previous else [])
+
+    batch = None
+    if previous:
+        batch = apply_set_fields(copy.deepcopy(previous), update_data)
+        batch["rev"] = previous.get("rev", 0) + 1
+        update_batch_counters(removed=[previous], added=[batch])
+
+    if batch:
+        print(f"✅ Batch {batch_id} actualizado correctamente (rev {batch['rev']})")
+        response = jsonify({"success": True, "message": f"Batch {batch_id} actualizado", "batch": batch, "rev": batch["rev"]})
+        response.headers["ETag"] = f'"{batch["rev"]}"'
+        return response
+
+    # Solo al fallar se distingue "no existe" de "lo cambió otra persona"
+    current = batches_col.find_one({"id": batch_id}, {"_id": 0}) if expected_rev is not None else None
+    if current:
+        current_rev = current.get("rev", 0)
+        print(f"⚠️ Conflicto en {batch_id}: rev esperada {expected_rev}, actual {current_rev}")
+        response = jsonify({
+            "success": False,
+            "error": f"El batch {batch_id} fue modificado por otra persona (rev {current_rev})",
+            "conflict": True,
+            "batch": current,
+            "rev": current_rev
+        })
+        response.headers["ETag"] = f'"{current_rev}"'
+        return response, 409
+    return jsonify({"success": False, "error": "Batch no encontrado"}), 404
+
+# Máximo de operaciones por petición bulk
+BULK_MAX_OPERATIONS = 5000
+
+def build_bulk_filter(criteria):
+    """Filtro permitido para PATCH /api/batches/bulk en modo filtro (solo campos indexados).
+
+    Lanza ValueError si 'ids' no es una lista.
+    """
+    query = {}
+    if not isinstance(criteria.get("ids") or [], list):
+        raise ValueError("'filter.ids' debe ser una lista")
+    if criteria.get("ids"):
+        query["id"] = {"$in": [str(batch_id) for batch_id in criteria["ids"]]}
+    elif criteria.get("id_prefix"):
+        query["id"] = {"$regex": f"^{re.escape(criteria['id_prefix'])}"}
+    if "assignee" in criteria:
+        if criteria["assignee"]:
+            query["assignee"] = criteria["assignee"]
+        else:
+            # null o "" = sin asignar, con el mismo criterio que los contadores
+            query.update(UNASSIGNED_FILTER)
+    if criteria.get("status"):
+        query["status"] = criteria["status"]
+    if criteria.get("assigned_at"):
+        query["metadata.assigned_at"] = criteria["assigned_at"]
+    return query
+
+@app.route("/api/batches/bulk", methods=["PATCH"])
+def bulk_update_batches():
+    """Actualizar muchos batches en un solo bulk_write (ordered=False).
+
+    Cuerpo:
+      {"operations": [{"id": "batch_T000001", "set": {"assignee": "Flor"}}, ...]}
+    o bien un filtro con un único $set:
+      {"filter": {"ids": [...]} | {"status": "NS", "assignee": null, ...}, "set": {...}}
+
+    `set` acepta los mismos campos que PUT /api/batches/<id>. Devuelve un
+    resultado por batch.
+    """
+    global batches_col
+
+    if batches_col is None:
+        return jsonify({"success": False, "error": "No DB connection"}), 503
+
+    try:
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({"success": False, "error": "El cuerpo debe ser un objeto JSON"}), 400
+        results = []
+        previous_states = None  # id -> assignee/status/fecha antes del cambio (contadores y rollup)
+
+        if "operations" in data:
+            operations = data["operations"]
+            if not isinstance(operations, list) or not operations:
+                return jsonify({"success": False, "error": "'operations' debe ser una lista no vacía"}), 400
+            if len(operations) > BULK_MAX_OPERATIONS:
+                return jsonify({"success": False, "error": f"Máximo {BULK_MAX_OPERATIONS} operaciones por petición"}), 400
+
+            # Validar cada operación; las inválidas se reportan sin enviarse a Mongo
+            valid = []
+            for op in operations:
+                batch_id = op.get("id") if isinstance(op, dict) else None
+                try:
+                    update_data = build_batch_update(op.get("set") or {}) if batch_id else {}
+                except ValueError as e:
+                    results.append({"id": batch_id, "success": False, "error": f"Operación inválida: {e}"})
+                    continue
+                if not batch_id or not update_data:
+                    results.append({"id": batch_id, "success": False, "error": "Operación inválida: requiere 'id' y 'set'"})
+                else:
+                    valid.append((batch_id, update_data))
+        elif "filter" in data and "set" in data:
+            if not isinstance(data["filter"] or {}, dict):
+                return jsonify({"success": False, "error": "'filter' debe ser un objeto"}), 400
+            try:
+                query = build_bulk_filter(data["filter"] or {})
+            except ValueError as e:
+                return jsonify({"success": False, "error": str(e)}), 400
+            if not query:
+                return jsonify({"success": False, "error": "Filtro vacío: usa 'ids', 'id_prefix', 'assignee', 'status' o 'assigned_at'"}), 400
+            try:
+                update_data = build_batch_update(data["set"] or {})
+            except ValueError as e:
+                return jsonify({"success": False, "error": str(e)}), 400
+            if not update_data:
+                return jsonify({"success": False, "error": "'set' no contiene campos válidos"}), 400
+            previous_states = {
+                b["id"]: b for b in batches_col.find(query, COUNTER_STATE_PROJECTION)
+            }
+            matched_ids = list(previous_states)
+            if len(matched_ids) > BULK_MAX_OPERATIONS:
+                return jsonify({"success": False, "error": f"El filtro afecta {len(matched_ids)} batches (máximo {BULK_MAX_OPERATIONS})"}), 400
+            valid = [(batch_id, update_data) for batch_id in matched_ids]
+        else:
+            return jsonify({"success": False, "error": "Se requiere 'operations' o 'filter' + 'set'"}), 400
+
+        if not valid:
+            return jsonify({"success": not results, "matched": 0, "modified": 0, "results": results})
+
+        # Estado anterior solo si el cambio afecta a los contadores o al rollup diario
+        touches_counters = any(COUNTER_STATE_FIELDS.intersection(update_data) for _, update_data in valid)
+        if touches_counters and previous_states is None:
+            valid_ids = list({batch_id for batch_id, _ in valid})
+            previous_states = {
+                b["id"]: b for b in batches_col.find({"id": {"$in": valid_ids}}, COUNTER_STATE_PROJECTION)
+            }
+
+        # Un solo $set por batch: el mismo id puede repetirse en operations (gana el último valor)
+        merged = {}
+        for batch_id, update_data in valid:
+            merged.setdefault(batch_id, {}).update(update_data)
+
+        outcome = {}  # id -> None si se actualizó, o el mensaje de error
+        if touches_counters:
+            # Los que no existían al leer el estado anterior no se envían
+            for batch_id in merged:
+                if batch_id not in previous_states:
+                    outcome[batch_id] = "Batch no encontrado"
+        ids = [batch_id for batch_id in merged if batch_id not in outcome]
+
+        seq = bump_batches_version()
+        stamp = batch_change_stamp(seq)
+
+        def update_for(batch_id):
+            return {"$set": {**merged[batch_id], **stamp}, "$inc": REV_INCREMENT}
+
+        # Si el cambio toca contadores, cada filtro exige el estado leído: si otra petición
+        # cambió el batch entretanto, su UpdateOne no coincide y se reintenta abajo.
+        requests_ = [
+            UpdateOne({"id": batch_id, **(counter_state_filter(previous_states[batch_id]) if touches_counters else {})},
+                      update_for(batch_id))
+            for batch_id in ids
+        ]
+
+        matched = modified = 0
+        # Sin número de secuencia no se puede saber qué UpdateOne coincidió: todo va al reintento
+        if requests_ and not (touches_counters and seq is None):
+            try:
+                bulk_result = batches_col.bulk_write(requests_, ordered=False)
+                matched = bulk_result.matched_count
+                modified = bulk_result.modified_count
+            except BulkWriteError as bwe:
+                matched = bwe.details.get("nMatched", 0)
+                modified = bwe.details.get("nModified", 0)
+                for error in bwe.details.get("writeErrors", []):
+                    outcome[ids[error["index"]]] = error.get("errmsg", "Error de escritura")
+
+        counters_removed, counters_added = [], []
+        pending = [batch_id for batch_id in ids if batch_id not in outcome]
+
+        # Solo si no coinciden todos se consulta cuáles faltan (caso raro)
+        if matched < len(pending):
+            current = {b["id"]: b for b in batches_col.find({"id": {"$in": pending}}, {"id": 1, "seq": 1, "_id": 0})}
+            for batch_id in pending:
+                if batch_id not in current:
+                    outcome[batch_id] = "Batch no encontrado"
+                elif touches_counters and (seq is None or current[batch_id].get("seq") != seq):
+                    # Cambió entre la lectura y el bulk: se aplica igual, contando desde el estado real
+                    before = batches_col.find_one_and_update(
+                        {"id": batch_id},
+                        update_for(batch_id),
+                        projection=COUNTER_STATE_PROJECTION,
+                        return_document=ReturnDocument.BEFORE
+                    )
+                    if before is None:
+                        outcome[batch_id] = "Batch no encontrado"
+                        continue
+                    previous_states[batch_id] = before
+                    matched += 1
+                    modified += 1
+
+        updated_ids = []
+        for batch_id in ids:
+            if batch_id in outcome:
+                continue
+            outcome[batch_id] = None
+            updated_ids.append(batch_id)
+            if touches_counters:
+                before = previous_states[batch_id]
+                after = apply_set_fields(copy.deepcopy(before), {
+                    key: value for key, value in merged[batch_id].items() if key in COUNTER_STATE_FIELDS
+                })
+                counters_removed.append(before)
+                counters_added.append(after)
+
+        for batch_id, _ in valid:
+            if outcome[batch_id] is None:
+                results.append({"id": batch_id, "success": True})
+            else:
+                results.append({"id": batch_id, "success": False, "error": outcome[batch_id]})
+
+        record_batch_change(seq, upserted=updated_ids)
+        update_batch_counters(counters_removed, counters_added)
+
+        succeeded = sum(1 for result in results if result["success"])
+        print(f"✅ Bulk update: {succeeded}/{len(results)} operaciones aplicadas en 1 bulk_write")
+
+        return jsonify({
+            "success": succeeded == len(results),
+            "matched": matched,
+            "modified": modified,
+            "updated_count": succeeded,
+            "failed_count": len(results) - succeeded,
+            "results": results
+        })
+
+    except Exception as e:
+        print(f"❌ Error en bulk_update_batches: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+_BATCH_RANGE_PART = re.compile(r"^(.*?)(\d+)(\D*)$")
+
+def expand_batch_range(start_id, end_id, max_items=BULK_MAX_OPERATIONS):
+    """Expandir un rango de IDs: batch_T000002..batch_T000032 o batch_000051F..batch_000112F.
+
+    Ambos extremos deben compartir prefijo y sufijo; se conserva el relleno con ceros.
+    Lanza ValueError si el rango no es válido o excede max_items.
+    """
+    start_match = _BATCH_RANGE_PART.match(start_id.strip())
+    end_match = _BATCH_RANGE_PART.match(end_id.strip())
+    if not start_match or not end_match:
+        raise ValueError(f"Rango inválido: {start_id}..{end_id}")
+
+    prefix, start_num, suffix = start_match.groups()
+    end_prefix, end_num, end_suffix = end_match.groups()
+    if (prefix, suffix) != (end_prefix, end_suffix):
+        raise ValueError(f"Rango inválido (prefijo/sufijo distintos): {start_id}..{end_id}")
+
+    first, last = int(start_num), int(end_num)
+    if last < first:
+        raise ValueError(f"Rango inválido (fin menor que inicio): {start_id}..{end_id}")
+    if last - first + 1 > max_items:
+        raise ValueError(f"Rango demasiado grande ({last - first + 1} IDs, máximo {max_items})")
+
+    width = len(start_num)
+    return [f"{prefix}{num:0{width}d}{suffix}" for num in range(first, last + 1)]
+
+def parse_batch_id_list(items, max_items=BULK_MAX_OPERATIONS):
+    """Normalizar una lista de IDs y rangos ("a..b" o {"from": a, "to": b}) sin duplicados"""
+    batch_ids = []
+    seen = set()
+    for item in items:
+        if isinstance(item, dict):
+            expanded = expand_batch_range(str(item.get("from", "")), str(item.get("to", "")), max_items)
+        elif isinstance(item, str) and ".." in item:
+            start_id, end_id = item.split("..", 1)
+            expanded = expand_batch_range(start_id, end_id, max_items)
+        else:
+            expanded = [str(item).strip()]
+        for batch_id in expanded:
+            if batch_id and batch_id not in seen:
+                seen.add(batch_id)
+                batch_ids.append(batch_id)
+        if len(batch_ids) > max_items:
+            raise ValueError(f"Demasiados IDs (máximo {max_items})")
+    return batch_ids
+
+def write_batches_backup(batches, prefix):
+    """Escribir un respaldo comprimido {"batches": [...]} en el directorio temporal.
+
+    `batches` puede ser un cursor: se escribe documento por documento, sin
+    acumular la lista en memoria. El nombre lleva un sufijo único (mkstemp): dos
+    respaldos en el mismo segundo no se pisan. Devuelve (ruta, número de batches).
+    """
+    backup_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    fd, backup_file = tempfile.mkstemp(prefix=f"{prefix}_{backup_timestamp}_", suffix=".json.gz")
+    os.close(fd)
+    count = 0
+    with gzip.open(backup_file, "wt", encoding="utf-8") as f:
+        f.write('{"batches": [')
+        for batch in batches:
+            if count:
+                f.write(",")
+            f.write("\n")
+            f.write(json.dumps(batch, default=str, ensure_ascii=False))
+            count += 1
+        f.write("\n]}\n")
+    return backup_file, count
+
+@app.route("/api/batches/bulk-delete", methods=["POST"])
+def bulk_delete_batches():
+    """Eliminar una lista de batches (IDs o rangos) con un solo respaldo y un delete_many.
+
+    Cuerpo: {"ids": ["batch_T000002..batch_T000032", "batch_000051F", ...],
+             "ranges": [{"from": "batch_000051F", "to": "batch_000112F"}]}
+    """
+    global batches_col
+
+    if batches_col is None:
+        return jsonify({"success": False, "error": "No DB connection"}), 503
+
+    try:
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({"success": False, "error": "El cuerpo debe ser un objeto JSON"}), 400
+        for key in ("ids", "ranges"):
+            if not isinstance(data.get(key, []), list):
+                return jsonify({"success": False, "error": f"'{key}' debe ser una lista"}), 400
+        try:
+            batch_ids = parse_batch_id_list(data.get("ids", []) + data.get("ranges", []))
+        except ValueError as range_error:
+            return jsonify({"success": False, "error": str(range_error)}), 400
+
+        if not batch_ids:
+            return jsonify({"success": False, "error": "No se enviaron IDs"}), 400
+
+        # 1 consulta $in: respaldo comprimido de los documentos afectados
+        query = {"id": {"$in": batch_ids}}
+        found_states = []
+
+        def snapshot():
+            for batch in batches_col.find(query, {"_id": 0}):
+                found_states.append(counter_state(batch))
+                yield batch
+
+        backup_file, backed_up = write_batches_backup(snapshot(), "deleted_batches")
+        print(f"💾 Backup de {backed_up} batches a eliminar guardado en: {backup_file}")
+
+        # 1 bulk_write solo sobre los respaldados; los contadores salen de lo realmente borrado
+        seq = bump_batches_version()
+        deleted_states, exact = delete_read_batches(found_states)
+        found_ids = [state["id"] for state in deleted_states]
+        deleted_count = len(found_ids)
+        if exact:
+            record_batch_change(seq, deleted=found_ids)
+            update_batch_counters(removed=deleted_states)
+        else:
+            record_batch_change(seq, reset=True)
+            refresh_batch_counters()
+
+        found = set(found_ids)
+        missing = [batch_id for batch_id in batch_ids if batch_id not in found]
+
+        print(f"🗑️ Bulk delete: {deleted_count} eliminados, {len(missing)} no encontrados")
+
+        return jsonify({
+            "success": True,
+            "message": f"{deleted_count} batches eliminados exitosamente",
+            "requested_count": len(batch_ids),
+            "deleted_count": deleted_count,
+            "deleted": found_ids,
+            "missing": missing,
+            "backup_file": backup_file
+        })
+
+    except Exception as e:
+        print(f"❌ Error en bulk_delete_batches: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route("/api/batches/<batch_id>/change-id", methods=["PUT"])
 def change_batch_id(batch_id):
@@ -325,10 +1700,15 @@ def change_batch_id(batch_id):
         return jsonify({"success": False, "error": f"El ID '{new_id}' ya existe"}), 400
     
     # Actualizar el ID
+    seq = bump_batches_version()
     result = batches_col.update_one(
         {"id": batch_id}, 
-        {"$set": {"id": new_id}}
+        {"$set": {"id": new_id, **batch_change_stamp(seq)}, "$inc": REV_INCREMENT}
     )
+    if result.modified_count > 0:
+        record_batch_change(seq, upserted=[new_id], deleted=[batch_id])
+    else:
+        record_batch_change(seq)
     
     if result.modified_count > 0:
         return jsonify({"success": True, "message": f"ID actualizado de {batch_id} a {new_id}"})
@@ -340,34 +1720,28 @@ def delete_batch(batch_id):
     try:
         print(f"🗑️ Eliminando batch: {batch_id}")
         
-        # Verificar que el batch existe antes de eliminarlo
-        existing_batch = batches_col.find_one({"id": batch_id})
+        # Borrar y obtener el documento borrado en una sola operación: los contadores
+        # se descuentan con el estado que tenía al borrarse, no con una lectura previa
+        seq = bump_batches_version()
+        existing_batch = batches_col.find_one_and_delete({"id": batch_id}, projection={"_id": 0})
+        record_batch_change(seq, deleted=[batch_id] if existing_batch else [])
         if not existing_batch:
             return jsonify({
                 "success": False, 
                 "error": f"Batch '{batch_id}' no encontrado"
             }), 404
-        
-        # Eliminar el batch
-        result = batches_col.delete_one({"id": batch_id})
-        
-        if result.deleted_count > 0:
-            print(f"✅ Batch {batch_id} eliminado exitosamente")
-            return jsonify({
-                "success": True, 
-                "message": f"Batch {batch_id} eliminado exitosamente",
-                "deleted_batch": {
-                    "id": batch_id,
-                    "assignee": existing_batch.get("assignee", ""),
-                    "status": existing_batch.get("status", "")
-                }
-            })
-        else:
-            print(f"❌ Error eliminando batch {batch_id}")
-            return jsonify({
-                "success": False, 
-                "error": "Error al eliminar el batch"
-            }), 500
+
+        update_batch_counters(removed=[existing_batch])
+        print(f"✅ Batch {batch_id} eliminado exitosamente")
+        return jsonify({
+            "success": True, 
+            "message": f"Batch {batch_id} eliminado exitosamente",
+            "deleted_batch": {
+                "id": batch_id,
+                "assignee": existing_batch.get("assignee", ""),
+                "status": existing_batch.get("status", "")
+            }
+        })
             
     except Exception as e:
         print(f"❌ Error en delete_batch: {e}")
@@ -669,22 +2043,13 @@ def check_mongo_files():
                 print(f"⚠️ Error procesando archivo {file.get('_id', 'unknown')}: {file_error}")
                 continue
         
-        # Contar archivos por patrón de batch
+        # Contar archivos por batch (extractor común: numérico, T, F y timestamp)
         batch_patterns = {}
         try:
-            import re
-            for file in files:
-                filename = file.get("filename", "")
-                if not filename:
-                    continue
-                    
-                # Buscar patrones como batch_XX, Batch_XX, masks_batch_XX
-                batch_matches = re.findall(r'[Bb]atch[_\-]?(\d+)', filename)
-                for match in batch_matches:
-                    batch_key = f"batch_{match}"
-                    if batch_key not in batch_patterns:
-                        batch_patterns[batch_key] = []
-                    batch_patterns[batch_key].append(filename)
+            filenames = [file.get("filename", "") for file in files]
+            for filename, batch_key in zip(filenames, extract_batch_ids(filenames)):
+                if batch_key:
+                    batch_patterns.setdefault(batch_key, []).append(filename)
         except Exception as pattern_error:
             print(f"⚠️ Error procesando patrones: {pattern_error}")
             batch_patterns = {}
@@ -713,22 +2078,19 @@ def check_mongo_files():
 
 @app.route("/api/batch-files/<batch_id>", methods=["GET"])
 def get_batch_files(batch_id):
-    """Obtener información de archivos subidos para un batch específico"""
-    global training_masks_col
+    """Obtener información de archivos subidos para un batch específico.
 
-    try:
-        # Verificar que training_masks_col esté disponible
-        if training_masks_col is None:
-            return jsonify({
-                "success": False,
-                "error": "QUALITY_IEMSA.training_metrics.masks.files no disponible"
-            }), 503
+    Solo lectura sobre mask_index: el indexado lo hace el planificador de
+    sincronización (con lease), así que un archivo recién subido aparece en la
+    siguiente corrida (o al pedir una con POST /api/sync-batch-files).
+    """
+    if batches_col is None:
+        return jsonify({"success": False, "error": "No DB connection"}), 503
 
-        # Buscar archivos que coincidan con el patrón batch_XX
-        pattern = f"masks_batch_{batch_id.replace('batch_', '')}"
-        files = list(training_masks_col.find(
-            {"filename": {"$regex": pattern}},
-            {"filename": 1, "uploadDate": 1, "metadata": 1, "length": 1}
+    try:
+        files = list(batches_col.database[MASK_INDEX_COLLECTION].find(
+            {"batch_id": batch_id},
+            {"filename": 1, "uploadDate": 1, "uploaded_by": 1, "length": 1, "_id": 0}
         ).sort("uploadDate", -1))
         
         # Procesar información
@@ -744,7 +2106,7 @@ def get_batch_files(batch_id):
         if files:
             latest = files[0]
             file_info["latest_upload"] = latest["uploadDate"]
-            file_info["uploaded_by"] = latest.get("metadata", {}).get("uploaded_by", "unknown")
+            file_info["uploaded_by"] = latest.get("uploaded_by", "unknown")
             file_info["file_size"] = latest.get("length", 0)
             
             # Lista de todas las subidas
@@ -752,7 +2114,7 @@ def get_batch_files(batch_id):
                 file_info["all_uploads"].append({
                     "filename": file["filename"],
                     "uploadDate": file["uploadDate"],
-                    "uploaded_by": file.get("metadata", {}).get("uploaded_by", "unknown"),
+                    "uploaded_by": file.get("uploaded_by", "unknown"),
                     "size": file.get("length", 0)
                 })
         
@@ -761,239 +2123,226 @@ def get_batch_files(batch_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/api/sync-batch-files", methods=["POST"])
-def sync_batch_files():
-    """Sincronizar batches con archivos (OPTIMIZADO: 1 query en lugar de 4500+)"""
-    global training_masks_col
-
-    try:
-        print("🔄 Iniciando sincronización OPTIMIZADA de archivos con batches...")
+def run_mask_sync(full=False):
+    """Sincronizar batches con archivos vía mask_index (indexado incremental + join por batch_id).
 
-        # Verificar que training_masks_col esté disponible
-        if training_masks_col is None:
-            return jsonify({
-                "success": False,
-                "error": "QUALITY_IEMSA.training_metrics.masks.files no disponible"
-            }), 503
+    La ejecuta el planificador en segundo plano; devuelve el resumen que queda
+    guardado como last_result.
+    """
+    global training_masks_col
 
-        # OPTIMIZACIÓN 1: Solo traer campos necesarios de batches
-        batches = list(batches_col.find({}, {"id": 1, "mongo_uploaded": 1, "_id": 0}))
+    print("🔄 Iniciando sincronización de archivos con batches...")
 
-        # OPTIMIZACIÓN 2: Extraer todos los identificadores de batch de una vez
-        import re
-        batch_numbers = {}
-        for batch in batches:
-            batch_id = batch["id"]
-            # Extraer el identificador completo después de "batch_"
-            # Ejemplos: batch_20250909T0034 -> 20250909T0034
-            #           batch_123 -> 123
-            match = re.search(r'batch_(.+)', batch_id, re.IGNORECASE)
-            if match:
-                batch_numbers[batch_id] = match.group(1)
-            else:
-                # Fallback: extraer solo números si no sigue el patrón batch_XXX
-                match_num = re.search(r'(\d+)', batch_id)
-                if match_num:
-                    batch_numbers[batch_id] = match_num.group(1)
-
-        # OPTIMIZACIÓN 3: UNA SOLA QUERY para TODOS los archivos
-        # Construir un regex que busque TODOS los números de batch
-        all_numbers = list(batch_numbers.values())
-        if not all_numbers:
-            return jsonify({
-                "success": True,
-                "batches_updated": 0,
-                "total_batches": 0,
-                "message": "No hay batches para sincronizar"
-            })
+    # Reconectar a demanda: el hilo del planificador puede correr antes que init_db termine
+    if training_masks_col is None:
+        from db import get_training_db
+        training_db_local = get_training_db()
+        if training_db_local is None:
+            raise RuntimeError("QUALITY_IEMSA.training_metrics.masks.files no disponible")
+        training_masks_col = training_db_local["training_metrics.masks.files"]
+
+    # PASO 1: Indexar solo los archivos nuevos desde la marca de agua (full=True reindexa todo)
+    index_stats = index_masks(training_masks_col, batches_col.database, full=full)
+    print(f"🗂️ mask_index: {index_stats['scanned']} archivos leídos, {index_stats['indexed']} nuevos")
+
+    # PASO 2: Join por batch_id (índice de mask_index) en lugar de regex sobre masks.files
+    total_batches = 0
+    total_files = 0
+    sync_results = []
+    changes = []  # (batch_id, campos a actualizar)
+
+    for batch in batch_file_summary(batches_col):
+        batch_id = batch["id"]
+        current_mongo_status = batch.get("mongo_uploaded", False)
+        file_count = batch["file_count"]
+        has_files = file_count > 0
+        total_batches += 1
+        total_files += file_count
+
+        # Solo actualizar si hay cambios
+        if current_mongo_status != has_files:
+            changes.append((batch_id, {
+                "mongo_uploaded": has_files,
+                "file_info": {
+                    "file_count": file_count,
+                    "last_file_upload": batch.get("last_file_upload"),
+                    "has_files": has_files
+                }
+            }))
+            if len(sync_results) < 50:  # Limitar el resumen guardado
+                sync_results.append({
+                    "batch_id": batch_id,
+                    "files_found": file_count,
+                    "mongo_uploaded": has_files,
+                    "updated": True
+                })
 
-        # Crear regex que busque cualquier identificador de batch
-        # Escapar caracteres especiales en los identificadores
-        escaped_numbers = [re.escape(num) for num in all_numbers]
-        numbers_pattern = "|".join(escaped_numbers)
-        # Buscar patrones: masks_batch_XXXX, batch_XXXX, Batch_XXXX, masks_XXXX
-        mega_pattern = f"(masks_)?(batch_|Batch_)?({numbers_pattern})"
+    # Ejecutar todas las actualizaciones de una vez (bulk write). Sin cambios no se
+    # toca la versión: una corrida vacía no invalida ETags ni caché de métricas.
+    updated_ids = [batch_id for batch_id, _ in changes]
+    if changes:
+        seq = bump_batches_version()
+        stamp = batch_change_stamp(seq)
+        batches_col.bulk_write([
+            UpdateOne({"id": batch_id}, {"$set": {**fields, **stamp}, "$inc": REV_INCREMENT})
+            for batch_id, fields in changes
+        ], ordered=False)
+        record_batch_change(seq, upserted=updated_ids)
+
+    print(f"🔄 Sincronización completa: {len(updated_ids)} batches actualizados")
+
+    return {
+        "batches_updated": len(updated_ids),
+        "total_batches": total_batches,
+        "total_files_found": total_files,
+        "index": index_stats,
+        "results": sync_results
+    }
+
+# Sincronización de máscaras en segundo plano: cada N minutos, un solo worker a la vez
+MASK_SYNC_INTERVAL_MINUTES = float(os.environ.get("MASK_SYNC_INTERVAL_MINUTES", "15"))  # 0 = solo a pedido
+def run_scheduled_mask_sync(full=False):
+    try:
+        return run_mask_sync(full)
+    finally:
+        close_open_batch_changes()
 
-        print(f"📊 Buscando archivos para {len(all_numbers)} batches con 1 query...")
-        print(f"🔍 Patrón de búsqueda: {mega_pattern[:100]}...")
+mask_sync_scheduler = MaskSyncScheduler(
+    run_scheduled_mask_sync,
+    lambda: db[SCHEDULER_COLLECTION] if db is not None else None,
+    interval=int(MASK_SYNC_INTERVAL_MINUTES * 60)
+)
 
-        # UNA SOLA CONSULTA para todos los archivos desde training_metrics.masks.files
-        all_files = list(training_masks_col.find(
-            {"filename": {"$regex": mega_pattern, "$options": "i"}},
-            {"filename": 1, "uploadDate": 1, "_id": 0}  # Solo campos necesarios
-        ).sort("uploadDate", -1))
+@app.route("/api/sync-batch-files", methods=["GET", "POST"])
+def sync_batch_files():
+    """Estado de la sincronización de máscaras (GET) o pedir una corrida (POST, ?full=true reindexa todo).
 
-        print(f"✅ Encontrados {len(all_files)} archivos en total")
+    No espera a que termine: la corrida la toma el planificador en segundo plano.
+    """
+    if db is None:
+        return jsonify({"success": False, "error": "No DB connection"}), 503
 
-        # OPTIMIZACIÓN 4: Mapear archivos a batches en memoria (rápido)
-        batch_file_map = {}
-        for batch_id, batch_identifier in batch_numbers.items():
-            batch_file_map[batch_id] = []
+    try:
+        if request.method == "GET":
+            return jsonify({"success": True, "sync": mask_sync_scheduler.status()})
 
-            # Buscar archivos que contengan el identificador del batch
-            # Verificar coincidencia exacta del identificador
-            for file in all_files:
-                filename = file.get("filename", "")
-                # Buscar el identificador completo en el nombre del archivo
-                # Ejemplo: batch_20250909T0034 debe coincidir con masks_batch_20250909T0034
-                if batch_identifier in filename:
-                    batch_file_map[batch_id].append(file)
-                    print(f"✅ Archivo '{filename}' coincide con batch '{batch_id}' (identificador: {batch_identifier})")
+        full = request.args.get("full", "false").lower() == "true"
+        state = mask_sync_scheduler.request_run(full=full)
+        return jsonify({
+            "success": True,
+            "sync": state,
+            "message": "Sincronización programada" + (" (en curso)" if state.get("running") else "")
+        }), 202
 
-        # OPTIMIZACIÓN 5: Actualizar batches en bulk
-        updated_batches = 0
-        sync_results = []
-        bulk_operations = []
-
-        for batch in batches:
-            batch_id = batch["id"]
-            current_mongo_status = batch.get("mongo_uploaded", False)
-            files_for_batch = batch_file_map.get(batch_id, [])
-            has_files = len(files_for_batch) > 0
-
-            # Solo actualizar si hay cambios
-            if current_mongo_status != has_files:
-                bulk_operations.append({
-                    "filter": {"id": batch_id},
-                    "update": {
-                        "$set": {
-                            "mongo_uploaded": has_files,
-                            "file_info": {
-                                "file_count": len(files_for_batch),
-                                "last_file_upload": files_for_batch[0]["uploadDate"] if files_for_batch else None,
-                                "has_files": has_files
-                            }
-                        }
-                    }
-                })
-                updated_batches += 1
-
-            sync_results.append({
-                "batch_id": batch_id,
-                "files_found": len(files_for_batch),
-                "mongo_uploaded": has_files,
-                "updated": current_mongo_status != has_files
-            })
-
-        # Ejecutar todas las actualizaciones de una vez (bulk write)
-        if bulk_operations:
-            from pymongo import UpdateOne
-            batches_col.bulk_write([UpdateOne(op["filter"], op["update"]) for op in bulk_operations])
-
-        print(f"🔄 Sincronización completa: {updated_batches} batches actualizados (OPTIMIZADO)")
-
-        return jsonify({
-            "success": True,
-            "batches_updated": updated_batches,
-            "total_batches": len(sync_results),
-            "total_files_found": len(all_files),
-            "message": f"Sincronización optimizada: {updated_batches} batches actualizados",
-            "results": sync_results[:50]  # Limitar resultado para no sobrecargar respuesta
-        })
-
-    except Exception as e:
-        print(f"❌ Error en sincronización: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"success": False, "error": str(e)}), 500
+    except Exception as e:
+        print(f"❌ Error en sincronización: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route("/api/auto-create-batches", methods=["POST"])
 def auto_create_batches():
-    """Crear batches automáticamente (OPTIMIZADO: solo filename, sin metadata pesada)"""
-    global training_masks_col
+    """Crear batches automáticamente desde las máscaras subidas (en segundo plano, responde 202 con job_id)"""
+    if batches_col is None or jobs_col is None:
+        return jsonify({"success": False, "error": "No DB connection"}), 503
+    if training_masks_col is None:
+        return jsonify({
+            "success": False,
+            "error": "QUALITY_IEMSA.training_metrics.masks.files no disponible"
+        }), 503
 
     try:
-        print("🤖 Iniciando creación automática de batches...")
-
-        # Verificar que training_masks_col esté disponible
-        if training_masks_col is None:
-            return jsonify({
-                "success": False,
-                "error": "QUALITY_IEMSA.training_metrics.masks.files no disponible"
-            }), 503
-
-        # OPTIMIZACIÓN: Solo traer filename, no metadata ni length desde training_metrics.masks.files
-        # LÍMITE REDUCIDO: 5000 archivos (reducir carga de memoria)
-        files = list(training_masks_col.find(
-            {},
-            {"filename": 1, "_id": 0}  # Solo filename necesario
-        ).limit(5000))  # Límite de seguridad reducido
-
-        # Extraer números de batch de los nombres de archivos
-        import re
-        batch_numbers = set()
-        for file in files:
-            filename = file.get("filename", "")
-            # Buscar patrones como batch_XXXX, Batch_XXXX
-            batch_matches = re.findall(r'[Bb]atch[_\-]?(\d+)', filename)
-            for match in batch_matches:
-                batch_numbers.add(match)
-
-        print(f"📊 Números de batch encontrados: {len(batch_numbers)}")
-
-        # OPTIMIZACIÓN: Solo IDs de batches existentes (proyección mínima)
-        # Usar set comprehension directamente para ahorrar memoria
-        existing_ids = {b["id"] for b in batches_col.find({}, {"id": 1, "_id": 0})}
-
-        created_batches = 0
-        results = []
+        return submit_job("auto_create_batches", message="Creación automática de batches en cola")
+    except Exception as e:
+        print(f"❌ Error en auto_create_batches: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
 
-        # OPTIMIZACIÓN: Preparar bulk insert
-        batches_to_insert = []
-
-        for batch_num in sorted(batch_numbers):
-            batch_id = f"batch_{batch_num}"
-
-            if batch_id not in existing_ids:
-                # Preparar batch para inserción bulk
-                batch = {
-                    "id": batch_id,
-                    "assignee": "Maggie",
-                    "folder": f"{DATA_DIRECTORY}/{batch_id}",
-                    "tasks": ["segmentar", "subir_mascaras", "revisar"],
-                    "metadata": {
-                        "assigned_at": datetime.now().strftime("%Y-%m-%d"),
-                        "due_date": "",
-                        "priority": "media",
-                        "reviewed_at": None
-                    },
-                    "status": "NS",
-                    "mongo_uploaded": True,
-                    "comments": "Batch creado automáticamente"
-                }
+@job_runner.handler("auto_create_batches")
+def run_auto_create_batches(job):
+    """Crear los batches que aparecen en las máscaras y no existen (OPTIMIZADO: solo filename).
 
-                batches_to_insert.append(batch)
-                results.append({
-                    "batch_id": batch_id,
-                    "created": True,
-                    "assignee": "Maggie"
-                })
-            else:
-                results.append({
-                    "batch_id": batch_id,
-                    "created": False,
-                    "reason": "Ya existe"
-                })
+    Idempotente: al retomarse vuelve a comparar con los IDs existentes, y como
+    el intento anterior pudo insertar sin actualizar los contadores, los recalcula.
+    """
+    if training_masks_col is None:
+        raise RuntimeError("QUALITY_IEMSA.training_metrics.masks.files no disponible")
+
+    print("🤖 Iniciando creación automática de batches...")
+
+    # OPTIMIZACIÓN: Solo traer filename, no metadata ni length desde training_metrics.masks.files
+    # LÍMITE REDUCIDO: 5000 archivos (reducir carga de memoria)
+    files = list(training_masks_col.find(
+        {},
+        {"filename": 1, "_id": 0}  # Solo filename necesario
+    ).limit(5000))  # Límite de seguridad reducido
+
+    # Extraer IDs de batch de los nombres de archivos (extractor común)
+    batch_numbers = {batch_id for batch_id in extract_batch_ids(f.get("filename", "") for f in files) if batch_id}
+
+    print(f"📊 IDs de batch encontrados: {len(batch_numbers)}")
+    job.progress(files=len(files), total_found=len(batch_numbers))
+
+    # OPTIMIZACIÓN: Solo IDs de batches existentes (proyección mínima)
+    # Usar set comprehension directamente para ahorrar memoria
+    existing_ids = {b["id"] for b in batches_col.find({}, {"id": 1, "_id": 0})}
+
+    created_batches = 0
+    results = []
+
+    # OPTIMIZACIÓN: Preparar bulk insert
+    seq = bump_batches_version()
+    batches_to_insert = []
+
+    for batch_id in sorted(batch_numbers):
+        if batch_id not in existing_ids:
+            # Preparar batch para inserción bulk
+            batch = {
+                "id": batch_id,
+                "assignee": "Maggie",
+                "folder": f"{DATA_DIRECTORY}/{batch_id}",
+                "tasks": ["segmentar", "subir_mascaras", "revisar"],
+                "metadata": {
+                    "assigned_at": datetime.now().strftime("%Y-%m-%d"),
+                    "due_date": "",
+                    "priority": "media",
+                    "reviewed_at": None
+                },
+                "status": "NS",
+                "mongo_uploaded": True,
+                "comments": "Batch creado automáticamente",
+                **batch_change_stamp(seq),
+                **REV_INCREMENT
+            }
 
-        # OPTIMIZACIÓN: Insertar todos de una vez (bulk insert)
-        if batches_to_insert:
-            batches_col.insert_many(batches_to_insert)
-            created_batches = len(batches_to_insert)
-            print(f"✅ {created_batches} batches creados en bulk")
+            batches_to_insert.append(batch)
+            results.append({
+                "batch_id": batch_id,
+                "created": True,
+                "assignee": "Maggie"
+            })
+        else:
+            results.append({
+                "batch_id": batch_id,
+                "created": False,
+                "reason": "Ya existe"
+            })
 
-        return jsonify({
-            "success": True,
-            "created_batches": created_batches,
-            "total_found": len(batch_numbers),
-            "message": f"Se crearon {created_batches} nuevos batches (optimizado)",
-            "results": results[:100]  # Limitar respuesta
-        })
+    # OPTIMIZACIÓN: Insertar todos de una vez (bulk insert)
+    if batches_to_insert:
+        batches_col.insert_many(batches_to_insert)
+        created_batches = len(batches_to_insert)
+        print(f"✅ {created_batches} batches creados en bulk")
+    if job.resumed:
+        record_batch_change(seq, reset=True)
+        refresh_batch_counters()
+    else:
+        record_batch_change(seq, upserted=[b["id"] for b in batches_to_insert])
+        update_batch_counters(added=batches_to_insert)
 
-    except Exception as e:
-        print(f"❌ Error en auto_create_batches: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"success": False, "error": str(e)}), 500
+    return {
+        "created_batches": created_batches,
+        "total_found": len(batch_numbers),
+        "message": f"Se crearon {created_batches} nuevos batches (optimizado)",
+        "results": results[:100]  # Limitar respuesta
+    }
 
 @app.route("/api/init-batches", methods=["POST"])
 def init_batches():
@@ -1019,36 +2368,42 @@ def init_batches():
             })
         
         # Solo cargar desde JSON si no hay datos o si se fuerza
-        if force_reload:
-            print("🔄 Forzando reinicialización - limpiando datos existentes")
-            batches_col.delete_many({})
-        
-        with open("batches.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if data.get("batches"):
-                # Verificar duplicados antes de insertar
-                loaded_count = 0
-                for batch in data["batches"]:
-                    existing = batches_col.find_one({"id": batch["id"]})
-                    if not existing:
-                        batches_col.insert_one(batch)
-                        loaded_count += 1
-                        print(f"➕ Batch {batch['id']} cargado")
-                    else:
-                        print(f"⚠️ Batch {batch['id']} ya existe, omitiendo")
-                
-                return jsonify({
-                    "success": True, 
-                    "message": f"Inicialización completa: {loaded_count} nuevos batches cargados",
-                    "loaded_count": loaded_count,
-                    "total_in_file": len(data["batches"]),
-                    "loaded": True
-                })
+        seq = bump_batches_version()
+        stamp = {**batch_change_stamp(seq), **REV_INCREMENT}
+        with open("batches.json", "rb") as f:
+            batches = iter_manifest_batches(f)
+            if force_reload:
+                # Carga en staging + rename: nunca queda la colección vacía a mitad de proceso
+                print("🔄 Forzando reinicialización - reemplazando colección completa")
+                try:
+                    stats = replace_collection(db, "batches", batches, extra_fields=stamp)
+                finally:
+                    record_batch_change(seq, reset=True)
+                refresh_batch_counters()
             else:
-                return jsonify({
-                    "success": False, 
-                    "error": "No se encontraron batches en el archivo JSON"
-                })
+                # Upserts por bloques con $setOnInsert: los existentes no se tocan
+                stats = {"inserted_ids": []}
+                try:
+                    stats = upsert_batches(batches_col, batches, overwrite=False, extra_fields=stamp,
+                                           on_insert=lambda docs: update_batch_counters(added=docs))
+                finally:
+                    record_batch_change(seq, upserted=stats["inserted_ids"])
+
+        if not stats.get("processed"):
+            return jsonify({
+                "success": False, 
+                "error": "No se encontraron batches en el archivo JSON"
+            })
+
+        loaded_count = stats["inserted"]
+        print(f"➕ {loaded_count} batches cargados de {stats['processed']} en el archivo")
+        return jsonify({
+            "success": True, 
+            "message": f"Inicialización completa: {loaded_count} nuevos batches cargados",
+            "loaded_count": loaded_count,
+            "total_in_file": stats["processed"],
+            "loaded": True
+        })
                 
     except Exception as e:
         print(f"❌ Error en init_batches: {e}")
@@ -1057,13 +2412,17 @@ def init_batches():
 @app.route("/api/reset-batches", methods=["POST"])
 def reset_batches():
     # Endpoint para limpiar y recargar completamente los batches
+    # (staging + rename: los lectores ven la colección anterior hasta el intercambio)
     try:
-        batches_col.delete_many({})
-        with open("batches.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if data.get("batches"):
-                batches_col.insert_many(data["batches"])
-        return jsonify({"success": True, "message": f"Base de datos limpiada y {len(data['batches'])} batches cargados"})
+        seq = bump_batches_version()
+        try:
+            with open("batches.json", "rb") as f:
+                stats = replace_collection(db, "batches", iter_manifest_batches(f),
+                                           extra_fields={**batch_change_stamp(seq), **REV_INCREMENT})
+        finally:
+            record_batch_change(seq, reset=True)
+        refresh_batch_counters()
+        return jsonify({"success": True, "message": f"Base de datos limpiada y {stats['inserted']} batches cargados"})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
@@ -1104,7 +2463,32 @@ def get_missing_batches():
         print(f"❌ Error obteniendo batches faltantes: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+def get_daily_progress_col():
+    """Colección daily_progress (también si batches_col se reconectó sin pasar por init_db)"""
+    return daily_progress_col if daily_progress_col is not None else batches_col.database["daily_progress"]
+
+def get_batch_metrics(**options):
+    """Métricas de batches desde batch_counters o, si hace falta, una sola agregación $facet"""
+    counters = batch_counters_col if batch_counters_col is not None else batches_col.database["batch_counters"]
+    return compute_batch_metrics(batches_col, counters, **options)
+
+@app.route("/api/metrics/cache", methods=["GET", "DELETE"])
+def metrics_cache_stats():
+    """Estado de la caché de métricas (tamaños, aciertos por endpoint); DELETE la vacía"""
+    if not metrics_cache.enabled:
+        return jsonify({"success": True, "enabled": False, "ttl_seconds": 0})
+    try:
+        if request.method == "DELETE":
+            metrics_cache.invalidate()
+            return jsonify({"success": True, "message": "Caché de métricas vaciada"})
+        return jsonify({"success": True, "enabled": True, **metrics_cache.stats()})
+    except Exception as e:
+        print(f"❌ Error leyendo caché de métricas: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @app.route("/api/metrics/overview", methods=["GET"])
+@batches_etag
+@metrics_cached
 def get_metrics_overview():
     """Obtener estadísticas globales del sistema"""
     try:
@@ -1116,55 +2500,16 @@ def get_metrics_overview():
             else:
                 return jsonify({"error": "No DB connection"}), 503
 
-        # Agregación para estadísticas globales
-        pipeline = [
-            {
-                "$group": {
-                    "_id": "$status",
-                    "count": {"$sum": 1}
-                }
-            }
-        ]
-
-        results = list(batches_col.aggregate(pipeline)) or []
-
-        # Inicializar contadores (valores seguros por defecto)
+        # Motor de métricas: batch_counters o una sola agregación $facet
+        summary = get_batch_metrics()
         stats = {
-            "total_batches": 0,
-            "completed_batches": 0,  # S
-            "in_progress_batches": 0,  # FS
-            "pending_batches": 0,     # NS
-            "unassigned_batches": 0   # assignee null/empty
+            "total_batches": summary["total"],
+            "completed_batches": summary["by_status"].get("S", 0),    # S
+            "in_progress_batches": summary["by_status"].get("FS", 0), # FS
+            "pending_batches": summary["by_status"].get("NS", 0),     # NS
+            "unassigned_batches": summary["unassigned"]               # assignee null/vacío
         }
 
-        # Procesar resultados de agregación
-        for result in results:
-            status = result.get("_id")
-            count = result.get("count", 0)
-            stats["total_batches"] += count
-
-            if status == "S":
-                stats["completed_batches"] = count
-            elif status == "FS":
-                stats["in_progress_batches"] = count
-            elif status == "NS":
-                stats["pending_batches"] = count
-
-        # Contar batches sin asignar (con manejo de error)
-        try:
-            unassigned_count = batches_col.count_documents({
-                "$or": [
-                    {"assignee": {"$exists": False}},
-                    {"assignee": None},
-                    {"assignee": ""},
-                    {"assignee": {"$regex": "^\\s*$"}}
-                ]
-            })
-            stats["unassigned_batches"] = unassigned_count
-        except Exception as count_error:
-            print(f"⚠️ Error contando sin asignar: {count_error}")
-            stats["unassigned_batches"] = 0
-
         # Calcular porcentaje de completado (división segura)
         completion_rate = (stats["completed_batches"] / stats["total_batches"] * 100) if stats["total_batches"] > 0 else 0
 
@@ -1181,7 +2526,30 @@ def get_metrics_overview():
         traceback.print_exc()
         return jsonify({"success": False, "error": str(e)}), 500
 
+# Batches recientes por assignee en /api/metrics/team (por defecto y máximo de ?recent=)
+TEAM_RECENT_BATCHES = int(os.environ.get("TEAM_RECENT_BATCHES", "3"))
+TEAM_RECENT_BATCHES_MAX = 50
+
+def recent_batch_ids(assignee, limit):
+    """IDs de los `limit` batches asignados más recientemente a `assignee` (None = sin asignar).
+
+    Con un assignee concreto es igualdad + orden del índice (assignee,
+    metadata.assigned_at, id): consulta cubierta que lee solo `limit` entradas.
+    Sin asignar usa UNASSIGNED_FILTER (mismo criterio que los contadores): la
+    rama null necesita leer el documento para distinguir null de ausente y la de
+    texto en blanco se ordena en memoria, pero ambas recorren rangos acotados.
+    """
+    if limit <= 0:
+        return []
+    query = UNASSIGNED_FILTER if assignee is None else {"assignee": assignee}
+    cursor = (batches_col.find(query, {"id": 1, "_id": 0})
+              .sort("metadata.assigned_at", -1)
+              .limit(limit))
+    return [b["id"] for b in cursor]
+
 @app.route("/api/metrics/team", methods=["GET"])
+@batches_etag
+@metrics_cached
 def get_metrics_team():
     """Obtener métricas por miembro del equipo con paridad de datos (OPTIMIZADO)"""
     try:
@@ -1193,78 +2561,34 @@ def get_metrics_team():
             else:
                 return jsonify({"error": "No DB connection"}), 503
 
-        # OPTIMIZACIÓN: Agregación con proyección mínima y límite de batches
-        pipeline = [
-            {
-                "$project": {  # Proyectar solo campos necesarios PRIMERO
-                    "id": 1,
-                    "assignee": 1,
-                    "status": 1,
-                    "metadata.assigned_at": 1
-                }
-            },
-            {
-                "$addFields": {
-                    "assignee_normalized": {
-                        "$cond": {
-                            "if": {"$or": [
-                                {"$eq": ["$assignee", None]},
-                                {"$eq": ["$assignee", ""]},
-                                {"$not": ["$assignee"]}
-                            ]},
-                            "then": "Sin asignar",
-                            "else": "$assignee"
-                        }
-                    },
-                    # Usar metadata.assigned_at si existe, sino usar fecha por defecto
-                    "sort_date": {
-                        "$ifNull": ["$metadata.assigned_at", "1970-01-01"]
-                    }
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$assignee_normalized",
-                    "total": {"$sum": 1},
-                    "completed": {"$sum": {"$cond": [{"$eq": ["$status", "S"]}, 1, 0]}},
-                    "in_progress": {"$sum": {"$cond": [{"$eq": ["$status", "FS"]}, 1, 0]}},
-                    "pending": {"$sum": {"$cond": [{"$eq": ["$status", "NS"]}, 1, 0]}},
-                    "batches": {"$push": {
-                        "id": "$id",
-                        "status": "$status",
-                        "sort_date": "$sort_date"
-                    }}
-                }
-            },
-            {
-                "$sort": {"_id": 1}
-            }
-        ]
+        # Cantidad de batches recientes por assignee (?recent=N, acotado)
+        recent_limit = request.args.get("recent", TEAM_RECENT_BATCHES, type=int)
+        recent_limit = max(0, min(recent_limit, TEAM_RECENT_BATCHES_MAX))
 
-        results = list(batches_col.aggregate(pipeline))
+        # Conteos desde batch_counters; los recientes se leen del índice por assignee
+        summary = get_batch_metrics()
 
-        # Procesar resultados y agregar recent_batches
         team_metrics = []
-        for result in results:
-            assignee = result["_id"]
+        for assignee_key, member in summary["by_assignee"].items():
+            assignee = assignee_key or "Sin asignar"
+            total = member["total"]
+            completed = member["by_status"].get("S", 0)
+            in_progress = member["by_status"].get("FS", 0)
+            pending = member["by_status"].get("NS", 0)
 
-            # OPTIMIZACIÓN: Ordenar y tomar solo 3 más recientes en una sola pasada
-            batches = result["batches"]
-            # Usar sorted con slice para evitar ordenar todos si hay muchos
-            recent_batches_full = sorted(batches, key=lambda x: x.get("sort_date", "1970-01-01"), reverse=True)[:3]
-            recent_batches = [batch["id"] for batch in recent_batches_full]
+            recent_batches = recent_batch_ids(assignee_key, recent_limit)
 
             # Calcular eficiencia: S / (S + FS)
-            active_work = result["completed"] + result["in_progress"]
-            efficiency = round((result["completed"] / active_work * 100), 1) if active_work > 0 else 0
+            active_work = completed + in_progress
+            efficiency = round((completed / active_work * 100), 1) if active_work > 0 else 0
 
             team_metrics.append({
                 "assignee": assignee,
-                "total": result["total"],
-                "completed": result["completed"],
-                "in_progress": result["in_progress"],
-                "pending": result["pending"],
-                "completion_rate": round((result["completed"] / result["total"] * 100), 1) if result["total"] > 0 else 0,
+                "total": total,
+                "completed": completed,
+                "in_progress": in_progress,
+                "pending": pending,
+                "completion_rate": round((completed / total * 100), 1) if total > 0 else 0,
                 "efficiency": efficiency,
                 "recent_batches": recent_batches
             })
@@ -1299,6 +2623,8 @@ def get_metrics_team():
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route("/api/metrics/progress", methods=["GET"])
+@batches_etag
+@metrics_cached
 def get_metrics_progress():
     """Obtener serie temporal de progreso con filtros opcionales"""
     try:
@@ -1315,54 +2641,25 @@ def get_metrics_progress():
         to_date = request.args.get("to")      # YYYY-MM-DD
         assignees_param = request.args.get("assignees")  # "Flor,Mauricio"
 
-        # Construir filtro de match
-        match_filter = {
-            "metadata.assigned_at": {"$exists": True, "$ne": None, "$ne": ""}
-        }
-
-        # Filtro por rango de fechas
-        if from_date or to_date:
-            date_filter = {}
-            if from_date:
-                date_filter["$gte"] = from_date
-            if to_date:
-                date_filter["$lte"] = to_date
-            match_filter["metadata.assigned_at"] = {**match_filter["metadata.assigned_at"], **date_filter}
-
-        # Filtro por assignees
-        if assignees_param:
-            assignees_list = [a.strip() for a in assignees_param.split(",") if a.strip()]
-            if assignees_list:
-                match_filter["assignee"] = {"$in": assignees_list}
-
-        # Agregación por fecha de asignación
-        pipeline = [
-            {"$match": match_filter},
-            {
-                "$group": {
-                    "_id": "$metadata.assigned_at",
-                    "total": {"$sum": 1},
-                    "completed": {"$sum": {"$cond": [{"$eq": ["$status", "S"]}, 1, 0]}},
-                    "in_progress": {"$sum": {"$cond": [{"$eq": ["$status", "FS"]}, 1, 0]}},
-                    "pending": {"$sum": {"$cond": [{"$eq": ["$status", "NS"]}, 1, 0]}}
-                }
-            },
-            {"$sort": {"_id": 1}}
-        ]
+        assignees_list = [a.strip() for a in (assignees_param or "").split(",") if a.strip()]
 
-        results = list(batches_col.aggregate(pipeline))
+        # Rollup daily_progress: lectura por rango de fechas (índice date+assignee),
+        # unas pocas filas por día en lugar de agrupar toda la colección
+        rows = read_daily_progress(get_daily_progress_col(), from_date, to_date, assignees_list, dated_only=True)
 
-        # Procesar resultados
+        # Sumar los assignees de cada fecha (las filas vienen ordenadas por fecha)
         progress_data = []
-        for result in results:
-            date = result["_id"]
+        for date, date_rows in itertools.groupby(rows, key=lambda row: row["date"]):
+            date_rows = list(date_rows)
+            total = sum(row.get("total", 0) for row in date_rows)
+            completed = sum(row.get("S", 0) for row in date_rows)
             progress_data.append({
                 "date": date,
-                "total": result["total"],
-                "completed": result["completed"],
-                "in_progress": result["in_progress"],
-                "pending": result["pending"],
-                "completion_rate": round((result["completed"] / result["total"] * 100), 1) if result["total"] > 0 else 0
+                "total": total,
+                "completed": completed,
+                "in_progress": sum(row.get("FS", 0) for row in date_rows),
+                "pending": sum(row.get("NS", 0) for row in date_rows),
+                "completion_rate": round((completed / total * 100), 1) if total > 0 else 0
             })
 
         return jsonify({
@@ -1381,9 +2678,166 @@ def get_metrics_progress():
         print(f"❌ Error en metrics progress: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+# Zona horaria para agrupar eventos por día/semana en /api/metrics/throughput
+METRICS_TIMEZONE = os.environ.get("METRICS_TIMEZONE", "UTC")
+THROUGHPUT_DEFAULT_DAYS = 30
+
+@app.route("/api/metrics/throughput", methods=["GET"])
+@batches_etag
+@metrics_cached
+@date_relative
+def get_metrics_throughput():
+    """Batches completados (transición a S) por día o semana y por segmentador.
+
+    Parámetros: from/to (YYYY-MM-DD, por defecto últimos 30 días), period=day|week,
+    assignees="Flor,Mauricio", status (destino contado, por defecto S).
+    Lee batch_events por rango de ts (índices (assignee, ts) y (ts)).
+    """
+    events_col = batch_events_col if batch_events_col is not None else (
+        batches_col.database["batch_events"] if batches_col is not None else None
+    )
+    if events_col is None:
+        return jsonify({"success": False, "error": "No DB connection"}), 503
+
+    try:
+        period = request.args.get("period", "day")
+        if period not in ("day", "week"):
+            return jsonify({"success": False, "error": "period debe ser 'day' o 'week'"}), 400
+        status = request.args.get("status", "S")
+
+        try:
+            to_day = (datetime.strptime(request.args["to"], "%Y-%m-%d").date() if request.args.get("to")
+                      else local_today(METRICS_TIMEZONE))
+            from_day = (datetime.strptime(request.args["from"], "%Y-%m-%d").date() if request.args.get("from")
+                        else to_day - timedelta(days=THROUGHPUT_DEFAULT_DAYS))
+        except ValueError:
+            return jsonify({"success": False, "error": "Fechas inválidas, usa YYYY-MM-DD"}), 400
+        # Rango [from 00:00, to+1 00:00) en METRICS_TIMEZONE, el mismo día que usa el $group
+        ts_range = {"$gte": local_midnight_utc(from_day, METRICS_TIMEZONE),
+                    "$lt": local_midnight_utc(to_day + timedelta(days=1), METRICS_TIMEZONE)}
+
+        match = {"ts": ts_range, "type": "updated", "to_status": status}
+        assignees_list = [a.strip() for a in request.args.get("assignees", "").split(",") if a.strip()]
+        if assignees_list:
+            match["assignee"] = {"$in": assignees_list}
+
+        date_format = "%G-W%V" if period == "week" else "%Y-%m-%d"
+        rows = list(events_col.aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": {
+                    "period": {"$dateToString": {"format": date_format, "date": "$ts", "timezone": METRICS_TIMEZONE}},
+                    "assignee": "$assignee"
+                },
+                "completed": {"$sum": 1},
+                "batches": {"$addToSet": "$batch_id"}
+            }},
+            {"$project": {"completed": 1, "unique_batches": {"$size": "$batches"}}},
+            {"$sort": {"_id.period": 1, "_id.assignee": 1}}
+        ]))
+
+        data = []
+        totals = {}
+        for row in rows:
+            assignee = row["_id"]["assignee"] or "Sin asignar"
+            data.append({
+                "period": row["_id"]["period"],
+                "assignee": assignee,
+                "completed": row["completed"],
+                "unique_batches": row["unique_batches"]
+            })
+            totals[assignee] = totals.get(assignee, 0) + row["completed"]
+
+        return jsonify({
+            "success": True,
+            "data": data,
+            "totals": totals,
+            "filters": {
+                "from": from_day.strftime("%Y-%m-%d"),
+                "to": to_day.strftime("%Y-%m-%d"),
+                "period": period,
+                "status": status,
+                "assignees": assignees_list
+            },
+            "message": f"Throughput calculado para {len(totals)} segmentadores"
+        })
+
+    except Exception as e:
+        print(f"❌ Error en metrics throughput: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# Ventana (días completos) para estimar el throughput en /api/metrics/forecast
+FORECAST_DEFAULT_WINDOW = int(os.environ.get("FORECAST_WINDOW_DAYS", "28"))
+FORECAST_MAX_WINDOW = 180
+
+@app.route("/api/metrics/forecast", methods=["GET"])
+@batches_etag
+@metrics_cached
+@date_relative
+def get_metrics_forecast():
+    """ETA de finalización por segmentador y del tablero completo.
+
+    Throughput = completados por día (batch_events) en los últimos `window` días
+    completos; backlog = batches en NS/In según batch_counters.
+    Parámetros: window (días, por defecto 28), assignees="Flor,Mauricio".
+    """
+    if batches_col is None:
+        return jsonify({"success": False, "error": "No DB connection"}), 503
+    events_col = batch_events_col if batch_events_col is not None else batches_col.database["batch_events"]
+
+    try:
+        window = request.args.get("window", FORECAST_DEFAULT_WINDOW, type=int)
+        window = max(1, min(window, FORECAST_MAX_WINDOW))
+        assignees_list = [a.strip() for a in request.args.get("assignees", "").split(",") if a.strip()]
+
+        # Backlog actual desde los contadores materializados
+        summary = get_batch_metrics()
+        backlog = {
+            assignee: sum(member["by_status"].get(status, 0) for status in BACKLOG_STATUSES)
+            for assignee, member in summary["by_assignee"].items()
+        }
+
+        today = local_today(METRICS_TIMEZONE)
+        start_day = today - timedelta(days=window)
+        assignees, matrix = daily_completions(events_col, start_day, window, timezone=METRICS_TIMEZONE)
+        members, board = forecast(assignees, matrix, backlog, today)
+
+        if assignees_list:
+            members = [m for m in members if m["assignee"] in assignees_list]
+
+        return jsonify({
+            "success": True,
+            "data": members,
+            "board": board,
+            "window": {
+                "days": window,
+                "from": start_day.isoformat(),
+                "to": (today - timedelta(days=1)).isoformat(),
+                "backlog_statuses": list(BACKLOG_STATUSES)
+            },
+            "message": f"Pronóstico calculado para {len(members)} segmentadores"
+        })
+
+    except Exception as e:
+        print(f"❌ Error en metrics forecast: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# Documentos por lote de cursor en las exportaciones CSV en streaming
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "500"))
+
+def csv_download(chunks, filename):
+    """Response en streaming para un CSV generado por iter_csv (el BOM va en el primer trozo)"""
+    response = Response(stream_with_context(chunks), mimetype="text/csv")
+    response.headers["Content-Type"] = "text/csv; charset=utf-8"
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    response.headers["X-Accel-Buffering"] = "no"  # el primer byte llega sin esperar al final (nginx/ngrok)
+    return response
+
 @app.route("/api/metrics/export", methods=["GET"])
+@batches_etag
+@metrics_cached
 def export_metrics():
-    """Exportar métricas a CSV con filtros opcionales"""
+    """Exportar métricas a CSV con filtros opcionales (streaming desde daily_progress)"""
     try:
         global batches_col
         if batches_col is None:
@@ -1398,115 +2852,40 @@ def export_metrics():
         to_date = request.args.get("to", "").strip()
         assignees_param = request.args.get("assignees", "").strip()
 
-        # Construir pipeline de agregación con assignee expandido
-        match_filter = {}
-
-        # Filtro por rango de fechas
-        if from_date or to_date:
-            date_filter = {}
-            if from_date:
-                date_filter["$gte"] = from_date
-            if to_date:
-                date_filter["$lte"] = to_date
-            match_filter["metadata.assigned_at"] = date_filter
-
-        # Filtro por assignees
-        if assignees_param:
-            assignees_list = [a.strip() for a in assignees_param.split(",") if a.strip()]
-            if assignees_list:
-                match_filter["assignee"] = {"$in": assignees_list}
-
-        # Agregación por fecha y assignee
-        pipeline = [
-            {
-                "$addFields": {
-                    "assignee_display": {
-                        "$cond": {
-                            "if": {"$or": [
-                                {"$eq": ["$assignee", None]},
-                                {"$eq": ["$assignee", ""]},
-                                {"$not": ["$assignee"]}
-                            ]},
-                            "then": "Sin asignar",
-                            "else": "$assignee"
-                        }
-                    }
-                }
-            }
-        ]
-
-        if match_filter:
-            pipeline.insert(0, {"$match": match_filter})
-
-        pipeline.extend([
-            {
-                "$group": {
-                    "_id": {
-                        "date": "$metadata.assigned_at",
-                        "assignee": "$assignee_display"
-                    },
-                    "total": {"$sum": 1},
-                    "S": {"$sum": {"$cond": [{"$eq": ["$status", "S"]}, 1, 0]}},
-                    "FS": {"$sum": {"$cond": [{"$eq": ["$status", "FS"]}, 1, 0]}},
-                    "NS": {"$sum": {"$cond": [{"$eq": ["$status", "NS"]}, 1, 0]}}
-                }
-            },
-            {
-                "$sort": {"_id.date": 1, "_id.assignee": 1}
-            }
-        ])
-
-        results = list(batches_col.aggregate(pipeline))
-
-        # Generar CSV
-        from io import StringIO
-        import csv
-
-        output = StringIO()
-        writer = csv.writer(output)
-
-        # Headers
-        writer.writerow(['date', 'assignee', 'total', 'S', 'FS', 'NS', 'completionRate', 'efficiency'])
-
-        # Datos
-        for result in results:
-            date = result["_id"]["date"] or "Sin fecha"
-            assignee = result["_id"]["assignee"]
-            total = result["total"]
-            completed = result["S"]
-            in_progress = result["FS"]
-            pending = result["NS"]
-
-            completion_rate = round((completed / total * 100), 1) if total > 0 else 0
-            active_work = completed + in_progress
-            efficiency = round((completed / active_work * 100), 1) if active_work > 0 else 0
-
-            writer.writerow([
-                date,
-                assignee,
-                total,
-                completed,
-                in_progress,
-                pending,
-                completion_rate,
-                efficiency
-            ])
-
-        # Si no hay datos, solo headers
-        csv_content = output.getvalue()
-        output.close()
+        assignees_list = [a.strip() for a in assignees_param.split(",") if a.strip()]
+
+        # Rollup daily_progress: una fila por (fecha, assignee), ya ordenada
+        cursor = find_daily_progress(get_daily_progress_col(), from_date, to_date, assignees_list).batch_size(EXPORT_BATCH_SIZE)
+
+        def rows():
+            for row in cursor:
+                total = row.get("total", 0)
+                completed = row.get("S", 0)
+                in_progress = row.get("FS", 0)
+                pending = row.get("NS", 0)
+
+                completion_rate = round((completed / total * 100), 1) if total > 0 else 0
+                active_work = completed + in_progress
+                efficiency = round((completed / active_work * 100), 1) if active_work > 0 else 0
+
+                yield [
+                    row["date"] or "Sin fecha",
+                    row["assignee"] or "Sin asignar",
+                    total,
+                    completed,
+                    in_progress,
+                    pending,
+                    completion_rate,
+                    efficiency
+                ]
 
         # Generar nombre de archivo con timestamp
-        from datetime import datetime
         timestamp = datetime.now().strftime("%Y%m%d_%H%M")
         filename = f"progress_{timestamp}.csv"
 
-        # Crear respuesta
-        response = app.make_response(csv_content)
-        response.headers["Content-Disposition"] = f"attachment; filename={filename}"
-        response.headers["Content-Type"] = "text/csv; charset=utf-8"
-
-        return response
+        # Si no hay datos, solo headers
+        header = ['date', 'assignee', 'total', 'S', 'FS', 'NS', 'completionRate', 'efficiency']
+        return csv_download(iter_csv(header, rows()), filename)
 
     except Exception as e:
         print(f"❌ Error en metrics export: {e}")
@@ -1521,122 +2900,260 @@ def data_management():
     """Página de gestión de datos (cargar/borrar batches)"""
     return render_template("data_management.html", crew=CREW_MEMBERS)
 
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", "1000"))
+UPLOAD_INLINE_MAX_BYTES = 5 * 1024 * 1024  # Cuerpos JSON menores se aceptan con "mode" dentro del JSON
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+def open_batches_upload():
+    """Devolver (mode, iterador de batches) según el tipo de contenido de la petición.
+
+    Multipart: Werkzeug vuelca el archivo a disco temporal, se lee en streaming.
+    NDJSON/JSON: se lee directamente de request.stream sin cargar el cuerpo completo.
+    """
+    mode = request.args.get("mode")
+    if request.mimetype == "multipart/form-data":
+        upload = request.files.get("file")
+        if upload is None:
+            raise ValueError("Falta el archivo en el campo 'file'")
+        mode = request.form.get("mode", mode)
+        if upload.mimetype in NDJSON_CONTENT_TYPES or upload.filename.endswith((".ndjson", ".jsonl")):
+            return mode or "add", iter_ndjson_batches(upload.stream)
+        return mode or "add", iter_manifest_batches(upload.stream)
+
+    if request.mimetype in NDJSON_CONTENT_TYPES:
+        return mode or "add", iter_ndjson_batches(request.stream)
+
+    if not mode and request.content_length and request.content_length <= UPLOAD_INLINE_MAX_BYTES:
+        # Compatibilidad: {"batches": [...], "mode": "..."} en el mismo cuerpo
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            raise ValueError("El cuerpo debe ser un JSON {\"batches\": [...]}")
+        return data.get("mode", "add"), iter(data.get("batches") or [])
+
+    return mode or "add", iter_manifest_batches(request.stream)
+
+def build_uploaded_batch(batch):
+    """Completar un batch subido con los campos por defecto"""
+    if not isinstance(batch, dict) or not batch.get("id"):
+        raise ValueError(f"Batch inválido (falta 'id'): {str(batch)[:100]}")
+    metadata = batch.get("metadata") or {}
+    return {
+        "id": batch.get("id"),
+        "assignee": batch.get("assignee", None),
+        "folder": batch.get("folder", f"{DATA_DIRECTORY}/{batch.get('id')}"),
+        "tasks": batch.get("tasks", ["segmentar", "subir_mascaras", "revisar"]),
+        "metadata": {
+            "assigned_at": metadata.get("assigned_at", None),
+            "due_date": metadata.get("due_date", ""),
+            "priority": metadata.get("priority", "media"),
+            "reviewed_at": metadata.get("reviewed_at", None)
+        },
+        "status": batch.get("status", "NS"),
+        "mongo_uploaded": batch.get("mongo_uploaded", True),
+        "comments": batch.get("comments", ""),
+        "created_at": batch.get("created_at", datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+    }
+
 @app.route("/api/data/batches/upload", methods=["POST"])
 def upload_batches_json():
-    """Cargar batches desde un archivo JSON"""
-    global batches_col
-
-    if batches_col is None:
+    """Cargar batches desde un archivo JSON o NDJSON, en segundo plano y por bloques.
+
+    Formatos aceptados:
+    - multipart/form-data: campo "file" (.json con {"batches": [...]} o .ndjson) y campo "mode"
+    - application/x-ndjson: un batch por línea; ?mode=add|replace
+    - application/json: manifiesto {"batches": [...]}; ?mode=add|replace
+      (cuerpos pequeños con "mode" dentro del JSON se siguen aceptando)
+
+    La petición solo valida el archivo y lo guarda en JOBS_SPOOL_DIR; responde
+    202 con job_id y la carga avanza en GET /api/jobs/<job_id>.
+    """
+    if batches_col is None or jobs_col is None:
         return jsonify({"success": False, "error": "No DB connection"}), 503
 
+    spool_file = None
     try:
-        data = request.json
-        batches = data.get("batches", [])
-
-        if not batches:
+        mode, batches = open_batches_upload()
+        if mode not in ("add", "replace"):
+            return jsonify({"success": False, "error": "mode debe ser 'add' o 'replace'"}), 400
+
+        # Validar y volcar a disco en streaming: el trabajo puede retomarse desde el archivo
+        os.makedirs(JOBS_SPOOL_DIR, exist_ok=True)
+        fd, spool_file = tempfile.mkstemp(prefix="upload_", suffix=".ndjson", dir=JOBS_SPOOL_DIR)
+        total = 0
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for batch in batches:
+                f.write(json.dumps(build_uploaded_batch(batch), default=str, ensure_ascii=False))
+                f.write("\n")
+                total += 1
+
+        # Un archivo vacío no debe vaciar la base
+        if total == 0:
+            os.remove(spool_file)
             return jsonify({"success": False, "error": "No se encontraron batches en el JSON"}), 400
 
-        # Validar estructura de batches
-        required_fields = ["id"]
-        invalid_batches = []
-
-        for idx, batch in enumerate(batches):
-            if not all(field in batch for field in required_fields):
-                invalid_batches.append(idx)
-
-        if invalid_batches:
-            return jsonify({
-                "success": False,
-                "error": f"Batches inválidos en índices: {invalid_batches}"
-            }), 400
-
-        # Opción: reemplazar todos o solo agregar nuevos
-        mode = data.get("mode", "add")  # "add" o "replace"
-
-        if mode == "replace":
-            # Crear backup antes de borrar
-            backup_batches = list(batches_col.find({}, {"_id": 0}))
-            backup_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-            # Guardar backup en archivo temporal
-            import tempfile
-            backup_file = os.path.join(tempfile.gettempdir(), f"batches_backup_{backup_timestamp}.json")
-            with open(backup_file, 'w', encoding='utf-8') as f:
-                json.dump({"batches": backup_batches}, f, indent=2, default=str)
-
-            print(f"💾 Backup guardado en: {backup_file}")
-
-            # Borrar todos los batches existentes
-            deleted = batches_col.delete_many({})
-            print(f"🗑️ {deleted.deleted_count} batches eliminados")
-
-        # Insertar nuevos batches con campos por defecto
-        batches_to_insert = []
-        for batch in batches:
-            # Asegurar que tenga todos los campos necesarios
-            batch_doc = {
-                "id": batch.get("id"),
-                "assignee": batch.get("assignee", None),
-                "folder": batch.get("folder", f"{DATA_DIRECTORY}/{batch.get('id')}"),
-                "tasks": batch.get("tasks", ["segmentar", "subir_mascaras", "revisar"]),
-                "metadata": {
-                    "assigned_at": batch.get("metadata", {}).get("assigned_at", None),
-                    "due_date": batch.get("metadata", {}).get("due_date", ""),
-                    "priority": batch.get("metadata", {}).get("priority", "media"),
-                    "reviewed_at": batch.get("metadata", {}).get("reviewed_at", None)
-                },
-                "status": batch.get("status", "NS"),
-                "mongo_uploaded": batch.get("mongo_uploaded", True),
-                "comments": batch.get("comments", ""),
-                "created_at": batch.get("created_at", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-            }
-            batches_to_insert.append(batch_doc)
-
-        # Insertar batches
-        result = batches_col.insert_many(batches_to_insert)
-
-        return jsonify({
-            "success": True,
-            "message": f"{len(result.inserted_ids)} batches cargados exitosamente",
-            "inserted_count": len(result.inserted_ids),
-            "mode": mode,
-            "backup_file": backup_file if mode == "replace" else None
-        })
+        return submit_job(
+            "batches_upload",
+            {"mode": mode, "spool_file": spool_file, "total": total},
+            message=f"Carga de {total} batches en cola ({mode})"
+        )
 
+    except ValueError as e:
+        # JSON mal formado o batch sin "id": la colección no cambió
+        if spool_file and os.path.exists(spool_file):
+            os.remove(spool_file)
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         print(f"❌ Error cargando batches: {e}")
+        if spool_file and os.path.exists(spool_file):
+            os.remove(spool_file)
         return jsonify({"success": False, "error": str(e)}), 500
 
+def remove_job_files(*paths):
+    """Borrar archivos temporales de un trabajo (los que no existan se ignoran)"""
+    for path in paths:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+def upload_staging_name(job):
+    """Colección staging propia de una carga en modo "replace" (no toca las de otras cargas)"""
+    return f"batches_staging_{job.id}"
+
+def cleanup_batches_upload(job):
+    """Carga terminada en error: borrar el archivo de la carga, el backup y la staging sin usar"""
+    remove_job_files(job.params.get("spool_file"))
+    if not job.checkpoint.get("renamed"):
+        remove_job_files(job.checkpoint.get("backup_file"))
+        if db is not None:
+            db[upload_staging_name(job)].drop()
+
+@job_runner.handler("batches_upload", cleanup=cleanup_batches_upload)
+def run_batches_upload(job):
+    """Aplicar una carga guardada en JOBS_SPOOL_DIR.
+
+    - "add": checkpoint con los batches procesados; al retomarse salta esos y
+      sigue (los upserts con $setOnInsert son idempotentes). Los contadores se
+      recalculan completos porque el intento anterior pudo quedar a medias.
+    - "replace": carga en batches_staging_<job_id>; al retomarse se descarta esa
+      staging y se rehace. Si el intento anterior ya hizo el rename (checkpoint
+      "renamed"), solo falta registrar el cambio. La colección visible no cambia
+      hasta el rename.
+    """
+    mode = job.params["mode"]
+    spool_file = job.params["spool_file"]
+    total = job.params.get("total")
+    if not os.path.exists(spool_file):
+        raise RuntimeError(f"El archivo de la carga ya no existe: {spool_file}")
+
+    skip = job.checkpoint.get("processed", 0) if mode == "add" else 0
+    inserted_before = job.checkpoint.get("inserted", 0) if mode == "add" else 0
+    seq = bump_batches_version()
+    stamp = {**batch_change_stamp(seq), **REV_INCREMENT}
+    backup_file = None
+
+    with open(spool_file, "rb") as f:
+        documents = itertools.islice(iter_ndjson_batches(f), skip, None)
+        try:
+            if mode == "replace":
+                if job.checkpoint.get("renamed"):
+                    backup_file = job.checkpoint.get("backup_file")
+                    stats = {"processed": job.checkpoint["processed"], "inserted": job.checkpoint["inserted"]}
+                else:
+                    staging_name = upload_staging_name(job)
+                    if job.resumed:
+                        db[staging_name].drop()
+                        remove_job_files(job.checkpoint.get("backup_file"))
+                    # Backup comprimido en streaming; la colección actual sigue visible hasta el rename
+                    backup_file, backup_count = write_batches_backup(
+                        batches_col.find({}, {"_id": 0}), "batches_backup"
+                    )
+                    job.save_checkpoint(backup_file=backup_file)
+                    print(f"💾 Backup de {backup_count} batches guardado en: {backup_file}")
+                    stats = replace_collection(
+                        db, "batches", documents, extra_fields=stamp, chunk_size=UPLOAD_CHUNK_SIZE,
+                        on_progress=lambda processed: job.progress(processed=processed, total=total),
+                        staging_name=staging_name
+                    )
+                    job.save_checkpoint(renamed=True, processed=stats["processed"], inserted=stats["inserted"])
+                record_batch_change(seq, reset=True)
+                refresh_batch_counters()
+            else:
+                inserted = [inserted_before]
+
+                def on_insert(docs):
+                    inserted[0] += len(docs)
+                    if not job.resumed:
+                        update_batch_counters(added=docs)
+
+                def on_progress(processed):
+                    job.save_checkpoint(processed=skip + processed, inserted=inserted[0])
+                    job.progress(processed=skip + processed, inserted=inserted[0], total=total)
+
+                # Solo se agregan los IDs nuevos; los existentes no se tocan
+                stats = upsert_batches(batches_col, documents, overwrite=False, extra_fields=stamp,
+                                       chunk_size=UPLOAD_CHUNK_SIZE, on_progress=on_progress, on_insert=on_insert)
+                stats["processed"] += skip
+                stats["inserted"] = inserted[0]
+                if job.resumed:
+                    record_batch_change(seq, reset=True)
+                    refresh_batch_counters()
+                else:
+                    record_batch_change(seq, upserted=stats["inserted_ids"])
+        except Exception:
+            # Carga parcial en modo "add": los clientes deben recargar la lista completa
+            if mode == "add":
+                record_batch_change(seq, reset=True)
+            raise
+
+    os.remove(spool_file)
+    skipped = stats["processed"] - stats["inserted"]
+    print(f"📥 Carga {job.id}: {stats['inserted']} insertados, {skipped} omitidos ({mode})")
+
+    return {
+        "message": f"{stats['inserted']} batches cargados exitosamente",
+        "inserted_count": stats["inserted"],
+        "skipped_count": skipped,
+        "processed_count": stats["processed"],
+        "mode": mode,
+        "backup_file": backup_file
+    }
+
+def build_delete_filter(data):
+    """Filtro de Mongo para el borrado masivo a partir de los criterios del formulario"""
+    filter_criteria = {}
+
+    # Construir filtro basado en criterios
+    if "status" in data and data["status"]:
+        filter_criteria["status"] = data["status"]
+
+    if "assignee" in data and data["assignee"]:
+        filter_criteria["assignee"] = data["assignee"]
+
+    if "id_pattern" in data and data["id_pattern"]:
+        filter_criteria["id"] = {"$regex": data["id_pattern"]}
+
+    if "date_before" in data and data["date_before"]:
+        filter_criteria["created_at"] = {"$lt": data["date_before"]}
+
+    if "unassigned_only" in data and data["unassigned_only"]:
+        filter_criteria["assignee"] = None
+
+    return filter_criteria
+
+DELETE_FILTER_FIELDS = ("status", "assignee", "id_pattern", "date_before", "unassigned_only")
+DELETE_CHUNK_SIZE = 1000
+
 @app.route("/api/data/batches/delete-by-filter", methods=["POST"])
 def delete_batches_by_filter():
-    """Eliminar batches basándose en filtros"""
-    global batches_col
-
-    if batches_col is None:
+    """Eliminar batches basándose en filtros (en segundo plano, responde 202 con job_id)"""
+    if batches_col is None or jobs_col is None:
         return jsonify({"success": False, "error": "No DB connection"}), 503
 
     try:
-        data = request.json
-        filter_criteria = {}
-
-        # Construir filtro basado en criterios
-        if "status" in data and data["status"]:
-            filter_criteria["status"] = data["status"]
-
-        if "assignee" in data and data["assignee"]:
-            filter_criteria["assignee"] = data["assignee"]
-
-        if "id_pattern" in data and data["id_pattern"]:
-            filter_criteria["id"] = {"$regex": data["id_pattern"]}
-
-        if "date_before" in data and data["date_before"]:
-            filter_criteria["created_at"] = {"$lt": data["date_before"]}
-
-        if "unassigned_only" in data and data["unassigned_only"]:
-            filter_criteria["assignee"] = None
+        data = request.get_json(silent=True) or {}
+        criteria = {key: data[key] for key in DELETE_FILTER_FIELDS if data.get(key)}
 
         # Verificar cuántos batches se borrarían
-        count = batches_col.count_documents(filter_criteria)
+        count = batches_col.count_documents(build_delete_filter(criteria))
 
         if count == 0:
             return jsonify({
@@ -1644,31 +3161,69 @@ def delete_batches_by_filter():
                 "error": "No se encontraron batches que coincidan con los filtros"
             }), 404
 
-        # Crear backup antes de borrar
-        backup_batches = list(batches_col.find(filter_criteria, {"_id": 0}))
-        backup_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-        import tempfile
-        backup_file = os.path.join(tempfile.gettempdir(), f"deleted_batches_{backup_timestamp}.json")
-        with open(backup_file, 'w', encoding='utf-8') as f:
-            json.dump({"batches": backup_batches}, f, indent=2, default=str)
-
-        print(f"💾 Backup de batches a eliminar guardado en: {backup_file}")
-
-        # Eliminar batches
-        result = batches_col.delete_many(filter_criteria)
-
-        return jsonify({
-            "success": True,
-            "message": f"{result.deleted_count} batches eliminados exitosamente",
-            "deleted_count": result.deleted_count,
-            "backup_file": backup_file
-        })
+        return submit_job("delete_by_filter", {"criteria": criteria, "matched": count},
+                          message=f"Borrado de {count} batches en cola")
 
     except Exception as e:
         print(f"❌ Error eliminando batches: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@job_runner.handler("delete_by_filter")
+def run_delete_by_filter(job):
+    """Respaldar y borrar los batches que coinciden con el filtro.
+
+    Se borran por bloques solo los IDs que quedaron en el respaldo (un batch que
+    empieza a coincidir después del respaldo no se pierde). El checkpoint guarda
+    el archivo de respaldo: al retomarse se reutiliza y se borra lo que falte.
+    """
+    filter_criteria = build_delete_filter(job.params["criteria"])
+    backup_file = job.checkpoint.get("backup_file")
+    backup_states = []
+
+    if backup_file and os.path.exists(backup_file):
+        # Intento anterior: los estados salen del respaldo ya escrito
+        with gzip.open(backup_file, "rb") as f:
+            backup_states = [counter_state(b) for b in iter_manifest_batches(f) if b.get("id")]
+    else:
+        def collect_states(batches):
+            for batch in batches:
+                if batch.get("id"):
+                    backup_states.append(counter_state(batch))
+                yield batch
+
+        # Crear backup antes de borrar (comprimido, en streaming)
+        backup_file, count = write_batches_backup(
+            collect_states(batches_col.find(filter_criteria, {"_id": 0})), "deleted_batches"
+        )
+        job.save_checkpoint(backup_file=backup_file)
+        print(f"💾 Backup de {count} batches a eliminar guardado en: {backup_file}")
+
+    # Eliminar batches: los cambios y contadores salen de lo realmente borrado
+    seq = bump_batches_version()
+    deleted_ids, deleted_states = [], []
+    exact = True
+    for chunk in iter_chunks(backup_states, DELETE_CHUNK_SIZE):
+        chunk_states, chunk_exact = delete_read_batches(chunk, filter_criteria)
+        deleted_states.extend(chunk_states)
+        deleted_ids.extend(state["id"] for state in chunk_states)
+        exact = exact and chunk_exact
+        job.progress(deleted=len(deleted_ids), total=len(backup_states))
+    deleted_count = len(deleted_ids)
+
+    # Un intento anterior pudo borrar sin registrar: en ese caso tampoco se sabe qué se borró
+    if job.resumed or not exact:
+        record_batch_change(seq, reset=True)
+        refresh_batch_counters()
+    else:
+        record_batch_change(seq, deleted=deleted_ids)
+        update_batch_counters(removed=deleted_states)
+
+    return {
+        "message": f"{deleted_count} batches eliminados exitosamente",
+        "deleted_count": deleted_count,
+        "backup_file": backup_file
+    }
+
 @app.route("/api/data/batches/export", methods=["GET"])
 def export_batches_json():
     """Exportar todos los batches a JSON"""
@@ -1706,6 +3261,8 @@ def export_batches_json():
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route("/api/data/batches/stats", methods=["GET"])
+@batches_etag
+@metrics_cached
 def get_batches_stats():
     """Obtener estadísticas de batches"""
     global batches_col
@@ -1714,48 +3271,27 @@ def get_batches_stats():
         return jsonify({"success": False, "error": "No DB connection"}), 503
 
     try:
-        total = batches_col.count_documents({})
-
-        # Estadísticas por estado
-        status_stats = list(batches_col.aggregate([
-            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}}
-        ]))
-
-        # Estadísticas por asignado
-        assignee_stats = list(batches_col.aggregate([
-            {"$group": {"_id": "$assignee", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}}
-        ]))
-
-        # Batches sin asignar
-        unassigned = batches_col.count_documents({"assignee": None})
-
-        # Batches por formato de ID
-        id_patterns = {}
-        sample_batches = list(batches_col.find({}, {"id": 1, "_id": 0}).limit(1000))
-
-        for batch in sample_batches:
-            batch_id = batch.get("id", "")
-            # Detectar patrón
-            if batch_id.startswith("batch_T"):
-                pattern = "batch_T000XXX"
-            elif batch_id.startswith("batch_000"):
-                pattern = "batch_000XXX"
-            elif batch_id.startswith("batch_2025"):
-                pattern = "batch_2025XXXXXXXX"
-            else:
-                pattern = "otros"
+        # Una sola agregación $facet: conteos + formato de ID de toda la colección
+        summary = get_batch_metrics(id_patterns=True)
+        total = summary["total"]
+        unassigned = summary["unassigned"]
+
+        # Estadísticas por estado y por asignado (mayor a menor)
+        status_stats = sorted(summary["by_status"].items(), key=lambda item: item[1], reverse=True)
+        assignee_stats = sorted(
+            ((assignee, member["total"]) for assignee, member in summary["by_assignee"].items()),
+            key=lambda item: item[1], reverse=True
+        )
 
-            id_patterns[pattern] = id_patterns.get(pattern, 0) + 1
+        id_patterns = summary["id_patterns"]
 
         return jsonify({
             "success": True,
             "stats": {
                 "total": total,
                 "unassigned": unassigned,
-                "by_status": [{"status": s["_id"], "count": s["count"]} for s in status_stats],
-                "by_assignee": [{"assignee": a["_id"], "count": a["count"]} for a in assignee_stats],
+                "by_status": [{"status": status, "count": count} for status, count in status_stats],
+                "by_assignee": [{"assignee": assignee, "count": count} for assignee, count in assignee_stats],
                 "by_id_pattern": id_patterns
             }
         })
@@ -1765,6 +3301,8 @@ def get_batches_stats():
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route("/api/batch-assignment/metrics", methods=["GET"])
+@batches_etag
+@metrics_cached
 def get_batch_assignment_metrics():
     """Obtener métricas detalladas para el módulo de asignación de batches"""
     global batches_col
@@ -1773,37 +3311,36 @@ def get_batch_assignment_metrics():
         return jsonify({"success": False, "error": "No DB connection"}), 503
 
     try:
+        # Motor de métricas: batch_counters o una sola agregación $facet
+        summary = get_batch_metrics()
+
         # Métricas globales
-        total = batches_col.count_documents({})
+        total = summary["total"]
 
         # Por estado
-        ns_count = batches_col.count_documents({"status": "NS"})  # No Segmentado
-        in_count = batches_col.count_documents({"status": "In"})  # Incompleto
-        s_count = batches_col.count_documents({"status": "S"})    # Segmentado
+        ns_count = summary["by_status"].get("NS", 0)  # No Segmentado
+        in_count = summary["by_status"].get("In", 0)  # Incompleto
+        s_count = summary["by_status"].get("S", 0)    # Segmentado
 
         # Métricas por segmentador
         segmentadores_metrics = {}
 
         # Obtener lista de segmentadores del sistema
         for member in CREW_MEMBERS:
-            # Total asignados al segmentador
-            total_assigned = batches_col.count_documents({"assignee": member})
-
-            # Por estado
-            ns = batches_col.count_documents({"assignee": member, "status": "NS"})
-            in_progress = batches_col.count_documents({"assignee": member, "status": "In"})
-            completed = batches_col.count_documents({"assignee": member, "status": "S"})
+            member_counts = summary["by_assignee"].get(member, {"total": 0, "by_status": {}})
+            total_assigned = member_counts["total"]
+            completed = member_counts["by_status"].get("S", 0)
 
             segmentadores_metrics[member] = {
                 "total": total_assigned,
-                "ns": ns,
-                "in_progress": in_progress,
+                "ns": member_counts["by_status"].get("NS", 0),
+                "in_progress": member_counts["by_status"].get("In", 0),
                 "completed": completed,
                 "percentage_completed": round((completed / total_assigned * 100) if total_assigned > 0 else 0, 1)
             }
 
         # Batches sin asignar
-        unassigned = batches_col.count_documents({"assignee": None})
+        unassigned = summary["unassigned"]
 
         return jsonify({
             "success": True,
@@ -1829,7 +3366,7 @@ def get_batch_assignment_metrics():
 
 @app.route("/api/export/segmentador/<segmentador>", methods=["GET"])
 def export_segmentador_csv(segmentador):
-    """Exportar batches de un segmentador específico en formato CSV"""
+    """Exportar batches de un segmentador específico en formato CSV (streaming)"""
     global batches_col
 
     if batches_col is None:
@@ -1838,10 +3375,12 @@ def export_segmentador_csv(segmentador):
     try:
         print(f"📥 Exportando datos de segmentador: {segmentador}")
 
-        # Obtener batches del segmentador
-        batches = list(batches_col.find({"assignee": segmentador}, {"_id": 0}).sort("id", 1))
+        # Primer batch del segmentador: confirma que existen y da la fecha del archivo
+        first_batch = batches_col.find_one(
+            {"assignee": segmentador}, {"metadata.assigned_at": 1, "_id": 0}, sort=[("id", 1)]
+        )
 
-        if not batches:
+        if not first_batch:
             return jsonify({
                 "success": False,
                 "error": f"No se encontraron batches para {segmentador}"
@@ -1849,56 +3388,36 @@ def export_segmentador_csv(segmentador):
 
         # Obtener la fecha de asignación del primer batch (o fecha actual si no hay)
         first_batch_date = ""
-        if batches:
-            metadata = batches[0].get("metadata", {})
-            assigned_at = metadata.get("assigned_at", "")
-            if assigned_at:
-                # Extraer solo la fecha (YYYY-MM-DD) sin la hora
-                try:
-                    # Formato esperado: "2025-10-15 14:30:00"
-                    first_batch_date = assigned_at.split()[0].replace("-", "")  # 20251015
-                except:
-                    first_batch_date = datetime.now().strftime("%Y%m%d")
-            else:
+        metadata = first_batch.get("metadata", {})
+        assigned_at = metadata.get("assigned_at", "")
+        if assigned_at:
+            # Extraer solo la fecha (YYYY-MM-DD) sin la hora
+            try:
+                # Formato esperado: "2025-10-15 14:30:00"
+                first_batch_date = assigned_at.split()[0].replace("-", "")  # 20251015
+            except:
                 first_batch_date = datetime.now().strftime("%Y%m%d")
+        else:
+            first_batch_date = datetime.now().strftime("%Y%m%d")
 
-        # Crear CSV en memoria
-        output = io.StringIO()
-
-        # Definir columnas SIMPLIFICADAS (solo ID, Nombre, Estatus vacío)
-        fieldnames = ["Batch ID", "Responsable", "Estatus"]
-
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-        writer.writeheader()
-
-        # Escribir datos
-        for batch in batches:
-            writer.writerow({
-                "Batch ID": batch.get("id", ""),
-                "Responsable": batch.get("assignee", ""),
-                "Estatus": ""  # Campo vacío para que lo llene el segmentador
-            })
+        # Cursor por lotes sobre el índice (assignee, id): sin cargar la lista completa
+        cursor = (batches_col.find({"assignee": segmentador}, {"id": 1, "assignee": 1, "_id": 0})
+                  .sort("id", 1)
+                  .batch_size(EXPORT_BATCH_SIZE))
 
-        # Preparar respuesta
-        output.seek(0)
+        def rows():
+            exported = 0
+            for batch in cursor:
+                exported += 1
+                # Columnas SIMPLIFICADAS: ID, Nombre, Estatus vacío para que lo llene el segmentador
+                yield [batch.get("id", ""), batch.get("assignee", ""), ""]
+            print(f"✅ Exportados {exported} batches de {segmentador}")
 
         # Nombre del archivo: segmentador_fechaAsignacion.csv
         # Ejemplo: Mauricio_20251015.csv
         filename = f"{segmentador}_{first_batch_date}.csv"
 
-        # Convertir a bytes para send_file
-        mem = io.BytesIO()
-        mem.write(output.getvalue().encode('utf-8-sig'))  # BOM para Excel
-        mem.seek(0)
-
-        print(f"✅ Exportados {len(batches)} batches de {segmentador}")
-
-        return send_file(
-            mem,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
-        )
+        return csv_download(iter_csv(["Batch ID", "Responsable", "Estatus"], rows()), filename)
 
     except Exception as e:
         print(f"❌ Error exportando datos de {segmentador}: {e}")
@@ -1906,7 +3425,7 @@ def export_segmentador_csv(segmentador):
 
 @app.route("/api/export/all-assignments", methods=["GET"])
 def export_all_assignments_csv():
-    """Exportar todos los batches asignados en formato CSV (resumen por segmentador)"""
+    """Exportar todos los batches asignados en formato CSV (resumen por segmentador, streaming)"""
     global batches_col
 
     if batches_col is None:
@@ -1915,141 +3434,191 @@ def export_all_assignments_csv():
     try:
         print(f"📥 Exportando resumen de asignaciones de todo el equipo")
 
-        # Obtener estadísticas por segmentador
-        pipeline = [
-            {"$match": {"assignee": {"$ne": None}}},  # Solo asignados
-            {"$group": {
-                "_id": "$assignee",
-                "total": {"$sum": 1},
-                "ns": {"$sum": {"$cond": [{"$eq": ["$status", "NS"]}, 1, 0]}},
-                "in_progress": {"$sum": {"$cond": [{"$eq": ["$status", "In"]}, 1, 0]}},
-                "completed": {"$sum": {"$cond": [{"$eq": ["$status", "S"]}, 1, 0]}},
-                "batches": {"$push": "$id"}
-            }},
-            {"$sort": {"_id": 1}}
+        # Conteos desde batch_counters; los IDs se leen después, por segmentador
+        summary = get_batch_metrics()
+        results = [
+            {
+                "_id": assignee,
+                "total": member["total"],
+                "ns": member["by_status"].get("NS", 0),
+                "in_progress": member["by_status"].get("In", 0),
+                "completed": member["by_status"].get("S", 0)
+            }
+            for assignee, member in sorted(summary["by_assignee"].items(), key=lambda item: str(item[0]))
+            if assignee is not None  # Solo asignados
         ]
 
-        results = list(batches_col.aggregate(pipeline))
-
         if not results:
             return jsonify({
                 "success": False,
                 "error": "No hay batches asignados"
             }), 404
 
-        # Crear CSV en memoria
-        output = io.StringIO()
+        def batch_ids(assignee):
+            # Consulta cubierta por el índice (assignee, id), ya ordenada
+            cursor = (batches_col.find({"assignee": assignee}, {"id": 1, "_id": 0})
+                      .sort("id", 1)
+                      .batch_size(EXPORT_BATCH_SIZE))
+            return (batch["id"] for batch in cursor)
+
+        def rows():
+            for result in results:
+                total = result["total"]
+                completed = result["completed"]
+                percentage = round((completed / total * 100) if total > 0 else 0, 1)
+                yield [
+                    result["_id"],
+                    total,
+                    result["ns"],
+                    result["in_progress"],
+                    completed,
+                    f"{percentage}%",
+                    ListCell(batch_ids(result["_id"]))  # "Lista de Batches" sin armarla en memoria
+                ]
+            print(f"✅ Exportado resumen de {len(results)} segmentadores")
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"resumen_asignaciones_{timestamp}.csv"
 
-        fieldnames = [
+        header = [
             "Segmentador", "Total Batches", "No Segmentados (NS)",
             "Incompletas (In)", "Completados (S)", "% Completado",
             "Lista de Batches"
         ]
-
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-        writer.writeheader()
-
-        # Escribir datos
-        for result in results:
-            segmentador = result["_id"]
-            total = result["total"]
-            completed = result["completed"]
-            percentage = round((completed / total * 100) if total > 0 else 0, 1)
-            batches_list = ", ".join(result["batches"])
-
-            writer.writerow({
-                "Segmentador": segmentador,
-                "Total Batches": total,
-                "No Segmentados (NS)": result["ns"],
-                "Incompletas (In)": result["in_progress"],
-                "Completados (S)": completed,
-                "% Completado": f"{percentage}%",
-                "Lista de Batches": batches_list
-            })
-
-        # Preparar respuesta
-        output.seek(0)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"resumen_asignaciones_{timestamp}.csv"
-
-        mem = io.BytesIO()
-        mem.write(output.getvalue().encode('utf-8-sig'))
-        mem.seek(0)
-
-        print(f"✅ Exportado resumen de {len(results)} segmentadores")
-
-        return send_file(
-            mem,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
-        )
+        return csv_download(iter_csv(header, rows()), filename)
 
     except Exception as e:
         print(f"❌ Error exportando resumen de asignaciones: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
-@app.route("/api/backup/database", methods=["GET"])
+@app.route("/api/backup/database", methods=["GET", "POST"])
 def backup_database():
-    """Crear respaldo completo de la base de datos en JSON"""
+    """Crear respaldo completo de la base de datos en JSON.
+
+    GET: descarga directa en streaming (los batches salen del cursor uno por uno).
+    POST: en segundo plano; responde 202 con job_id y el archivo se descarga de
+    GET /api/jobs/<job_id>/download cuando termina.
+    """
     global batches_col, segmentadores_col
 
     if batches_col is None:
         return jsonify({"success": False, "error": "No DB connection"}), 503
 
     try:
+        if request.method == "POST":
+            if jobs_col is None:
+                return jsonify({"success": False, "error": "No DB connection"}), 503
+            return submit_job("database_backup", message="Respaldo completo en cola")
+
         print("💾 Creando respaldo completo de la base de datos...")
 
-        # Obtener todos los datos
-        batches = list(batches_col.find({}, {"_id": 0}))
-        segmentadores = list(segmentadores_col.find({}, {"_id": 0})) if segmentadores_col else []
-
-        # Crear estructura del respaldo
-        backup_data = {
-            "backup_info": {
-                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "version": "1.0",
-                "source": "Dashboard de Segmentación"
-            },
-            "statistics": {
-                "total_batches": len(batches),
-                "total_segmentadores": len(segmentadores),
-                "batches_by_status": {
-                    "NS": sum(1 for b in batches if b.get("status") == "NS"),
-                    "In": sum(1 for b in batches if b.get("status") == "In"),
-                    "S": sum(1 for b in batches if b.get("status") == "S")
-                }
-            },
-            "segmentadores": segmentadores,
-            "batches": batches
-        }
+        summary = {}
+
+        def chunks():
+            yield from iter_database_backup(summary)
+            print(f"✅ Respaldo creado: {summary['written']} batches, {summary['total_segmentadores']} segmentadores")
 
         # Generar nombre de archivo
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"backup_segmentacion_db_{timestamp}.json"
 
-        # Crear respuesta
-        response = app.make_response(
-            json.dumps(backup_data, indent=2, default=str, ensure_ascii=False)
-        )
+        response = Response(stream_with_context(chunks()), mimetype="application/json")
         response.headers["Content-Disposition"] = f"attachment; filename={filename}"
         response.headers["Content-Type"] = "application/json; charset=utf-8"
-
-        print(f"✅ Respaldo creado: {len(batches)} batches, {len(segmentadores)} segmentadores")
-
+        response.headers["X-Accel-Buffering"] = "no"
         return response
 
     except Exception as e:
         print(f"❌ Error creando respaldo: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+BACKUP_PROGRESS_EVERY = 1000
+
+def iter_database_backup(summary, on_progress=None):
+    """Trozos de texto del respaldo completo {"backup_info", "statistics", "segmentadores", "batches"}.
+
+    Los batches se escriben documento por documento, sin acumular la lista.
+    `summary` recibe total_batches y total_segmentadores antes del primer trozo
+    y `written` al final; `on_progress(written)` se llama al empezar y cada
+    BACKUP_PROGRESS_EVERY batches.
+    """
+    segmentadores = list(segmentadores_col.find({}, {"_id": 0})) if segmentadores_col is not None else []
+    total_batches = batches_col.count_documents({})
+    summary.update(total_batches=total_batches, total_segmentadores=len(segmentadores), written=0)
+
+    backup_info = {
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "version": "1.0",
+        "source": "Dashboard de Segmentación"
+    }
+    statistics = {
+        "total_batches": total_batches,
+        "total_segmentadores": len(segmentadores),
+        "batches_by_status": {status: batches_col.count_documents({"status": status}) for status in ("NS", "In", "S")}
+    }
+
+    yield '{"backup_info": ' + json.dumps(backup_info, ensure_ascii=False)
+    yield ',\n"statistics": ' + json.dumps(statistics, ensure_ascii=False)
+    yield ',\n"segmentadores": ' + json.dumps(segmentadores, default=str, ensure_ascii=False)
+    yield ',\n"batches": ['
+    written = 0
+    if on_progress:
+        on_progress(written)
+    for batch in batches_col.find({}, {"_id": 0}).batch_size(EXPORT_BATCH_SIZE):
+        yield ("," if written else "") + "\n" + json.dumps(batch, default=str, ensure_ascii=False)
+        written += 1
+        if on_progress and written % BACKUP_PROGRESS_EVERY == 0:
+            on_progress(written)
+    yield "\n]}\n"
+    summary["written"] = written
+
+def cleanup_database_backup(job):
+    """Respaldo terminado en error: borrar el archivo a medio escribir"""
+    remove_job_files(job.checkpoint.get("backup_file"))
+
+@job_runner.handler("database_backup", cleanup=cleanup_database_backup)
+def run_database_backup(job):
+    """Escribir el respaldo completo comprimido en disco, batch por batch (se rehace al retomarse)"""
+    print("💾 Creando respaldo completo de la base de datos (trabajo en segundo plano)...")
+    # El archivo del intento anterior quedó a medias
+    remove_job_files(job.checkpoint.get("backup_file"))
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    fd, backup_file = tempfile.mkstemp(prefix=f"backup_segmentacion_db_{timestamp}_", suffix=".json.gz")
+    os.close(fd)
+    job.save_checkpoint(backup_file=backup_file)
+
+    summary = {}
+    with gzip.open(backup_file, "wt", encoding="utf-8") as f:
+        progress = lambda written: job.progress(written=written, total=summary["total_batches"])
+        for chunk in iter_database_backup(summary, on_progress=progress):
+            f.write(chunk)
+
+    written, total_segmentadores = summary["written"], summary["total_segmentadores"]
+    job.progress(written=written)
+    print(f"✅ Respaldo creado: {written} batches, {total_segmentadores} segmentadores ({backup_file})")
+    return {
+        "message": f"Respaldo creado: {written} batches, {total_segmentadores} segmentadores",
+        "total_batches": written,
+        "total_segmentadores": total_segmentadores,
+        "backup_file": backup_file
+    }
+
 # ============================================================================
 # ENDPOINT DE CARGA RÁPIDA CON COPY-PASTE
 # ============================================================================
 
+# Límite de IDs por carga rápida y tamaño de bloque para consultas $in / insert_many
+QUICK_CREATE_MAX_IDS = int(os.environ.get("QUICK_CREATE_MAX_IDS", "50000"))
+QUICK_CREATE_CHUNK_SIZE = 1000
+
 @app.route("/api/batches/quick-create", methods=["POST"])
 def quick_create_batches():
-    """Crear múltiples batches desde texto plano (copy-paste de lista)"""
+    """Crear múltiples batches desde texto plano (copy-paste de lista).
+
+    Acepta IDs separados por líneas, comas o espacios y rangos
+    "batch_T000169..batch_T000268" que se expanden en el servidor.
+    """
     global batches_col
 
     if batches_col is None:
@@ -2064,61 +3633,67 @@ def quick_create_batches():
 
         print(f"📝 Procesando lista de batches desde texto...")
 
-        # Parsear la lista: separar por líneas y limpiar
-        lines = batch_list_text.split('\n')
-        batch_ids = []
-
-        for line in lines:
-            line = line.strip()
-            if line:  # Ignorar líneas vacías
-                # Si la línea contiene comas o espacios, dividir
-                parts = line.replace(',', ' ').split()
-                batch_ids.extend(parts)
+        # Parsear la lista: separar por líneas, comas o espacios
+        tokens = batch_list_text.replace(',', ' ').split()
 
-        # Limpiar y filtrar batch IDs válidos
-        batch_ids = [bid.strip() for bid in batch_ids if bid.strip()]
+        # Expandir rangos ("batch_T000169..batch_T000268") y quitar duplicados
+        try:
+            batch_ids = parse_batch_id_list(tokens, max_items=QUICK_CREATE_MAX_IDS)
+        except ValueError as range_error:
+            return jsonify({"success": False, "error": str(range_error)}), 400
 
         if not batch_ids:
             return jsonify({"success": False, "error": "No se encontraron IDs de batches válidos"}), 400
 
         print(f"📋 {len(batch_ids)} batch IDs detectados: {batch_ids[:5]}{'...' if len(batch_ids) > 5 else ''}")
 
-        # Verificar cuáles ya existen
+        # Verificar cuáles ya existen: una consulta $in por bloque (no una por ID)
         existing_ids = set()
-        for bid in batch_ids:
-            if batches_col.find_one({"id": bid}):
-                existing_ids.add(bid)
+        for i in range(0, len(batch_ids), QUICK_CREATE_CHUNK_SIZE):
+            chunk = batch_ids[i:i + QUICK_CREATE_CHUNK_SIZE]
+            existing_ids.update(
+                b["id"] for b in batches_col.find({"id": {"$in": chunk}}, {"id": 1, "_id": 0})
+            )
 
-        # Crear los que no existen
-        created = []
-        skipped = []
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        seq = bump_batches_version()
+        stamp = {**batch_change_stamp(seq), **REV_INCREMENT}
+
+        new_batches = [{
+            "id": bid,
+            "assignee": None,
+            "status": "NS",  # No Segmentado
+            "folder": "",
+            "mongo_uploaded": False,
+            "comments": "",
+            "metadata": {
+                "created_at": current_time,
+                "priority": "media",
+                "total_masks": 0,
+                "completed_masks": 0
+            },
+            **stamp
+        } for bid in batch_ids if bid not in existing_ids]
 
-        for bid in batch_ids:
-            if bid in existing_ids:
-                skipped.append(bid)
-                print(f"⏭️ Batch {bid} ya existe, omitido")
-                continue
-
-            # Crear batch nuevo
-            new_batch = {
-                "id": bid,
-                "assignee": None,
-                "status": "NS",  # No Segmentado
-                "folder": "",
-                "mongo_uploaded": False,
-                "comments": "",
-                "metadata": {
-                    "created_at": current_time,
-                    "priority": "media",
-                    "total_masks": 0,
-                    "completed_masks": 0
-                }
-            }
-
-            batches_col.insert_one(new_batch)
-            created.append(bid)
-            print(f"✅ Batch {bid} creado")
+        # insert_many sin orden: el índice único de "id" descarta los que otro
+        # proceso haya creado entre la consulta y la inserción (se cuentan como omitidos)
+        duplicated = set()
+        try:
+            for i in range(0, len(new_batches), QUICK_CREATE_CHUNK_SIZE):
+                chunk = new_batches[i:i + QUICK_CREATE_CHUNK_SIZE]
+                try:
+                    batches_col.insert_many(chunk, ordered=False)
+                except BulkWriteError as bwe:
+                    for error in bwe.details.get("writeErrors", []):
+                        if error.get("code") != 11000:
+                            raise
+                        duplicated.add(chunk[error["index"]]["id"])
+        finally:
+            created = [b["id"] for b in new_batches if "_id" in b and b["id"] not in duplicated]
+            record_batch_change(seq, upserted=created)
+            update_batch_counters(added=[b for b in new_batches if "_id" in b and b["id"] not in duplicated])
+
+        skipped = [bid for bid in batch_ids if bid in existing_ids or bid in duplicated]
 
         result_message = f"Creados: {len(created)}, Ya existían: {len(skipped)}"
         print(f"✅ {result_message}")
@@ -0,0 +1,102 @@
+"""
+Contadores materializados de batches (colección batch_counters)
+===============================================================
+
+Un documento por combinación (assignee, status):
+
+    {"_id": {"assignee": "Flor", "status": "S"}, "count": 42}
+
+Los batches sin asignar (assignee ausente, null o en blanco) se cuentan con
+assignee = null. Cada ruta de escritura de app.py aplica un $inc con el
+estado anterior y el nuevo de los batches que toca, así las métricas se leen
+en O(segmentadores × estados) en lugar de agregar toda la colección.
+
+rebuild_counters() recalcula todo desde `batches` (ver rebuild_counters.py).
+"""
+
+from collections import Counter
+
+from pymongo import UpdateOne
+
+COUNTERS_COLLECTION = "batch_counters"
+
+# Mismo criterio que counter_key(): texto en blanco o ausente = sin asignar
+NORMALIZED_ASSIGNEE = {
+    "$cond": {
+        "if": {"$eq": [{"$type": "$assignee"}, "string"]},
+        "then": {"$cond": [{"$eq": [{"$trim": {"input": "$assignee"}}, ""]}, None, "$assignee"]},
+        "else": {"$ifNull": ["$assignee", None]}
+    }
+}
+
+# El mismo "sin asignar" como filtro de find() que puede usar el índice de assignee:
+# null/ausente o texto solo con espacios. Los espacios y caracteres de control
+# ordenan antes que "!", así que el rango acota la rama de texto a esos valores.
+UNASSIGNED_FILTER = {"$or": [
+    {"assignee": None},
+    {"assignee": {"$gte": "", "$lt": "!", "$regex": r"^\s*$"}},
+]}
+
+
+# Etapa $group que produce exactamente los documentos de batch_counters; la usan
+# rebuild_counters() y el $facet de batch_metrics.compute_batch_metrics()
+COUNTS_GROUP_STAGE = {"$group": {
+    "_id": {"assignee": NORMALIZED_ASSIGNEE, "status": {"$ifNull": ["$status", None]}},
+    "count": {"$sum": 1}
+}}
+
+
+def counter_key(batch):
+    """Clave (assignee, status) con la que un batch suma en los contadores"""
+    assignee = batch.get("assignee")
+    if assignee is None or (isinstance(assignee, str) and not assignee.strip()):
+        assignee = None
+    return assignee, batch.get("status")
+
+
+def apply_counter_changes(collection, removed=(), added=()):
+    """Restar los batches `removed` y sumar los `added` (estados completos o parciales con assignee/status).
+
+    Una actualización que no cambia assignee ni status se anula y no genera escritura.
+    """
+    deltas = Counter()
+    for batch in removed:
+        deltas[counter_key(batch)] -= 1
+    for batch in added:
+        deltas[counter_key(batch)] += 1
+
+    operations = [
+        UpdateOne({"_id": {"assignee": assignee, "status": status}}, {"$inc": {"count": delta}}, upsert=True)
+        for (assignee, status), delta in deltas.items() if delta
+    ]
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def read_counters(collection):
+    """Lista de {"assignee", "status", "count"} con conteo distinto de cero"""
+    return [
+        {"assignee": doc["_id"].get("assignee"), "status": doc["_id"].get("status"), "count": doc["count"]}
+        for doc in collection.find({"count": {"$ne": 0}})
+    ]
+
+
+def rebuild_counters(db, batches_name="batches"):
+    """Recalcular batch_counters desde cero con una agregación $group + $out.
+
+    $out reemplaza la colección de forma atómica al terminar, así los lectores
+    ven los contadores anteriores o los nuevos, nunca a medias. Devuelve el
+    número de combinaciones (assignee, status).
+    """
+    db[batches_name].aggregate([COUNTS_GROUP_STAGE, {"$out": COUNTERS_COLLECTION}])
+    return db[COUNTERS_COLLECTION].count_documents({})
+
+
+def ensure_counters(db, batches_name="batches"):
+    """Construir los contadores si aún no existen (primer arranque tras el despliegue)"""
+    if db[COUNTERS_COLLECTION].estimated_document_count() == 0 and db[batches_name].estimated_document_count() > 0:
+        print("🧮 batch_counters vacío, reconstruyendo desde batches...")
+        rebuild_counters(db, batches_name)
+        return True
+    return False
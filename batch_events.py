@@ -0,0 +1,91 @@
+"""
+Log de transiciones de batches (colección batch_events)
+=======================================================
+
+Registro de solo-agregado: un evento por cada batch que se crea, se borra o
+cambia de status o de assignee.
+
+    {"batch_id": "batch_T000136", "type": "updated", "ts": <datetime UTC>,
+     "assignee": "Ignacio", "from_status": "FS", "to_status": "S",
+     "from_assignee": "Ignacio", "to_assignee": "Ignacio", "changes": ["status"]}
+
+"assignee" es el responsable después del cambio (antes, si es un borrado) y es
+el campo indexado junto con ts: el throughput por persona se obtiene con
+lecturas por rango de (assignee, ts) o de (ts), sin comparar snapshots.
+"""
+
+from collections import defaultdict, deque
+from datetime import datetime
+
+from batch_counters import counter_key
+
+BATCH_EVENTS_COLLECTION = "batch_events"
+
+
+def build_batch_events(removed=(), added=(), ts=None):
+    """Eventos a partir de los estados anterior (`removed`) y nuevo (`added`) de cada batch.
+
+    Los estados se emparejan por "id" en orden (un mismo id puede aparecer
+    varias veces en una operación bulk). Sin anterior = "created", sin nuevo =
+    "deleted"; un par sin cambio de status ni de assignee no genera evento.
+    """
+    ts = ts or datetime.utcnow()
+    before_by_id = defaultdict(deque)
+    order = []
+    for batch in removed:
+        if batch.get("id") is None:
+            continue
+        before_by_id[batch["id"]].append(batch)
+        order.append(batch["id"])
+
+    events = []
+    for after in added:
+        batch_id = after.get("id")
+        if batch_id is None:
+            continue
+        before = before_by_id[batch_id].popleft() if before_by_id[batch_id] else None
+        event = _event(batch_id, before, after, ts)
+        if event:
+            events.append(event)
+
+    # Los estados anteriores sin pareja corresponden a batches borrados
+    for batch_id in order:
+        if before_by_id[batch_id]:
+            events.append(_event(batch_id, before_by_id[batch_id].popleft(), None, ts))
+    return events
+
+
+def _event(batch_id, before, after, ts):
+    from_assignee, from_status = counter_key(before) if before else (None, None)
+    to_assignee, to_status = counter_key(after) if after else (None, None)
+
+    if before is None:
+        event_type, changes = "created", ["status", "assignee"]
+    elif after is None:
+        event_type, changes = "deleted", ["status", "assignee"]
+    else:
+        event_type = "updated"
+        changes = [field for field, old, new in (("status", from_status, to_status),
+                                                 ("assignee", from_assignee, to_assignee)) if old != new]
+        if not changes:
+            return None
+
+    return {
+        "batch_id": batch_id,
+        "type": event_type,
+        "ts": ts,
+        "assignee": from_assignee if after is None else to_assignee,
+        "from_status": from_status,
+        "to_status": to_status,
+        "from_assignee": from_assignee,
+        "to_assignee": to_assignee,
+        "changes": changes,
+    }
+
+
+def record_batch_events(collection, removed=(), added=()):
+    """Insertar los eventos derivados de un cambio; devuelve cuántos se registraron"""
+    events = build_batch_events(removed, added)
+    if events:
+        collection.insert_many(events, ordered=False)
+    return len(events)
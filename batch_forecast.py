@@ -0,0 +1,132 @@
+"""
+Pronóstico de finalización (ETA) por segmentador y del tablero
+==============================================================
+
+Combina el historial de batch_events (completados por día) con el backlog
+actual de batch_counters (batches en NS o In):
+
+- daily_completions(): UNA agregación sobre batch_events agrupada por
+  (assignee, día) y volcada en una matriz NumPy assignees x días.
+- forecast(): throughput medio de la ventana, media móvil de 7 días y días
+  restantes = backlog / throughput, todo con operaciones sobre arrays.
+
+Solo cuentan los días completos (hasta ayer): el día en curso bajaría la media.
+Los días son naturales (incluye fines de semana), en la zona horaria indicada.
+"""
+
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+BACKLOG_STATUSES = ("NS", "In")
+COMPLETED_STATUS = "S"
+ROLLING_DAYS = 7
+
+
+def local_today(timezone="UTC"):
+    """Fecha actual en la zona horaria de las métricas"""
+    return datetime.now(ZoneInfo(timezone)).date()
+
+
+def local_midnight_utc(day, timezone="UTC"):
+    """Medianoche de `day` en la zona horaria de las métricas, en UTC naive (como se guarda ts)"""
+    start = datetime.combine(day, time(), tzinfo=ZoneInfo(timezone))
+    return start.astimezone(dt_timezone.utc).replace(tzinfo=None)
+
+
+def daily_completions(events, start_day, days, timezone="UTC", status=COMPLETED_STATUS):
+    """Matriz de completados por día desde `start_day` (incluido) durante `days` días.
+
+    Devuelve (assignees, matriz int64 de forma len(assignees) x days).
+    """
+    rows = list(events.aggregate([
+        {"$match": {
+            "ts": {"$gte": local_midnight_utc(start_day, timezone),
+                   "$lt": local_midnight_utc(start_day + timedelta(days=days), timezone)},
+            "type": "updated",
+            "to_status": status
+        }},
+        {"$group": {
+            "_id": {
+                "assignee": "$assignee",
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$ts", "timezone": timezone}}
+            },
+            "count": {"$sum": 1}
+        }}
+    ]))
+
+    assignees = sorted({row["_id"]["assignee"] for row in rows}, key=lambda a: (a is None, a or ""))
+    matrix = np.zeros((len(assignees), days), dtype=np.int64)
+    if rows:
+        position = {assignee: i for i, assignee in enumerate(assignees)}
+        member_idx = np.array([position[row["_id"]["assignee"]] for row in rows])
+        day_idx = (np.array([row["_id"]["day"] for row in rows], dtype="datetime64[D]")
+                   - np.datetime64(start_day, "D")).astype(np.int64)
+        counts = np.array([row["count"] for row in rows], dtype=np.int64)
+        inside = (day_idx >= 0) & (day_idx < days)
+        np.add.at(matrix, (member_idx[inside], day_idx[inside]), counts[inside])
+    return assignees, matrix
+
+
+def rolling_mean(matrix, window=ROLLING_DAYS):
+    """Media móvil por fila (sumas acumuladas); las primeras window-1 columnas usan los días disponibles"""
+    cumulative = np.cumsum(matrix, axis=1, dtype=np.float64)
+    shifted = np.zeros_like(cumulative)
+    shifted[:, window:] = cumulative[:, :-window]
+    divisor = np.minimum(np.arange(1, matrix.shape[1] + 1), window)
+    return (cumulative - shifted) / divisor
+
+
+def forecast(assignees, matrix, backlog, today):
+    """ETA por segmentador y del tablero.
+
+    assignees/matrix: salida de daily_completions() (días completos, hasta ayer).
+    backlog: {assignee|None: batches pendientes}. today: fecha desde la que se proyecta.
+    """
+    names = list(assignees) + [name for name in backlog if name not in assignees and backlog[name] > 0]
+    history = np.zeros((len(names), matrix.shape[1]), dtype=np.int64)
+    history[:len(assignees)] = matrix
+
+    remaining = np.array([backlog.get(name, 0) for name in names], dtype=np.float64)
+    completed = history.sum(axis=1)
+    throughput = history.mean(axis=1) if history.shape[1] else np.zeros(len(names))
+    rolling = rolling_mean(history) if history.shape[1] else np.zeros((len(names), 0))
+    recent = rolling[:, -1] if rolling.shape[1] else np.zeros(len(names))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_left = np.where(throughput > 0, np.ceil(remaining / throughput), np.inf)
+    days_left[remaining == 0] = 0
+
+    def finish(days):
+        return (today + timedelta(days=int(days))).isoformat() if np.isfinite(days) else None
+
+    members = []
+    for i, name in enumerate(names):
+        members.append({
+            "assignee": name or "Sin asignar",
+            "backlog": int(remaining[i]),
+            "completed_in_window": int(completed[i]),
+            "throughput_per_day": round(float(throughput[i]), 2),
+            "rolling_7d_per_day": round(float(recent[i]), 2),
+            "rolling_7d_series": np.round(rolling[i], 2).tolist(),
+            "days_remaining": int(days_left[i]) if np.isfinite(days_left[i]) else None,
+            "projected_finish": finish(days_left[i])
+        })
+
+    # Tablero: ritmo conjunto si el backlog se repartiera, y el último en terminar si no se reasigna
+    total_remaining = float(remaining.sum())
+    total_throughput = float(throughput.sum())
+    pooled_days = np.ceil(total_remaining / total_throughput) if total_throughput > 0 else (0 if total_remaining == 0 else np.inf)
+    assigned = np.array([name is not None for name in names], dtype=bool)
+    slowest_days = float(days_left[assigned].max()) if assigned.any() else 0.0
+
+    board = {
+        "backlog": int(total_remaining),
+        "unassigned_backlog": int(backlog.get(None, 0)),
+        "throughput_per_day": round(total_throughput, 2),
+        "days_remaining": int(pooled_days) if np.isfinite(pooled_days) else None,
+        "projected_finish": finish(pooled_days),
+        "last_member_finish": finish(slowest_days)
+    }
+    return members, board
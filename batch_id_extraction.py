@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Extracción de IDs de batch desde nombres de archivo (patrones precompilados)
+============================================================================
+
+Un solo lugar para todas las familias de ID que usamos:
+
+    numérico     masks_batch_9.tar.xz               -> batch_9
+    serie T      masks_batch_T000044.tar.xz         -> batch_T000044
+    sufijo F/T   masks_batch_000040F.tar.xz         -> batch_000040F
+                 batch_200071T.tar.xz               -> batch_200071T
+    timestamp    Batch_20250909T0001.tar.xz         -> batch_20250909T0001
+                 masks_20251002T132967.tar.xz       -> batch_20251002T132967
+
+El ID tiene que venir precedido por "batch" ("batch_", "Batch-", "batch"),
+opcionalmente tras "masks_"; sin "batch", solo se acepta "masks_<timestamp>".
+Así "2025_backup.tar.xz" o "t1.zip" no se convierten en batches. Sin
+distinguir mayúsculas (las letras del ID se devuelven en mayúscula). El ID
+termina en el primer carácter no alfanumérico, así que ".tar.xz" y otros
+sufijos no interfieren.
+
+- extract_batch_id(nombre): un nombre.
+- extract_batch_ids(nombres): lista alineada con la entrada; la regex de
+  prefijo se aplica en una comprensión con los métodos ya resueltos y la
+  búsqueda libre solo corre para los nombres que no empiezan con un ID.
+
+Asociar archivos con batches es entonces un lookup por ID extraído:
+O(longitud de los nombres), en lugar de probar `id in nombre` por cada par
+batch × archivo (donde además "batch_1" coincide con "batch_10").
+
+Benchmark de throughput y de asociación archivo -> batch:
+    python batch_id_extraction.py [n_nombres] [n_batches]
+"""
+
+import re
+import sys
+import time
+
+# Orden de las alternativas: la más específica primero (timestamp antes que sufijo T)
+BATCH_ID_FAMILIES = {
+    "timestamp": r"\d{8}T\d{4,6}",
+    "serie_T": r"T\d+",
+    "sufijo_FT": r"\d+[FT]",
+    "numerico": r"\d+",
+}
+_ID = "|".join(BATCH_ID_FAMILIES.values())
+_END = r"(?![0-9A-Za-z])"
+
+# Nombre que empieza con "[masks_]batch_<ID>" o "masks_<timestamp>" (tras directorios)
+_LEADING_ID = re.compile(
+    rf"(?:[^/]*/)*(?:(?:masks[_\-])?batch[_\-]?(?P<id>(?:{_ID}){_END})"
+    rf"|masks[_\-](?P<stamp>{BATCH_ID_FAMILIES['timestamp']}{_END}))",
+    re.IGNORECASE
+)
+# Nombres libres: "batch_<ID>" en cualquier posición, como palabra propia
+_EMBEDDED_ID = re.compile(rf"(?<![0-9A-Za-z])batch[_\-]?(?P<id>(?:{_ID}){_END})", re.IGNORECASE)
+_FAMILY = {name: re.compile(pattern, re.IGNORECASE) for name, pattern in BATCH_ID_FAMILIES.items()}
+
+
+def _canonical(match):
+    return f"batch_{(match.group('id') or match.group('stamp')).upper()}"
+
+
+def extract_batch_id(filename):
+    """ID canónico ("batch_<ID>") mencionado en el nombre de archivo, o None"""
+    match = _LEADING_ID.match(filename or "") or _EMBEDDED_ID.search(filename or "")
+    return _canonical(match) if match else None
+
+
+def extract_batch_ids(filenames):
+    """extract_batch_id() para una lista de nombres (resultado alineado, None si no hay ID)"""
+    leading = _LEADING_ID.match
+    return [
+        _canonical(match) if (match := leading(name or "")) else extract_batch_id(name)
+        for name in filenames
+    ]
+
+
+def batch_id_family(batch_id):
+    """Familia de un ID de batch ("timestamp", "serie_T", "sufijo_FT", "numerico") o None"""
+    identifier = re.sub(r"^batch_", "", batch_id or "", flags=re.IGNORECASE)
+    for name, pattern in _FAMILY.items():
+        if pattern.fullmatch(identifier):
+            return name
+    return None
+
+
+def _naive_map(batch_ids, filenames):
+    """Asociación anterior (subcadena por cada par batch × archivo), solo para comparar"""
+    by_batch = {}
+    for batch_id in batch_ids:
+        identifier = batch_id.split("batch_", 1)[-1]
+        matches = [name for name in filenames if identifier in name]
+        if matches:
+            by_batch[batch_id] = matches
+    return by_batch
+
+
+def _benchmark_mapping(n_batches=3000):
+    batch_ids = [f"batch_{n}" for n in range(1, n_batches // 3 + 1)]
+    batch_ids += [f"batch_T{n:06d}" for n in range(1, n_batches // 3 + 1)]
+    batch_ids += [f"batch_2025{n % 10000:04d}T{n:04d}" for n in range(1, n_batches - len(batch_ids) + 1)]
+    filenames = [f"masks_{batch_ids[i % len(batch_ids)]}.tar.xz" for i in range(2 * n_batches)]
+    # Nombres con otros números: copias, partes y archivos sueltos que no son de un batch
+    adversarial = [
+        *((f"masks_{batch_id} (1).tar.xz", batch_id) for batch_id in batch_ids[:200]),
+        *((f"masks_{batch_id}_part_2.tar.xz", batch_id) for batch_id in batch_ids[:200]),
+        *((f"2025 report {n}.zip", None) for n in range(1, 200)),
+        ("t1.zip", None),
+    ]
+
+    started = time.perf_counter()
+    known = set(batch_ids)
+    by_batch = {}
+    for name, batch_id in zip(filenames, extract_batch_ids(filenames)):
+        if batch_id in known:
+            by_batch.setdefault(batch_id, []).append(name)
+    fast_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    naive = _naive_map(batch_ids, filenames)
+    naive_seconds = time.perf_counter() - started
+
+    false_positives = sum(len(naive.get(b, [])) - len(by_batch.get(b, [])) for b in batch_ids)
+    wrong = [name for (name, expected), found in zip(adversarial, extract_batch_ids(n for n, _ in adversarial))
+             if found != expected]
+    print(f"📊 {len(batch_ids)} batches × {len(filenames)} archivos")
+    print(f"   extract_batch_ids + dict:  {fast_seconds * 1000:8.1f} ms")
+    print(f"   Subcadena (antes):         {naive_seconds * 1000:8.1f} ms  ({false_positives} falsos positivos)")
+    print(f"   Aceleración: {naive_seconds / fast_seconds:.0f}x")
+    print(f"   Nombres con otros números: {len(wrong)}/{len(adversarial)} mal asociados {wrong[:3]}")
+
+
+def _benchmark(n_names=200000):
+    samples = [
+        "masks_batch_{n}.tar.xz", "masks_batch_T{n:06d}.tar.xz", "masks_batch_{n:06d}F.tar.xz",
+        "Batch_20250909T{n:04d}.tar.xz", "masks_2025100{d}T{n:06d}.tar.xz", "upload final batch-{n}.zip",
+        "{n}_backup.tar.xz",  # sin "batch": no es un batch
+    ]
+    names = [samples[i % len(samples)].format(n=i % 10000, d=i % 10) for i in range(n_names)]
+
+    # Antes: cada ruta con su propio patrón, aplicado nombre por nombre
+    started = time.perf_counter()
+    legacy = [re.findall(r'[Bb]atch[_\-]?(\d+)', name) for name in names]
+    legacy_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    single = [extract_batch_id(name) for name in names]
+    single_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    vectorized = extract_batch_ids(names)
+    vectorized_seconds = time.perf_counter() - started
+
+    assert single == vectorized
+    missed = sum(1 for ids in legacy if not ids)
+    print(f"📊 {n_names} nombres de archivo")
+    print(f"   Patrón anterior [Bb]atch[_-]?(\\d+): {n_names / legacy_seconds:>12,.0f} nombres/s ({missed} sin ID)")
+    print(f"   extract_batch_id (uno por uno):    {n_names / single_seconds:>12,.0f} nombres/s")
+    print(f"   extract_batch_ids (lista):          {n_names / vectorized_seconds:>12,.0f} nombres/s "
+          f"({sum(1 for i in vectorized if i is None)} sin ID)")
+
+
+if __name__ == "__main__":
+    _benchmark(*(int(arg) for arg in sys.argv[1:2]))
+    _benchmark_mapping(*(int(arg) for arg in sys.argv[2:3]))
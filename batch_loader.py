@@ -0,0 +1,234 @@
+"""
+Cargador de batches compartido (init-batches, reset-batches, upload)
+===================================================================
+
+- Lee manifiestos {"batches": [...]} (o un arreglo JSON / NDJSON) de forma
+  incremental, documento por documento, sin cargar el archivo completo.
+- Aplica los documentos en bloques con bulk_write de upserts por "id".
+- Modo "replace": carga en una colección staging y la intercambia con
+  renameCollection(dropTarget=True), así los lectores nunca ven la colección
+  vacía ni a medio cargar.
+"""
+
+import codecs
+import json
+from datetime import datetime
+
+from pymongo import ReplaceOne, UpdateOne
+
+READ_CHUNK_SIZE = 64 * 1024
+DEFAULT_CHUNK_SIZE = 1000
+
+_WHITESPACE = " \t\r\n"
+
+
+class _StreamBuffer:
+    """Buffer de texto sobre un archivo que se rellena a demanda"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+        # Decodificador incremental: un carácter UTF-8 puede quedar partido entre bloques
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+
+    def fill(self):
+        """Leer otro bloque; devuelve False si ya no hay datos"""
+        while not self.eof:
+            raw = self.fileobj.read(READ_CHUNK_SIZE)
+            chunk = self._decoder.decode(raw, final=not raw) if isinstance(raw, bytes) else raw
+            if not raw:
+                self.eof = True
+            if chunk:
+                # Descartar lo ya consumido para mantener la memoria acotada
+                self.text = self.text[self.pos:] + chunk
+                self.pos = 0
+                return True
+        return False
+
+    def peek(self):
+        """Siguiente carácter no blanco (sin consumirlo) o "" al final"""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"JSON inválido: se esperaba '{char}' en la posición {self.pos}")
+        self.pos += 1
+
+    def decode_value(self, decoder):
+        """Decodificar el siguiente valor JSON completo, leyendo más datos si está cortado"""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.text, self.pos)
+            except ValueError:
+                if not self.fill():
+                    raise ValueError(f"JSON inválido o truncado cerca de la posición {self.pos}")
+                continue
+            # Un número al final del buffer podría continuar en el siguiente bloque
+            if end == len(self.text) and self.text[end - 1] not in "}]\"" and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_manifest_batches(fileobj, key="batches"):
+    """Iterar los batches de un manifiesto {"batches": [...]} o de un arreglo JSON.
+
+    Las demás claves del objeto raíz (p. ej. "crew" en las exportaciones) se
+    saltan. Solo se mantiene en memoria el documento actual.
+    """
+    decoder = json.JSONDecoder()
+    buf = _StreamBuffer(fileobj)
+
+    first = buf.peek()
+    if first == "{":
+        buf.expect("{")
+        while True:
+            if buf.peek() == "}":
+                return  # Objeto sin la clave buscada
+            name = buf.decode_value(decoder)
+            buf.expect(":")
+            if name == key:
+                break
+            buf.decode_value(decoder)  # Saltar valor de otra clave
+            if buf.peek() == ",":
+                buf.expect(",")
+    elif first != "[":
+        raise ValueError("El manifiesto debe ser un objeto {\"batches\": [...]} o un arreglo JSON")
+
+    buf.expect("[")
+    if buf.peek() == "]":
+        return
+    while True:
+        yield buf.decode_value(decoder)
+        separator = buf.peek()
+        if separator == ",":
+            buf.expect(",")
+        elif separator == "]":
+            return
+        else:
+            raise ValueError(f"JSON inválido: se esperaba ',' o ']' en la posición {buf.pos}")
+
+
+def iter_ndjson_batches(fileobj):
+    """Iterar batches de un archivo NDJSON (un documento JSON por línea)"""
+    for line_number, line in enumerate(fileobj, start=1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8-sig" if line_number == 1 else "utf-8")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            raise ValueError(f"Línea {line_number} no es JSON válido")
+
+
+def iter_chunks(iterable, size):
+    """Agrupar un iterable en listas de `size` elementos"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _checked(batches):
+    for index, batch in enumerate(batches):
+        if not isinstance(batch, dict) or not batch.get("id"):
+            raise ValueError(f"Batch inválido en índice {index}: falta 'id'")
+        batch.pop("_id", None)
+        yield batch
+
+
+def upsert_batches(collection, batches, overwrite=False, extra_fields=None,
+                   chunk_size=DEFAULT_CHUNK_SIZE, on_progress=None, on_insert=None):
+    """Aplicar batches con bulk_write por bloques, con upsert por "id".
+
+    overwrite=False: solo inserta los que no existen ($setOnInsert); los
+    existentes no se tocan. overwrite=True: reemplaza el documento completo.
+    on_insert(lista) recibe, por bloque, los documentos que resultaron nuevos.
+
+    Devuelve {"processed", "inserted", "matched", "inserted_ids", "updated_ids"}.
+    """
+    extra_fields = extra_fields or {}
+    stats = {"processed": 0, "inserted": 0, "matched": 0, "inserted_ids": [], "updated_ids": []}
+
+    for chunk in iter_chunks(_checked(batches), chunk_size):
+        if overwrite:
+            operations = [ReplaceOne({"id": b["id"]}, {**b, **extra_fields}, upsert=True) for b in chunk]
+        else:
+            operations = [UpdateOne({"id": b["id"]}, {"$setOnInsert": {**b, **extra_fields}}, upsert=True)
+                          for b in chunk]
+        result = collection.bulk_write(operations, ordered=False)
+
+        upserted_indexes = set(result.upserted_ids)
+        stats["inserted_ids"].extend(chunk[i]["id"] for i in upserted_indexes)
+        if on_insert and upserted_indexes:
+            on_insert([chunk[i] for i in upserted_indexes])
+        if overwrite:
+            stats["updated_ids"].extend(b["id"] for i, b in enumerate(chunk) if i not in upserted_indexes)
+        stats["processed"] += len(chunk)
+        stats["inserted"] += result.upserted_count
+        stats["matched"] += result.matched_count
+        if on_progress:
+            on_progress(stats["processed"])
+
+    return stats
+
+
+def _copy_indexes(source, target):
+    """Recrear en `target` los índices de `source` (renameCollection conserva los del origen)"""
+    for name, info in source.index_information().items():
+        if name == "_id_":
+            continue
+        options = {k: v for k, v in info.items() if k in ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")}
+        target.create_index(info["key"], name=name, **options)
+
+
+def replace_collection(db, collection_name, batches, extra_fields=None,
+                       chunk_size=DEFAULT_CHUNK_SIZE, on_progress=None, staging_name=None):
+    """Cargar batches en una colección staging e intercambiarla atómicamente.
+
+    Los lectores siguen viendo la colección anterior completa hasta el
+    renameCollection. Si algo falla, la staging se elimina y no cambia nada.
+    `staging_name` permite a quien llama fijar (y luego limpiar) su propia staging.
+    Devuelve {"processed", "inserted", "inserted_ids"}.
+    """
+    extra_fields = extra_fields or {}
+    staging_name = staging_name or f"{collection_name}_staging_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    staging = db[staging_name]
+    target = db[collection_name]
+    stats = {"processed": 0, "inserted": 0, "inserted_ids": []}
+
+    try:
+        # Índices primero: el único de "id" rechaza duplicados del manifiesto
+        _copy_indexes(target, staging)
+        if "id_1" not in staging.index_information():
+            staging.create_index("id", unique=True)
+
+        for chunk in iter_chunks(_checked(batches), chunk_size):
+            staging.insert_many([{**b, **extra_fields} for b in chunk], ordered=True)
+            stats["inserted_ids"].extend(b["id"] for b in chunk)
+            stats["processed"] += len(chunk)
+            stats["inserted"] += len(chunk)
+            if on_progress:
+                on_progress(stats["processed"])
+
+        staging.rename(collection_name, dropTarget=True)
+    except Exception:
+        staging.drop()
+        raise
+
+    return stats
@@ -0,0 +1,75 @@
+"""
+Motor de métricas de batches
+============================
+
+Un solo punto de cálculo para overview, team, stats, batch-assignment y la
+exportación de asignaciones:
+
+- Si solo se piden conteos, se leen de batch_counters (sin recorrer batches).
+- Si faltan los contadores o se piden patrones de ID, se calcula todo en UNA
+  agregación $facet sobre batches; la faceta "counts" usa la misma etapa $group que rebuild_counters.
+
+El resultado siempre tiene la misma forma:
+
+    {"total", "unassigned", "by_status": {status: n},
+     "by_assignee": {assignee|None: {"total": n, "by_status": {status: n}}},
+     "source": "counters" | "facet", ["id_patterns"]}
+"""
+
+from batch_counters import COUNTS_GROUP_STAGE, read_counters
+
+# Clasificación de IDs por prefijo (mismos nombres que usaba /api/data/batches/stats)
+_ID_PATTERN = {
+    "$switch": {
+        "branches": [
+            {"case": {"$eq": [{"$substrCP": [{"$ifNull": ["$id", ""]}, 0, 7]}, "batch_T"]}, "then": "batch_T000XXX"},
+            {"case": {"$eq": [{"$substrCP": [{"$ifNull": ["$id", ""]}, 0, 9]}, "batch_000"]}, "then": "batch_000XXX"},
+            {"case": {"$eq": [{"$substrCP": [{"$ifNull": ["$id", ""]}, 0, 10]}, "batch_2025"]}, "then": "batch_2025XXXXXXXX"},
+        ],
+        "default": "otros"
+    }
+}
+
+
+def summarize_counts(rows):
+    """Agrupar filas {"assignee", "status", "count"} en totales globales y por assignee"""
+    summary = {"total": 0, "unassigned": 0, "by_status": {}, "by_assignee": {}}
+    for row in rows:
+        assignee, status, count = row["assignee"], row["status"], row["count"]
+        summary["total"] += count
+        summary["by_status"][status] = summary["by_status"].get(status, 0) + count
+        if assignee is None:
+            summary["unassigned"] += count
+        member = summary["by_assignee"].setdefault(assignee, {"total": 0, "by_status": {}})
+        member["total"] += count
+        member["by_status"][status] = member["by_status"].get(status, 0) + count
+    return summary
+
+
+def compute_batch_metrics(batches, counters=None, id_patterns=False):
+    """Calcular métricas de batches con a lo sumo una agregación.
+
+    batches: colección batches. counters: colección batch_counters (o None).
+    id_patterns: agregar conteo por formato de ID.
+    """
+    if counters is not None and not id_patterns:
+        rows = read_counters(counters)
+        # Contadores vacíos con batches existentes = aún no construidos: usar $facet
+        if rows or batches.estimated_document_count() == 0:
+            summary = summarize_counts(rows)
+            summary["source"] = "counters"
+            return summary
+
+    facets = {"counts": [COUNTS_GROUP_STAGE]}
+    if id_patterns:
+        facets["id_patterns"] = [{"$group": {"_id": _ID_PATTERN, "count": {"$sum": 1}}}]
+
+    result = next(batches.aggregate([{"$facet": facets}], allowDiskUse=True), {})
+    summary = summarize_counts(
+        {"assignee": row["_id"]["assignee"], "status": row["_id"]["status"], "count": row["count"]}
+        for row in result.get("counts", [])
+    )
+    summary["source"] = "facet"
+    if id_patterns:
+        summary["id_patterns"] = {row["_id"]: row["count"] for row in result.get("id_patterns", [])}
+    return summary
@@ -3,28 +3,25 @@
 Cargar batches nuevos T000169-T000268 a MongoDB
 """
 import requests
-import json
 
 API_BASE = "http://localhost:5000/api"
 
-# Leer el archivo JSON
-with open('nuevos_batches_T169-268.json', 'r') as f:
-    data = json.load(f)
-
-# Agregar modo "add" para no reemplazar
-data['mode'] = 'add'
+# Rango de batches: el servidor lo expande (no hace falta enviar el JSON completo)
+BATCH_RANGE = "batch_T000169..batch_T000268"
 
 print("🚀 Cargando 100 batches nuevos (T000169 - T000268)...")
 
 response = requests.post(
-    f"{API_BASE}/data/batches/upload",
-    json=data,
+    f"{API_BASE}/batches/quick-create",
+    json={"batch_list": BATCH_RANGE},
     headers={"Content-Type": "application/json"}
 )
 
 if response.status_code == 200:
     result = response.json()
-    print(f"✅ {result['inserted_count']} batches cargados exitosamente a MongoDB")
+    print(f"✅ {len(result['created'])} batches cargados exitosamente a MongoDB")
+    if result['skipped']:
+        print(f"⏭️ {len(result['skipped'])} ya existían")
 else:
     print(f"❌ Error: {response.status_code}")
     print(response.text)
@@ -0,0 +1,106 @@
+"""
+Notificador de cambios de batches para el stream SSE (/api/stream/batches)
+=========================================================================
+
+Un solo hilo por worker de gunicorn observa la versión publicada de batches
+(counters._id="batches_version", campo `published`) y despierta a todas las
+conexiones SSE abiertas en ese worker. Así, con 20+ pestañas abiertas, Mongo
+recibe una sola lectura por worker en lugar de una por pestaña.
+
+- Replica set: change stream sobre el documento de versión (push real).
+- Servidor standalone: lectura por _id cada POLL_SECONDS.
+
+Se observa la versión publicada y no las inserciones de `batch_changes`: cada
+escritura deja primero una entrada "pending" y solo cuenta para los clientes
+cuando se cierra y la versión publicada la alcanza.
+"""
+
+import os
+import threading
+import time
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+POLL_SECONDS = float(os.environ.get("SSE_POLL_SECONDS", "1.0"))
+
+
+VERSION_ID = "batches_version"
+
+
+class BatchChangeNotifier:
+    """Hilo observador de la versión publicada de batches que notifica la última vista"""
+
+    def __init__(self, collection_getter):
+        # collection_getter: función que devuelve la colección counters (o None)
+        self._collection_getter = collection_getter
+        self._condition = threading.Condition()
+        self._latest_seq = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.mode = None  # "change_stream" | "polling"
+
+    def ensure_started(self):
+        """Arrancar el hilo observador la primera vez que se necesita"""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="batch-change-notifier", daemon=True
+                )
+                self._thread.start()
+
+    def wait_for_change(self, after_seq, timeout):
+        """Esperar hasta que exista una secuencia > after_seq; devuelve la última o None"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._latest_seq is None or self._latest_seq <= after_seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            return self._latest_seq
+
+    def _publish(self, seq):
+        with self._condition:
+            if self._latest_seq is None or seq > self._latest_seq:
+                self._latest_seq = seq
+                self._condition.notify_all()
+
+    def _read_latest(self, collection):
+        doc = collection.find_one({"_id": VERSION_ID}, {"published": 1})
+        return (doc or {}).get("published") or 0
+
+    def _run(self):
+        while True:
+            collection = self._collection_getter()
+            if collection is None:
+                time.sleep(5)
+                continue
+            try:
+                self._publish(self._read_latest(collection))
+                try:
+                    self._watch(collection)
+                except OperationFailure as e:
+                    # 40573: $changeStream solo está soportado en replica sets
+                    print(f"ℹ️ Change streams no disponibles ({e.code}), usando polling de la versión")
+                    self._poll(collection)
+            except PyMongoError as e:
+                print(f"⚠️ Notificador de cambios: {e}; reintentando en 5s")
+                time.sleep(5)
+
+    def _watch(self, collection):
+        pipeline = [{"$match": {
+            "documentKey._id": VERSION_ID,
+            "updateDescription.updatedFields.published": {"$exists": True}
+        }}]
+        with collection.watch(pipeline, max_await_time_ms=15000) as stream:
+            self.mode = "change_stream"
+            print("✅ Notificador de cambios usando change stream")
+            for change in stream:
+                self._publish(change["updateDescription"]["updatedFields"]["published"])
+
+    def _poll(self, collection):
+        self.mode = "polling"
+        while True:
+            latest = self._read_latest(collection)
+            self._publish(latest)
+            time.sleep(POLL_SECONDS)
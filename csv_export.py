@@ -0,0 +1,67 @@
+"""
+Exportación CSV en streaming
+============================
+
+iter_csv() genera el archivo por trozos para una Response de Flask: el primer
+trozo (BOM UTF-8 para Excel + encabezado) sale de inmediato y las filas se
+agrupan en bloques de ~64 KB a medida que llegan del cursor de Mongo. La
+memoria usada no depende del tamaño de la exportación.
+
+Una columna con muchos valores (p. ej. todos los IDs de un segmentador) se
+pasa como ListCell y se escribe por partes dentro de un campo entre comillas.
+"""
+
+import csv
+import io
+
+CSV_BOM = "\ufeff"
+FLUSH_CHARS = 64 * 1024
+
+
+class ListCell:
+    """Última columna de una fila: valores unidos por `separator`, escritos sin armar la cadena completa"""
+
+    def __init__(self, values, separator=", "):
+        self.values = values
+        self.separator = separator
+
+
+def _drain(buffer):
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+def iter_csv(header, rows, bom=True):
+    """Generar el CSV (str) por trozos a partir de `rows` (iterable de listas)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    prefix_writer = csv.writer(buffer, lineterminator="")
+    if bom:
+        buffer.write(CSV_BOM)
+    writer.writerow(header)
+    yield _drain(buffer)
+
+    for row in rows:
+        if row and isinstance(row[-1], ListCell):
+            cell = row[-1]
+            if len(row) > 1:
+                prefix_writer.writerow(row[:-1])
+                buffer.write(",")
+            buffer.write('"')
+            for i, value in enumerate(cell.values):
+                if i:
+                    buffer.write(cell.separator)
+                buffer.write(str(value).replace('"', '""'))
+                if buffer.tell() >= FLUSH_CHARS:
+                    yield _drain(buffer)
+            buffer.write('"\r\n')
+        else:
+            writer.writerow(row)
+        if buffer.tell() >= FLUSH_CHARS:
+            yield _drain(buffer)
+
+    rest = _drain(buffer)
+    if rest:
+        yield rest
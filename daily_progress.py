@@ -0,0 +1,115 @@
+"""
+Rollup diario de progreso (colección daily_progress)
+====================================================
+
+Un documento por (fecha de asignación, assignee):
+
+    {"_id": {"date": "2025-10-15", "assignee": "Flor"},
+     "date": "2025-10-15", "assignee": "Flor", "total": 12, "S": 7, "FS": 2, "NS": 3}
+
+La fecha es metadata.assigned_at (null si falta o está vacía) y el assignee se
+normaliza igual que en batch_counters (en blanco = null). Las rutas de
+escritura aplican $inc con el estado anterior y el nuevo de cada batch, como
+en batch_counters; /api/metrics/progress y /api/metrics/export leen rangos de
+fechas por índice en lugar de agrupar toda la colección.
+
+- compact_daily_progress(): borra las filas que quedaron en cero (nocturno).
+- rebuild_daily_progress(): recalcula todo con $group + $out.
+"""
+
+from collections import Counter
+
+from pymongo import UpdateOne
+
+from batch_counters import NORMALIZED_ASSIGNEE, counter_key
+
+DAILY_PROGRESS_COLLECTION = "daily_progress"
+TRACKED_STATUSES = ("S", "FS", "NS")
+
+_NORMALIZED_DATE = {
+    "$cond": [{"$eq": [{"$ifNull": ["$metadata.assigned_at", ""]}, ""]}, None, "$metadata.assigned_at"]
+}
+
+
+def progress_key(batch):
+    """Clave (fecha, assignee) del rollup para un batch"""
+    date = (batch.get("metadata") or {}).get("assigned_at") or None
+    assignee, _ = counter_key(batch)
+    return date, assignee
+
+
+def apply_progress_changes(collection, removed=(), added=()):
+    """Restar los batches `removed` y sumar los `added` en el rollup (una sola bulk_write)"""
+    deltas = {}
+    for sign, batches in ((-1, removed), (1, added)):
+        for batch in batches:
+            fields = deltas.setdefault(progress_key(batch), Counter())
+            fields["total"] += sign
+            status = batch.get("status")
+            if status in TRACKED_STATUSES:
+                fields[status] += sign
+
+    operations = []
+    for (date, assignee), fields in deltas.items():
+        changes = {field: delta for field, delta in fields.items() if delta}
+        if changes:
+            operations.append(UpdateOne(
+                {"_id": {"date": date, "assignee": assignee}},
+                {"$inc": changes, "$setOnInsert": {"date": date, "assignee": assignee}},
+                upsert=True
+            ))
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def read_daily_progress(collection, from_date=None, to_date=None, assignees=None, dated_only=False):
+    """Filas del rollup ordenadas por fecha y assignee, filtradas por rango (índice date+assignee)"""
+    return list(find_daily_progress(collection, from_date, to_date, assignees, dated_only))
+
+
+def find_daily_progress(collection, from_date=None, to_date=None, assignees=None, dated_only=False):
+    """Cursor con las mismas filas que read_daily_progress (para exportar en streaming)"""
+    query = {"total": {"$gt": 0}}
+    date_filter = {}
+    if from_date:
+        date_filter["$gte"] = from_date
+    if to_date:
+        date_filter["$lte"] = to_date
+    if dated_only:
+        date_filter["$ne"] = None
+    if date_filter:
+        query["date"] = date_filter
+    if assignees:
+        query["assignee"] = {"$in": list(assignees)}
+    return collection.find(query, {"_id": 0}).sort([("date", 1), ("assignee", 1)])
+
+
+def compact_daily_progress(collection):
+    """Borrar filas sin batches (quedan tras reasignaciones y borrados); devuelve cuántas"""
+    return collection.delete_many({"total": {"$lte": 0}}).deleted_count
+
+
+def rebuild_daily_progress(db, batches_name="batches"):
+    """Recalcular daily_progress desde cero ($out conserva los índices existentes)"""
+    group = {
+        "_id": {"date": _NORMALIZED_DATE, "assignee": NORMALIZED_ASSIGNEE},
+        "total": {"$sum": 1},
+    }
+    for status in TRACKED_STATUSES:
+        group[status] = {"$sum": {"$cond": [{"$eq": ["$status", status]}, 1, 0]}}
+    db[batches_name].aggregate([
+        {"$group": group},
+        {"$addFields": {"date": "$_id.date", "assignee": "$_id.assignee"}},
+        {"$out": DAILY_PROGRESS_COLLECTION}
+    ])
+    return db[DAILY_PROGRESS_COLLECTION].count_documents({})
+
+
+def ensure_daily_progress(db, batches_name="batches"):
+    """Construir el rollup si aún no existe (primer arranque tras el despliegue)"""
+    if db[DAILY_PROGRESS_COLLECTION].estimated_document_count() == 0 and db[batches_name].estimated_document_count() > 0:
+        print("📅 daily_progress vacío, reconstruyendo desde batches...")
+        rebuild_daily_progress(db, batches_name)
+        return True
+    return False
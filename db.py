@@ -1,11 +1,15 @@
 import os
-from pymongo import MongoClient, ASCENDING
+from pymongo import MongoClient, ASCENDING, DESCENDING
 
 # Conexión principal (puerto 27017) - Para segmentacion_db y Quality_dashboard
 MONGO_URI = os.environ.get("MONGO_URI", "mongodb://192.168.1.93:27017")
 DB_NAME = os.environ.get("MONGO_DB", "segmentacion_db")
 QUALITY_DB_NAME = "Quality_dashboard"  # Base para segmentadores
 
+# Retención del log de cambios (feed de deltas /api/batches/changes)
+BATCH_CHANGES_RETENTION_DAYS = int(os.environ.get("BATCH_CHANGES_RETENTION_DAYS", "7"))
+JOBS_RETENTION_DAYS = int(os.environ.get("JOBS_RETENTION_DAYS", "7"))
+
 # Conexión secundaria - Para QUALITY_IEMSA (máscaras en training_metrics.masks.files)
 # Ahora en el mismo servidor que la conexión principal
 TRAINING_MONGO_URI = os.environ.get(
@@ -24,7 +28,7 @@ def get_client():
         _client = MongoClient(
             MONGO_URI,
             serverSelectionTimeoutMS=5000,
-            maxPoolSize=20,  # Máximo 20 conexiones en el pool (4 workers x 3 threads = 12, +8 buffer)
+            maxPoolSize=20,  # Máximo 20 conexiones por worker (8 threads + notificador SSE + buffer)
             minPoolSize=5,   # Mínimo 5 conexiones siempre abiertas
             maxIdleTimeMS=30000,  # Cerrar conexiones inactivas después de 30s
             connectTimeoutMS=5000,  # Timeout de conexión
@@ -73,12 +77,47 @@ def create_indexes():
         # ÍNDICES COMPUESTOS (queries 5-10x más rápidas)
         batches.create_index([("assignee", ASCENDING), ("status", ASCENDING)], background=True)
         batches.create_index([("status", ASCENDING), ("metadata.assigned_at", ASCENDING)], background=True)
+        # Top-N recientes por assignee (/api/metrics/team): consulta cubierta, lee solo N entradas
+        batches.create_index(
+            [("assignee", ASCENDING), ("metadata.assigned_at", DESCENDING), ("id", ASCENDING)],
+            background=True
+        )
+
+        # Exportaciones CSV por segmentador: IDs ordenados desde el índice, sin ordenar en memoria
+        batches.create_index([("assignee", ASCENDING), ("id", ASCENDING)], background=True)
+
+        # LOG DE CAMBIOS: lectura por secuencia y expiración automática (TTL)
+        changes = db["batch_changes"]
+        changes.create_index([("seq", ASCENDING)], unique=True, background=True)
+        changes.create_index(
+            [("ts", ASCENDING)],
+            expireAfterSeconds=BATCH_CHANGES_RETENTION_DAYS * 86400,
+            background=True
+        )
+
+        # ROLLUP DIARIO: lectura por rango de fechas en /api/metrics/progress y export
+        db["daily_progress"].create_index([("date", ASCENDING), ("assignee", ASCENDING)], background=True)
+
+        # EVENTOS DE TRANSICIÓN: throughput por persona y por rango de fechas
+        events = db["batch_events"]
+        events.create_index([("assignee", ASCENDING), ("ts", ASCENDING)], background=True)
+        events.create_index([("ts", ASCENDING)], background=True)
+
+        # ÍNDICE DE MÁSCARAS: upsert por archivo y join por batch_id en la sincronización
+        mask_index = db["mask_index"]
+        mask_index.create_index([("file_id", ASCENDING)], unique=True, background=True)
+        mask_index.create_index([("batch_id", ASCENDING), ("uploadDate", DESCENDING)], background=True)
+
+        # TRABAJOS EN SEGUNDO PLANO: cola por antigüedad y expiración 7 días después de terminar
+        jobs = db["jobs"]
+        jobs.create_index([("status", ASCENDING), ("created_at", ASCENDING)], background=True)
+        jobs.create_index([("finished_at", ASCENDING)], expireAfterSeconds=JOBS_RETENTION_DAYS * 86400, background=True)
 
         # ÍNDICES PARA BÚSQUEDA DE METADATA DE ARCHIVOS
         masks.create_index([("filename", ASCENDING)], background=True)
         masks.create_index([("uploadDate", ASCENDING)], background=True)
 
-        print("✅ Índices optimizados creados (8 índices)")
+        print("✅ Índices optimizados creados (19 índices)")
     except Exception as e:
         print("⚠️ No se pudieron crear índices:", e)
 
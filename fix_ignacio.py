@@ -22,26 +22,33 @@ print("=" * 60)
 print("PASO 1: Desasignando batches incorrectos...")
 print("=" * 60)
 
-for batch_id in batches_incorrectos:
-    update_data = {
-        "assignee": None,  # Desasignar
-        "metadata": {
-            "assigned_at": None
-        }
+update_data = {
+    "assignee": None,  # Desasignar
+    "metadata": {
+        "assigned_at": None
     }
+}
 
+def bulk_update(batch_ids, update_data, mensaje_ok):
+    """Aplicar el mismo cambio a varios batches en una sola petición"""
     try:
-        response = requests.put(
-            f"{API_BASE}/batches/{batch_id}",
-            json=update_data,
+        response = requests.patch(
+            f"{API_BASE}/batches/bulk",
+            json={"operations": [{"id": batch_id, "set": update_data} for batch_id in batch_ids]},
             headers={"Content-Type": "application/json"}
         )
         if response.status_code == 200:
-            print(f"   ✅ {batch_id} desasignado")
+            for item in response.json()["results"]:
+                if item["success"]:
+                    print(f"   ✅ {item['id']} {mensaje_ok}")
+                else:
+                    print(f"   ❌ Error {item['id']}: {item.get('error')}")
         else:
-            print(f"   ❌ Error {batch_id}: {response.status_code}")
+            print(f"   ❌ Error: {response.status_code}")
     except Exception as e:
-        print(f"   ❌ Error {batch_id}: {e}")
+        print(f"   ❌ Error: {e}")
+
+bulk_update(batches_incorrectos, update_data, "desasignado")
 
 print()
 
@@ -59,26 +66,14 @@ print("=" * 60)
 print("PASO 2: Asignando batches correctos a Ignacio...")
 print("=" * 60)
 
-for batch_id in batches_correctos:
-    update_data = {
-        "assignee": "Ignacio",
-        "metadata": {
-            "assigned_at": "2025-10-15"
-        }
+update_data = {
+    "assignee": "Ignacio",
+    "metadata": {
+        "assigned_at": "2025-10-15"
     }
+}
 
-    try:
-        response = requests.put(
-            f"{API_BASE}/batches/{batch_id}",
-            json=update_data,
-            headers={"Content-Type": "application/json"}
-        )
-        if response.status_code == 200:
-            print(f"   ✅ {batch_id} asignado a Ignacio")
-        else:
-            print(f"   ❌ Error {batch_id}: {response.status_code}")
-    except Exception as e:
-        print(f"   ❌ Error {batch_id}: {e}")
+bulk_update(batches_correctos, update_data, "asignado a Ignacio")
 
 print()
 print("=" * 60)
@@ -13,14 +13,20 @@ import os
 # Esto deja recursos para: sistema operativo, MongoDB, y otros procesos
 workers = int(os.environ.get("GUNICORN_WORKERS", 4))
 
-# WORKER CLASS: Sync workers (compatible con MongoDB)
-worker_class = "sync"
+# WORKER CLASS: gthread (hilos sobre workers sync, compatible con MongoDB)
+# Necesario para el stream SSE (/api/stream/batches): cada conexión abierta ocupa
+# un hilo y en gthread el `timeout` vigila al worker, no a cada petición larga.
+worker_class = "gthread"
 
-# THREADS por worker: OPTIMIZADO para mejor concurrencia sin sobrecargar
-# 3 threads por worker = 12 conexiones totales (4 workers x 3 threads)
-threads = 3
+# THREADS por worker: 8 threads = 32 conexiones totales (4 workers x 8 threads)
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
 
-# TIMEOUT: Aumentado para operaciones pesadas (sync-batch-files)
+# SSE: máximo de streams por worker, dejando 3 hilos libres para peticiones normales
+os.environ.setdefault("SSE_MAX_STREAMS", str(max(1, threads - 3)))
+
+# TIMEOUT: La sincronización de máscaras la ejecuta el planificador y las cargas,
+# borrados masivos, auto-creación y respaldos corren como trabajos (colección jobs);
+# el margen queda para recibir archivos grandes, que se guardan en disco antes de encolar.
 timeout = 120  # 2 minutos
 
 # BINDING
@@ -29,6 +35,8 @@ bind = os.environ.get("BIND_ADDRESS", "0.0.0.0:5000")
 # MEMORIA: Límite REDUCIDO para reciclar workers más frecuentemente (previene memory leaks)
 max_requests = 500  # Recicla workers más seguido para liberar memoria
 max_requests_jitter = 50  # Variación aleatoria para evitar restarts simultáneos
+# Un trabajo en curso en un worker reciclado lo retoma otro worker cuando su
+# heartbeat vence (JOBS_STALE_SECONDS, ver jobs.py)
 
 # LOGGING
 accesslog = "-"  # stdout
@@ -54,6 +62,9 @@ print(f"""
 ╟──────────────────────────────────────────────────────────╢
 ║  Workers:              {workers} (aprovecha {workers} de 12 hilos)       ║
 ║  Threads por worker:   {threads}                                    ║
+║  Streams SSE/worker:   {os.environ["SSE_MAX_STREAMS"]}                                    ║
+║  Caché métricas (TTL): {os.environ.get("METRICS_CACHE_TTL", "60")}s, compartida entre workers     ║
+║  Sync máscaras:        cada {os.environ.get("MASK_SYNC_INTERVAL_MINUTES", "15")} min, un solo worker            ║
 ║  Total capacidad:      {workers * threads} conexiones concurrentes      ║
 ║  Timeout:              {timeout}s                                ║
 ║  Bind:                 {bind}                      ║
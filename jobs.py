@@ -0,0 +1,220 @@
+"""
+Trabajos en segundo plano persistentes (colección jobs)
+=======================================================
+
+Las operaciones largas (carga de batches, borrado por filtro, auto-creación,
+respaldo completo) no corren dentro de la petición: el POST crea un documento
+en `jobs` y devuelve su id, y GET /api/jobs/<id> muestra estado, progreso y
+resultado desde cualquier worker.
+
+    {"_id": "job_3f2a...", "kind": "batches_upload", "status": "queued|running|done|error",
+     "params": {...}, "progress": {"processed": 1200}, "checkpoint": {...},
+     "result": {...}, "error": null, "attempts": 1, "owner": "host:pid",
+     "created_at", "started_at", "heartbeat_at", "finished_at"}
+
+Cada worker tiene un ThreadPoolExecutor (JOBS_MAX_WORKERS hilos) y un hilo que
+cada POLL_SECONDS renueva heartbeat_at de sus trabajos en curso y toma, con
+find_one_and_update, los trabajos en cola o los "running" cuyo heartbeat venció
+(el worker que los corría fue reciclado por max_requests o murió).
+
+Al retomar un trabajo, el handler recibe el checkpoint guardado y
+`ctx.resumed` en True: continúa desde ahí o rehace lo que sea idempotente.
+Después de MAX_ATTEMPTS intentos el trabajo queda en error. Un handler puede
+registrar una función de limpieza (archivos temporales, staging) que corre
+cuando el trabajo termina en error o se abandona. Solo Mongo e hilos locales
+(sin Redis ni Celery).
+"""
+
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+JOBS_COLLECTION = "jobs"
+MAX_WORKERS = int(os.environ.get("JOBS_MAX_WORKERS", "2"))
+POLL_SECONDS = float(os.environ.get("JOBS_POLL_SECONDS", "5"))
+STALE_SECONDS = int(os.environ.get("JOBS_STALE_SECONDS", "60"))
+MAX_ATTEMPTS = 3
+
+
+class JobContext:
+    """Lo que recibe un handler: parámetros, checkpoint y funciones para reportar avance"""
+
+    def __init__(self, runner, job):
+        self._runner = runner
+        self.id = job["_id"]
+        self.kind = job["kind"]
+        self.params = job.get("params") or {}
+        self.checkpoint = job.get("checkpoint") or {}
+        self.attempt = job.get("attempts", 1)
+
+    @property
+    def resumed(self):
+        """True si un intento anterior quedó a medias"""
+        return self.attempt > 1
+
+    def progress(self, **counters):
+        """Guardar contadores de avance (visibles en GET /api/jobs/<id>)"""
+        self._runner._update(self.id, {f"progress.{key}": value for key, value in counters.items()})
+
+    def save_checkpoint(self, **fields):
+        """Guardar el punto desde el que se puede retomar el trabajo"""
+        self.checkpoint.update(fields)
+        self._runner._update(self.id, {f"checkpoint.{key}": value for key, value in fields.items()})
+
+
+class JobRunner:
+    """Ejecutor de trabajos por worker: cola en Mongo + ThreadPoolExecutor local"""
+
+    def __init__(self, collection_getter, max_workers=MAX_WORKERS, after_job=None):
+        # collection_getter: función que devuelve la colección jobs (o None)
+        # after_job: limpieza por hilo al terminar cada trabajo (también si falla)
+        self._collection_getter = collection_getter
+        self._after_job = after_job
+        self.max_workers = max_workers
+        self._handlers = {}
+        self._cleanups = {}
+        self._active = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._executor = None
+        self._thread = None
+        self.owner = None
+
+    def handler(self, kind, cleanup=None):
+        """Decorador: registrar la función que ejecuta los trabajos de tipo `kind`.
+
+        `cleanup(ctx)` se llama si el trabajo termina en error o se abandona.
+        """
+        def register(func):
+            self._handlers[kind] = func
+            if cleanup:
+                self._cleanups[kind] = cleanup
+            return func
+        return register
+
+    def ensure_started(self):
+        """Arrancar el pool y el hilo de la cola (una vez por proceso, después del fork)"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self.owner = f"{socket.gethostname()}:{os.getpid()}"
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+                self._thread = threading.Thread(target=self._loop, name="job-runner", daemon=True)
+                self._thread.start()
+
+    def submit(self, kind, params=None):
+        """Encolar un trabajo; lo toma el primer worker con un hilo libre. Devuelve el documento"""
+        if kind not in self._handlers:
+            raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+        job = {
+            "_id": f"job_{uuid.uuid4().hex}",
+            "kind": kind,
+            "status": "queued",
+            "params": params or {},
+            "progress": {},
+            "checkpoint": {},
+            "result": None,
+            "error": None,
+            "attempts": 0,
+            "created_at": datetime.utcnow(),
+        }
+        self._collection_getter().insert_one(job)
+        self._wake.set()
+        return job
+
+    def get(self, job_id):
+        return self._collection_getter().find_one({"_id": job_id})
+
+    def _update(self, job_id, fields):
+        self._collection_getter().update_one(
+            {"_id": job_id, "owner": self.owner},
+            {"$set": {**fields, "heartbeat_at": datetime.utcnow()}}
+        )
+
+    def _claim(self, collection):
+        now = datetime.utcnow()
+        return collection.find_one_and_update(
+            {
+                "kind": {"$in": list(self._handlers)},
+                "$or": [
+                    {"status": "queued"},
+                    {"status": "running", "heartbeat_at": {"$lt": now - timedelta(seconds=STALE_SECONDS)}}
+                ]
+            },
+            {
+                "$set": {"status": "running", "owner": self.owner, "started_at": now, "heartbeat_at": now},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _finish(self, job_id, status, **fields):
+        self._collection_getter().update_one(
+            {"_id": job_id, "owner": self.owner},
+            {"$set": {"status": status, "finished_at": datetime.utcnow(), **fields}}
+        )
+
+    def _cleanup(self, job):
+        cleanup = self._cleanups.get(job["kind"])
+        if cleanup is None:
+            return
+        try:
+            # Releer: el checkpoint pudo cambiar durante la ejecución
+            cleanup(JobContext(self, self.get(job["_id"]) or job))
+        except Exception as e:
+            print(f"⚠️ No se pudo limpiar el trabajo {job['_id']}: {e}")
+
+    def _execute(self, job):
+        try:
+            if job["attempts"] > MAX_ATTEMPTS:
+                self._finish(job["_id"], "error", error=f"Abandonado tras {MAX_ATTEMPTS} intentos")
+                self._cleanup(job)
+                return
+            if job["attempts"] > 1:
+                print(f"♻️ Retomando trabajo {job['_id']} ({job['kind']}, intento {job['attempts']})")
+            result = self._handlers[job["kind"]](JobContext(self, job))
+            self._finish(job["_id"], "done", result=result, error=None)
+        except Exception as e:
+            print(f"❌ Trabajo {job['_id']} ({job['kind']}) falló: {e}")
+            try:
+                self._finish(job["_id"], "error", error=str(e))
+            except PyMongoError as db_error:
+                print(f"⚠️ No se pudo registrar el error del trabajo {job['_id']}: {db_error}")
+            self._cleanup(job)
+        finally:
+            if self._after_job:
+                self._after_job()
+            with self._lock:
+                self._active.discard(job["_id"])
+            self._wake.set()
+
+    def _loop(self):
+        while True:
+            collection = self._collection_getter()
+            if collection is not None:
+                try:
+                    with self._lock:
+                        active = list(self._active)
+                    if active:
+                        collection.update_many(
+                            {"_id": {"$in": active}, "owner": self.owner},
+                            {"$set": {"heartbeat_at": datetime.utcnow()}}
+                        )
+                    while len(active) < self.max_workers:
+                        job = self._claim(collection)
+                        if job is None:
+                            break
+                        with self._lock:
+                            self._active.add(job["_id"])
+                            active = list(self._active)
+                        self._executor.submit(self._execute, job)
+                except PyMongoError as e:
+                    print(f"⚠️ Cola de trabajos: {e}")
+            self._wake.wait(POLL_SECONDS)
+            self._wake.clear()
@@ -0,0 +1,153 @@
+"""
+Índice de máscaras por batch (colección mask_index en segmentacion_db)
+======================================================================
+
+Cada archivo de QUALITY_IEMSA.training_metrics.masks.files se lee UNA vez: su
+nombre se interpreta al indexarlo y queda
+
+    {"file_id": ObjectId, "filename": "masks_batch_T000044.tar.xz",
+     "batch_id": "batch_T000044", "uploadDate": <datetime>, "length": 123,
+     "uploaded_by": "Flor"}
+
+con índices en file_id (único) y (batch_id, uploadDate) (ver db.py). La sincronización
+con batches es un $lookup por batch_id en lugar de una regex sobre todos los
+archivos.
+
+Marca de agua: el uploadDate más reciente indexado, guardado en
+counters._id="mask_index". GridFS escribe uploadDate al TERMINAR la subida (el
+_id se genera al empezarla: una subida lenta quedaría detrás de la marca), así
+que cada pasada lee solo uploadDate >= marca - MASK_INDEX_OVERLAP (el margen
+cubre relojes algo desfasados entre clientes). Los upserts por file_id hacen
+que releer el solapamiento no duplique nada.
+"""
+
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import PyMongoError
+
+from batch_id_extraction import extract_batch_ids
+
+MASK_INDEX_COLLECTION = "mask_index"
+WATERMARK_ID = "mask_index"
+MASK_INDEX_OVERLAP = timedelta(minutes=5)
+INDEX_CHUNK_SIZE = 1000
+
+# Colecciones de archivos con índice en uploadDate ya verificado en este proceso
+_upload_date_indexed = set()
+
+def mask_index_entry(file, batch_id):
+    """Documento de mask_index para un archivo de GridFS (batch_id ya extraído del nombre)"""
+    return {
+        "file_id": file["_id"],
+        "filename": file.get("filename", ""),
+        "batch_id": batch_id,
+        "uploadDate": file.get("uploadDate"),
+        "length": file.get("length", 0),
+        "uploaded_by": (file.get("metadata") or {}).get("uploaded_by", "unknown"),
+    }
+
+
+def index_masks(files_col, db, full=False):
+    """Indexar los archivos nuevos desde la marca de agua (o todos con full=True).
+
+    Devuelve {"scanned", "indexed", "removed", "watermark", "full"}. En una
+    pasada completa se eliminan del índice los archivos que ya no existen.
+    """
+    index_col = db[MASK_INDEX_COLLECTION]
+    _ensure_upload_date_index(files_col)
+    state = db["counters"].find_one({"_id": WATERMARK_ID}) or {}
+    watermark = None if full else _read_watermark(state)
+
+    query = {}
+    if watermark is not None:
+        query["uploadDate"] = {"$gte": watermark - MASK_INDEX_OVERLAP}
+
+    run = ObjectId()  # Marca de esta pasada (en una completa, lo no visto se elimina)
+    scanned = indexed = 0
+    last_upload = watermark
+    cursor = files_col.find(
+        query, {"filename": 1, "uploadDate": 1, "length": 1, "metadata.uploaded_by": 1}
+    ).sort("uploadDate", ASCENDING).batch_size(INDEX_CHUNK_SIZE)
+
+    # Por bloques: los IDs de batch de todo el bloque se extraen en una sola llamada
+    for chunk in _chunks(cursor, INDEX_CHUNK_SIZE):
+        scanned += len(chunk)
+        uploads = [file["uploadDate"] for file in chunk if file.get("uploadDate")]
+        last_upload = max(uploads + ([last_upload] if last_upload is not None else []), default=None)
+        batch_ids = extract_batch_ids([file.get("filename") for file in chunk])
+        result = index_col.bulk_write([
+            UpdateOne(
+                {"file_id": file["_id"]},
+                {"$set": {**mask_index_entry(file, batch_id), "indexed_run": run}},
+                upsert=True
+            )
+            for file, batch_id in zip(chunk, batch_ids)
+        ], ordered=False)
+        indexed += result.upserted_count
+
+    removed = 0
+    if full:
+        removed = index_col.delete_many({"indexed_run": {"$ne": run}}).deleted_count
+
+    if last_upload is not None and last_upload != watermark:
+        db["counters"].update_one(
+            {"_id": WATERMARK_ID},
+            {"$set": {"last_upload_date": last_upload, "updated_at": datetime.utcnow()},
+             "$unset": {"last_file_id": ""}},
+            upsert=True
+        )
+    return {"scanned": scanned, "indexed": indexed, "removed": removed,
+            "watermark": last_upload.isoformat() if last_upload else None, "full": full}
+
+
+def _read_watermark(state):
+    """uploadDate de la marca de agua; las marcas antiguas (last_file_id) se traducen a la fecha de su _id"""
+    if state.get("last_upload_date") is not None:
+        return state["last_upload_date"]
+    if state.get("last_file_id") is not None:
+        return state["last_file_id"].generation_time.replace(tzinfo=None)
+    return None
+
+
+def _ensure_upload_date_index(files_col):
+    """Índice en uploadDate para las pasadas incrementales (GridFS solo crea (filename, uploadDate))"""
+    key = (files_col.database.name, files_col.name)
+    if key in _upload_date_indexed:
+        return
+    try:
+        files_col.create_index([("uploadDate", ASCENDING)], background=True)
+    except PyMongoError as e:
+        print(f"⚠️ No se pudo crear el índice uploadDate en {files_col.name}: {e}")
+    _upload_date_indexed.add(key)
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def batch_file_summary(batches_col):
+    """Por cada batch: id, mongo_uploaded actual, file_count y last_file_upload (join por batch_id)"""
+    return batches_col.aggregate([
+        {"$project": {"id": 1, "mongo_uploaded": 1, "_id": 0}},
+        {"$lookup": {
+            "from": MASK_INDEX_COLLECTION,
+            "localField": "id",
+            "foreignField": "batch_id",
+            "as": "files"
+        }},
+        {"$project": {
+            "id": 1,
+            "mongo_uploaded": 1,
+            "file_count": {"$size": "$files"},
+            "last_file_upload": {"$max": "$files.uploadDate"}
+        }}
+    ])
@@ -0,0 +1,185 @@
+"""
+Sincronización de máscaras en segundo plano (un solo worker a la vez)
+=====================================================================
+
+Cada worker de gunicorn arranca un hilo que revisa cada POLL_SECONDS el
+documento `scheduler._id="mask_sync"`. La sincronización corre cuando pasó el
+intervalo desde la última o cuando alguien la pidió por HTTP (requested_at).
+
+Solo un worker la ejecuta: para empezar hay que tomar el lease con un
+find_one_and_update condicionado a que el lease esté libre o vencido Y a que
+last_started_at siga siendo el valor leído (así dos workers que ven la misma
+corrida pendiente no la ejecutan dos veces). Mientras corre, un hilo renueva
+lease_expires_at cada HEARTBEAT_SECONDS: una corrida larga no pierde el lease.
+Si el worker muere a mitad de corrida (p. ej. reciclado por max_requests), deja
+de renovarse y el lease vence solo.
+
+El mismo documento guarda el resultado de la última corrida:
+
+    {"_id": "mask_sync", "interval_seconds": 900, "running": false,
+     "last_started_at", "last_finished_at", "last_duration_seconds",
+     "last_batches_updated", "last_result": {...}, "last_error": null,
+     "requested_at", "requested_full", "lease_owner", "lease_expires_at"}
+"""
+
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+SCHEDULER_COLLECTION = "scheduler"
+MASK_SYNC_ID = "mask_sync"
+POLL_SECONDS = float(os.environ.get("MASK_SYNC_POLL_SECONDS", "15"))
+LEASE_SECONDS = int(os.environ.get("MASK_SYNC_LEASE_SECONDS", "600"))
+HEARTBEAT_SECONDS = float(os.environ.get("MASK_SYNC_HEARTBEAT_SECONDS", str(LEASE_SECONDS / 3)))
+
+_STATUS_FIELDS = {"_id": 0, "lease_expires_at": 0}
+
+
+class MaskSyncScheduler:
+    """Hilo por worker que ejecuta `run_sync` cada `interval` segundos con lease en Mongo"""
+
+    def __init__(self, run_sync, collection_getter, interval):
+        # run_sync(full) -> dict con "batches_updated"; collection_getter -> colección scheduler (o None)
+        self._run_sync = run_sync
+        self._collection_getter = collection_getter
+        self.interval = interval  # 0 = solo a pedido
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def ensure_started(self):
+        """Arrancar el hilo del planificador (una vez por proceso)"""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self.owner = f"{socket.gethostname()}:{os.getpid()}"  # el pid cambia tras el fork
+                self._thread = threading.Thread(target=self._loop, name="mask-sync-scheduler", daemon=True)
+                self._thread.start()
+
+    def request_run(self, full=False):
+        """Pedir una corrida lo antes posible (la toma el worker que consiga el lease)"""
+        collection = self._collection_getter()
+        self._ensure_state(collection)
+        update = {"$set": {"requested_at": datetime.utcnow()}}
+        if full:
+            update["$set"]["requested_full"] = True
+        state = collection.find_one_and_update(
+            {"_id": MASK_SYNC_ID}, update, projection=_STATUS_FIELDS, return_document=ReturnDocument.AFTER
+        )
+        self._wake.set()  # si este worker tiene el hilo libre, lo intenta sin esperar al siguiente ciclo
+        return state
+
+    def status(self):
+        collection = self._collection_getter()
+        self._ensure_state(collection)
+        return collection.find_one({"_id": MASK_SYNC_ID}, _STATUS_FIELDS)
+
+    def _ensure_state(self, collection):
+        try:
+            collection.insert_one({
+                "_id": MASK_SYNC_ID, "interval_seconds": self.interval, "running": False,
+                "last_started_at": None, "requested_at": None, "lease_expires_at": None
+            })
+        except DuplicateKeyError:
+            pass
+
+    def _is_due(self, state, now):
+        last_started = state.get("last_started_at")
+        requested = state.get("requested_at")
+        if requested and (last_started is None or requested > last_started):
+            return True
+        if not self.interval:
+            return False
+        last_finished = state.get("last_finished_at") or last_started
+        return last_finished is None or now - last_finished >= timedelta(seconds=self.interval)
+
+    def _acquire(self, collection, state, now):
+        """Tomar el lease para esta corrida; devuelve el estado actualizado o None"""
+        return collection.find_one_and_update(
+            {
+                "_id": MASK_SYNC_ID,
+                "last_started_at": state.get("last_started_at"),
+                "$or": [{"lease_expires_at": None}, {"lease_expires_at": {"$lt": now}}]
+            },
+            {"$set": {
+                "lease_owner": self.owner,
+                "lease_expires_at": now + timedelta(seconds=LEASE_SECONDS),
+                "last_started_at": now,
+                "running": True,
+                "interval_seconds": self.interval
+            }},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _keep_lease(self, collection, started_at, done):
+        """Renovar el lease de la corrida iniciada en `started_at` hasta que `done` se active"""
+        while not done.wait(HEARTBEAT_SECONDS):
+            try:
+                result = collection.update_one(
+                    {"_id": MASK_SYNC_ID, "lease_owner": self.owner, "last_started_at": started_at},
+                    {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)}}
+                )
+                if not result.matched_count:
+                    print(f"⚠️ Sincronización de máscaras: {self.owner} perdió el lease")
+                    return
+            except PyMongoError as e:
+                print(f"⚠️ No se pudo renovar el lease de sincronización: {e}")
+
+    def _run_once(self, collection):
+        self._ensure_state(collection)
+        now = datetime.utcnow()
+        state = collection.find_one({"_id": MASK_SYNC_ID})
+        if not self._is_due(state, now):
+            return False
+        acquired = self._acquire(collection, state, now)
+        if not acquired:
+            return False
+
+        full = bool(state.get("requested_full"))
+        started = time.monotonic()
+        outcome = {"last_error": None}
+        # last_started_at tal como quedó guardado (Mongo trunca a milisegundos)
+        heartbeat_done = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._keep_lease, args=(collection, acquired["last_started_at"], heartbeat_done),
+            name="mask-sync-lease", daemon=True
+        )
+        heartbeat.start()
+        try:
+            print(f"🔄 Sincronización de máscaras programada ({self.owner}{', completa' if full else ''})")
+            result = self._run_sync(full)
+            outcome["last_batches_updated"] = result.get("batches_updated", 0)
+            outcome["last_result"] = result
+        except Exception as e:
+            print(f"❌ Error en sincronización programada: {e}")
+            outcome["last_error"] = str(e)
+        finally:
+            heartbeat_done.set()
+            heartbeat.join()
+            outcome.update({
+                "running": False,
+                "last_finished_at": datetime.utcnow(),
+                "last_duration_seconds": round(time.monotonic() - started, 2),
+                "lease_expires_at": None
+            })
+            update = {"$set": outcome}
+            if full:
+                update["$unset"] = {"requested_full": ""}
+            collection.update_one({"_id": MASK_SYNC_ID, "lease_owner": self.owner}, update)
+        return True
+
+    def _loop(self):
+        while True:
+            collection = self._collection_getter()
+            if collection is not None:
+                try:
+                    self._run_once(collection)
+                except PyMongoError as e:
+                    print(f"⚠️ Planificador de sincronización: {e}")
+            self._wake.wait(POLL_SECONDS)
+            self._wake.clear()
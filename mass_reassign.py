@@ -1,17 +1,52 @@
 #!/usr/bin/env python3
 """
 Script para reasignar masivamente batches
+
+La lectura es directa a Mongo; la escritura va por PATCH /api/batches/bulk
+(como el dashboard), así se actualizan contadores, batch_events y el feed de
+cambios de los clientes.
 """
 
+from collections import defaultdict
 from pymongo import MongoClient
+import requests
 import sys
 
 MONGO_URI = "mongodb://192.168.1.93:27017"
 DB_NAME = "segmentacion_db"
+API_BASE = "http://localhost:5000/api"
+BULK_CHUNK_SIZE = 5000  # Máximo de batches por petición bulk
 
 # Miembros actuales del equipo
 CURRENT_TEAM = ["Mauricio", "Maggie", "Ceci", "Flor", "Ignacio"]
 
+def bulk_set_assignee(batches, new_assignee):
+    """Cambiar el assignee vía API, por responsable anterior y en bloques.
+
+    El filtro incluye el responsable leído: un batch reasignado entretanto no se toca.
+    Devuelve el número de batches actualizados.
+    """
+    by_assignee = defaultdict(list)
+    for batch in batches:
+        by_assignee[batch["assignee"]].append(batch["id"])
+
+    updated = 0
+    for old_assignee, batch_ids in by_assignee.items():
+        for start in range(0, len(batch_ids), BULK_CHUNK_SIZE):
+            response = requests.patch(
+                f"{API_BASE}/batches/bulk",
+                json={
+                    "filter": {"ids": batch_ids[start:start + BULK_CHUNK_SIZE], "assignee": old_assignee},
+                    "set": {"assignee": new_assignee}
+                },
+                headers={"Content-Type": "application/json"}
+            )
+            if response.status_code != 200:
+                print(f"   ❌ Error ({old_assignee}): {response.status_code} {response.text}")
+                continue
+            updated += response.json()["updated_count"]
+    return updated
+
 def unassign_all_non_members():
     """Desasignar todos los batches de NO-miembros"""
 
@@ -25,9 +60,10 @@ def unassign_all_non_members():
         batches_col = db["batches"]
 
         # Encontrar todos los batches asignados a NO-miembros
-        non_member_batches = list(batches_col.find({
-            "assignee": {"$nin": [None, ""] + CURRENT_TEAM}
-        }))
+        non_member_batches = list(batches_col.find(
+            {"assignee": {"$nin": [None, ""] + CURRENT_TEAM}},
+            {"id": 1, "assignee": 1, "_id": 0}
+        ))
 
         total = len(non_member_batches)
 
@@ -57,15 +93,12 @@ def unassign_all_non_members():
         print("🔄 Desasignando batches...")
 
         # Actualizar todos
-        result = batches_col.update_many(
-            {"assignee": {"$nin": [None, ""] + CURRENT_TEAM}},
-            {"$set": {"assignee": None}}
-        )
+        updated = bulk_set_assignee(non_member_batches, None)
 
         print()
         print("=" * 70)
         print(f"✅ COMPLETADO")
-        print(f"  Batches desasignados: {result.modified_count}")
+        print(f"  Batches desasignados: {updated}")
         print()
         print("💡 Ahora estos batches aparecerán en 'Batches No Asignados'")
         print("   Refresca el dashboard con Ctrl + Shift + R")
@@ -95,9 +128,10 @@ def reassign_all_non_members(new_assignee):
         batches_col = db["batches"]
 
         # Encontrar todos los batches asignados a NO-miembros
-        non_member_batches = list(batches_col.find({
-            "assignee": {"$nin": [None, ""] + CURRENT_TEAM}
-        }))
+        non_member_batches = list(batches_col.find(
+            {"assignee": {"$nin": [None, ""] + CURRENT_TEAM}},
+            {"id": 1, "assignee": 1, "_id": 0}
+        ))
 
         total = len(non_member_batches)
 
@@ -127,15 +161,12 @@ def reassign_all_non_members(new_assignee):
         print(f"🔄 Reasignando batches a '{new_assignee}'...")
 
         # Actualizar todos
-        result = batches_col.update_many(
-            {"assignee": {"$nin": [None, ""] + CURRENT_TEAM}},
-            {"$set": {"assignee": new_assignee}}
-        )
+        updated = bulk_set_assignee(non_member_batches, new_assignee)
 
         print()
         print("=" * 70)
         print(f"✅ COMPLETADO")
-        print(f"  Batches reasignados: {result.modified_count}")
+        print(f"  Batches reasignados: {updated}")
         print(f"  Nuevo responsable: {new_assignee}")
         print()
         print(f"💡 Ahora estos batches aparecerán en la tarjeta de '{new_assignee}'")
@@ -0,0 +1,147 @@
+"""
+Caché de métricas compartida entre workers de gunicorn
+======================================================
+
+Los 4 workers de gunicorn_config.py son procesos distintos: una caché en
+memoria obligaría a cada uno a recalcular las mismas métricas. Esta caché vive
+en un archivo SQLite local (modo WAL), visible para todos los workers del host.
+
+- Cada entrada guarda la respuesta (cuerpo, content_type, Content-Disposition) y la
+  versión de batches con la que se calculó.
+- Una entrada solo sirve si su versión coincide con la actual y no superó el
+  TTL; después de cada escritura se descartan las de esa versión o anteriores.
+- Aciertos, fallos y tamaños se guardan en el mismo archivo para /api/metrics/cache.
+
+Cualquier error de SQLite se registra y la petición sigue sin caché.
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), "segmentacion_metrics_cache.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    endpoint TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    content_type TEXT,
+    disposition TEXT,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS endpoint_stats (
+    endpoint TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class MetricsCache:
+    """Caché TTL en SQLite, invalidada por versión de batches"""
+
+    def __init__(self, path=DEFAULT_PATH, ttl=60):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()  # Una conexión por hilo (workers gthread)
+        self._schema_ready = False
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._schema_ready:
+                conn.executescript(_SCHEMA)
+                self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def _count(self, conn, endpoint, column):
+        conn.execute(
+            f"INSERT INTO endpoint_stats (endpoint, {column}) VALUES (?, 1) "
+            f"ON CONFLICT(endpoint) DO UPDATE SET {column} = {column} + 1",
+            (endpoint,)
+        )
+
+    def get(self, key, endpoint, version):
+        """Devolver (body, content_type, disposition) o None si no hay entrada vigente"""
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT body, content_type, disposition FROM entries WHERE key = ? AND version = ? AND created_at >= ?",
+                (key, version, time.time() - self.ttl)
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE entries SET hits = hits + 1 WHERE key = ?", (key,))
+                self._count(conn, endpoint, "hits")
+                return row
+            self._count(conn, endpoint, "misses")
+        except sqlite3.Error as e:
+            print(f"⚠️ Caché de métricas no disponible (lectura): {e}")
+        return None
+
+    def set(self, key, endpoint, version, body, content_type, disposition=None):
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, endpoint, version, created_at, content_type, disposition, body, size, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, endpoint, version, time.time(), content_type, disposition, body, len(body))
+            )
+        except sqlite3.Error as e:
+            print(f"⚠️ Caché de métricas no disponible (escritura): {e}")
+
+    def invalidate(self, up_to_version=None):
+        """Borrar las entradas con versión <= up_to_version (o todas) y las vencidas"""
+        try:
+            conn = self._connection()
+            if up_to_version is None:
+                conn.execute("DELETE FROM entries")
+            else:
+                conn.execute(
+                    "DELETE FROM entries WHERE version <= ? OR created_at < ?",
+                    (up_to_version, time.time() - self.ttl)
+                )
+        except sqlite3.Error as e:
+            print(f"⚠️ No se pudo invalidar la caché de métricas: {e}")
+
+    def stats(self):
+        """Entradas (tamaño, antigüedad, aciertos) y tasa de aciertos por endpoint"""
+        conn = self._connection()
+        now = time.time()
+        entries = [
+            {"key": key, "endpoint": endpoint, "version": version, "size": size,
+             "age_seconds": round(now - created_at, 1), "hits": hits,
+             "expired": now - created_at > self.ttl}
+            for key, endpoint, version, size, created_at, hits in conn.execute(
+                "SELECT key, endpoint, version, size, created_at, hits FROM entries ORDER BY size DESC"
+            )
+        ]
+        endpoints = {}
+        for endpoint, hits, misses in conn.execute("SELECT endpoint, hits, misses FROM endpoint_stats"):
+            total = hits + misses
+            endpoints[endpoint] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / total * 100, 1) if total else 0
+            }
+        return {
+            "path": self.path,
+            "ttl_seconds": self.ttl,
+            "entry_count": len(entries),
+            "total_bytes": sum(entry["size"] for entry in entries),
+            "entries": entries,
+            "endpoints": endpoints
+        }
@@ -1,13 +1,18 @@
 #!/usr/bin/env python3
 """
 Script para reasignar un batch a otro responsable
+
+La escritura va por PUT /api/batches/<id> (como el dashboard): así se
+actualizan contadores, batch_events y el feed de cambios de los clientes.
 """
 
 from pymongo import MongoClient
+import requests
 import sys
 
 MONGO_URI = "mongodb://192.168.1.93:27017"
 DB_NAME = "segmentacion_db"
+API_BASE = "http://localhost:5000/api"
 
 def reassign_batch(batch_id, new_assignee):
     """Reasignar un batch a un nuevo responsable"""
@@ -35,19 +40,21 @@ def reassign_batch(batch_id, new_assignee):
         print(f"  - Status: {batch.get('status')}")
         print()
 
-        # Actualizar
-        result = batches_col.update_one(
-            {"id": batch_id},
-            {"$set": {
-                "assignee": new_assignee if new_assignee != "null" else None
-            }}
+        # Actualizar vía API, solo si nadie lo cambió desde la lectura (rev)
+        assignee_value = new_assignee if new_assignee != "null" else None
+        response = requests.put(
+            f"{API_BASE}/batches/{batch_id}",
+            json={"assignee": assignee_value, "rev": batch.get("rev", 0)},
+            headers={"Content-Type": "application/json"}
         )
 
-        if result.modified_count > 0:
+        if response.status_code == 200:
             print(f"✅ Batch reasignado exitosamente")
             print(f"  {old_assignee} → {new_assignee}")
+        elif response.status_code == 409:
+            print(f"⚠️ El batch cambió mientras tanto; vuelve a ejecutar el script")
         else:
-            print(f"⚠️ No se realizaron cambios (quizás ya tenía ese responsable)")
+            print(f"❌ Error: {response.status_code} {response.text}")
 
         client.close()
 
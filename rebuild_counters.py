@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Reconstruir desde cero los contadores materializados (batch_counters y daily_progress)
+
+Uso:
+  python rebuild_counters.py            # recalcula ambos desde batches
+  python rebuild_counters.py --compact  # solo borra filas en cero de daily_progress
+
+Compactación nocturna (crontab):
+  15 3 * * * cd /ruta/al/proyecto && python rebuild_counters.py --compact
+
+(usa MONGO_URI / DB_NAME del entorno, igual que la app)
+"""
+
+import sys
+
+from db import get_db
+from batch_counters import COUNTERS_COLLECTION, read_counters, rebuild_counters
+from daily_progress import DAILY_PROGRESS_COLLECTION, compact_daily_progress, rebuild_daily_progress
+
+compact_only = "--compact" in sys.argv[1:]
+
+print("=" * 70)
+if compact_only:
+    print("  COMPACTANDO ROLLUP DIARIO (daily_progress)")
+else:
+    print("  RECONSTRUYENDO CONTADORES DE BATCHES (batch_counters, daily_progress)")
+print("=" * 70)
+
+try:
+    db = get_db()
+except ConnectionError as e:
+    print(f"❌ {e}")
+    sys.exit(1)
+
+if compact_only:
+    removed = compact_daily_progress(db[DAILY_PROGRESS_COLLECTION])
+    print(f"✅ {removed} filas vacías eliminadas de daily_progress")
+    sys.exit(0)
+
+combinations = rebuild_counters(db)
+counters = read_counters(db[COUNTERS_COLLECTION])
+total = sum(c["count"] for c in counters)
+
+print(f"✅ {combinations} combinaciones (assignee, status), {total} batches en total")
+print()
+for counter in sorted(counters, key=lambda c: (c["assignee"] or "", c["status"] or "")):
+    print(f"  {counter['assignee'] or 'Sin asignar':<20} {counter['status'] or '-':<6} {counter['count']:>6}")
+
+print()
+rows = rebuild_daily_progress(db)
+print(f"✅ daily_progress: {rows} filas (fecha, assignee)")
@@ -80,33 +80,36 @@ print("🔄 Reasignando batches...")
 exitos = 0
 errores = 0
 
-for batch_info in batches_a_restaurar:
-    batch_id = batch_info['id']
-
-    # Datos para actualizar
-    update_data = {
-        "assignee": "Ignacio",
-        "metadata": {
-            "assigned_at": "2025-10-16"  # Fecha de hoy (restauración)
-        }
+# Datos para actualizar
+update_data = {
+    "assignee": "Ignacio",
+    "metadata": {
+        "assigned_at": "2025-10-16"  # Fecha de hoy (restauración)
     }
-
-    try:
-        response = requests.put(
-            f"{API_BASE}/batches/{batch_id}",
-            json=update_data,
-            headers={"Content-Type": "application/json"}
-        )
-
-        if response.status_code == 200:
-            print(f"   ✅ {batch_id} reasignado a Ignacio")
-            exitos += 1
-        else:
-            print(f"   ❌ Error en {batch_id}: {response.status_code}")
-            errores += 1
-    except Exception as e:
-        print(f"   ❌ Error en {batch_id}: {e}")
-        errores += 1
+}
+
+try:
+    # Una sola petición para todos los batches
+    response = requests.patch(
+        f"{API_BASE}/batches/bulk",
+        json={"operations": [{"id": b['id'], "set": update_data} for b in batches_a_restaurar]},
+        headers={"Content-Type": "application/json"}
+    )
+
+    if response.status_code == 200:
+        for item in response.json()["results"]:
+            if item["success"]:
+                print(f"   ✅ {item['id']} reasignado a Ignacio")
+                exitos += 1
+            else:
+                print(f"   ❌ Error en {item['id']}: {item.get('error')}")
+                errores += 1
+    else:
+        print(f"   ❌ Error: {response.status_code}")
+        errores += len(batches_a_restaurar)
+except Exception as e:
+    print(f"   ❌ Error: {e}")
+    errores += len(batches_a_restaurar)
 
 print()
 print("=" * 60)
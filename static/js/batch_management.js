@@ -124,6 +124,36 @@ async function checkMongoFiles() {
   }
 }
 
+// Esperar a que termine una corrida iniciada después de `requestedAt` (null si tarda demasiado)
+async function waitForSync(requestedAt, maxAttempts = 150) {
+  for (let attempt = 0; attempt < maxAttempts; attempt++) {
+    const response = await fetch('/api/sync-batch-files');
+    const sync = (await response.json()).sync || {};
+    const started = sync.last_started_at && new Date(sync.last_started_at) >= new Date(requestedAt);
+    if (started && !sync.running) {
+      return sync;
+    }
+    await new Promise(resolve => setTimeout(resolve, 2000));
+  }
+  return null;
+}
+
+// Esperar a que termine un trabajo en segundo plano; devuelve el documento del trabajo (null si tarda demasiado)
+async function waitForJob(jobId, maxAttempts = 300) {
+  for (let attempt = 0; attempt < maxAttempts; attempt++) {
+    const response = await fetch(`/api/jobs/${encodeURIComponent(jobId)}`);
+    const data = await response.json();
+    if (!data.success) {
+      throw new Error(data.error);
+    }
+    if (data.job.status === 'done' || data.job.status === 'error') {
+      return data.job;
+    }
+    await new Promise(resolve => setTimeout(resolve, 2000));
+  }
+  return null;
+}
+
 // Sincronizar archivos de batches
 async function syncBatchFiles() {
   operationInProgress = true;
@@ -133,20 +163,31 @@ async function syncBatchFiles() {
   try {
     addLog('info', 'Sincronizando archivos de batches...');
     
+    // El POST solo pide la corrida: el planificador del servidor la ejecuta en segundo plano
     const response = await fetch('/api/sync-batch-files', { method: 'POST' });
     const data = await response.json();
     
-    if (data.success) {
-      addLog('success', `Sincronización completada: ${data.synchronized} batches`);
-      if (data.details) {
-        data.details.forEach(detail => {
-          addLog('info', `  - ${detail}`);
-        });
-      }
-      showNotification('Sincronización completada', 'success');
-    } else {
+    if (!data.success) {
       addLog('error', `Error en sincronización: ${data.error}`);
       showNotification('Error en sincronización', 'error');
+      return;
+    }
+
+    addLog('info', 'Sincronización programada, esperando resultado...');
+    const sync = await waitForSync(data.sync.requested_at);
+
+    if (!sync) {
+      addLog('info', 'La sincronización sigue en curso en segundo plano');
+    } else if (sync.last_error) {
+      addLog('error', `Error en sincronización: ${sync.last_error}`);
+      showNotification('Error en sincronización', 'error');
+    } else {
+      const result = sync.last_result || {};
+      addLog('success', `Sincronización completada: ${result.batches_updated} batches actualizados (${sync.last_duration_seconds}s)`);
+      (result.results || []).forEach(r => {
+        addLog('info', `  - ${r.batch_id}: ${r.files_found} archivo(s)`);
+      });
+      showNotification('Sincronización completada', 'success');
     }
   } catch (error) {
     addLog('error', `Error de conexión: ${error.message}`);
@@ -166,19 +207,27 @@ async function autoCreateBatches() {
   try {
     addLog('info', 'Creando batches automáticamente...');
     
+    // El POST encola el trabajo: se consulta su estado hasta que termine
     const response = await fetch('/api/auto-create-batches', { method: 'POST' });
-    const data = await response.json();
-    
-    if (data.success) {
-      addLog('success', `Creados ${data.created} nuevos batches`);
-      if (data.batches) {
-        data.batches.forEach(batch => {
-          addLog('info', `  - ${batch.id}: ${batch.file_count} archivos`);
-        });
-      }
-      showNotification(`${data.created} batches creados exitosamente`, 'success');
+    const queued = await response.json();
+    if (!queued.success) {
+      addLog('error', `Error creando batches: ${queued.error}`);
+      showNotification('Error creando batches', 'error');
+      return;
+    }
+
+    const job = await waitForJob(queued.job_id);
+    if (!job) {
+      addLog('info', 'La creación sigue en curso en segundo plano');
+    } else if (job.status === 'done') {
+      const data = job.result;
+      addLog('success', `Creados ${data.created_batches} nuevos batches`);
+      data.results.filter(r => r.created).forEach(r => {
+        addLog('info', `  - ${r.batch_id}`);
+      });
+      showNotification(`${data.created_batches} batches creados exitosamente`, 'success');
     } else {
-      addLog('error', `Error creando batches: ${data.error}`);
+      addLog('error', `Error creando batches: ${job.error}`);
       showNotification('Error creando batches', 'error');
     }
   } catch (error) {
@@ -80,8 +80,8 @@ function handleFileSelect(e) {
 }
 
 function handleFile(file) {
-  if (!file.name.endsWith('.json')) {
-    showNotification('Por favor selecciona un archivo JSON', 'error');
+  if (!/\.(json|ndjson|jsonl)$/.test(file.name)) {
+    showNotification('Por favor selecciona un archivo JSON o NDJSON', 'error');
     return;
   }
 
@@ -141,34 +141,32 @@ async function handleUpload() {
   showLoading(true);
 
   try {
-    // Leer el archivo
-    const fileContent = await readFileAsText(selectedFile);
-    const jsonData = JSON.parse(fileContent);
-
-    // Validar estructura
-    if (!jsonData.batches || !Array.isArray(jsonData.batches)) {
-      showNotification('El archivo JSON debe contener un array "batches"', 'error');
-      showLoading(false);
-      return;
-    }
+    // Enviar el archivo tal cual (multipart): el servidor lo procesa en streaming
+    const formData = new FormData();
+    formData.append('file', selectedFile);
+    formData.append('mode', mode);
 
-    // Enviar al servidor
     const response = await fetch('/api/data/batches/upload', {
       method: 'POST',
-      headers: {
-        'Content-Type': 'application/json'
-      },
-      body: JSON.stringify({
-        batches: jsonData.batches,
-        mode: mode
-      })
+      body: formData
     });
 
-    const result = await response.json();
+    const queued = await response.json();
+    if (!queued.success) {
+      showNotification(`Error: ${queued.error}`, 'error');
+      return;
+    }
+
+    // La carga corre en segundo plano: seguir el trabajo hasta que termine
+    const result = await waitForJob(queued.job_id, job => {
+      const { processed = 0 } = job.progress || {};
+      setLoadingText(`Procesando... ${processed} de ${job.params.total} batches`);
+    });
 
     if (result.success) {
       showNotification(
-        `✅ ${result.inserted_count} batches cargados exitosamente`,
+        `✅ ${result.inserted_count} batches cargados exitosamente` +
+        (result.skipped_count ? ` (${result.skipped_count} ya existían)` : ''),
         'success'
       );
 
@@ -192,17 +190,30 @@ async function handleUpload() {
     console.error('Error cargando batches:', error);
     showNotification(`Error al cargar: ${error.message}`, 'error');
   } finally {
+    setLoadingText('Procesando...');
     showLoading(false);
   }
 }
 
-function readFileAsText(file) {
-  return new Promise((resolve, reject) => {
-    const reader = new FileReader();
-    reader.onload = (e) => resolve(e.target.result);
-    reader.onerror = (e) => reject(e);
-    reader.readAsText(file);
-  });
+// Consultar un trabajo en segundo plano hasta que termine.
+// Devuelve {success, ...result} o {success: false, error}.
+async function waitForJob(jobId, onProgress, intervalMs = 1000) {
+  while (true) {
+    const response = await fetch(`/api/jobs/${encodeURIComponent(jobId)}`);
+    const data = await response.json();
+    if (!data.success) return data;
+
+    const job = data.job;
+    if (job.status === 'done') return { success: true, ...job.result };
+    if (job.status === 'error') return { success: false, error: job.error };
+    if (onProgress) onProgress(job);
+    await new Promise(resolve => setTimeout(resolve, intervalMs));
+  }
+}
+
+function setLoadingText(text) {
+  const label = document.querySelector('#loading p');
+  if (label) label.textContent = text;
 }
 
 // Exportar batches a JSON
@@ -300,7 +311,16 @@ async function handleDelete() {
       })
     });
 
-    const result = await response.json();
+    const queued = await response.json();
+    if (!queued.success) {
+      showNotification(`Error: ${queued.error}`, 'error');
+      return;
+    }
+
+    const result = await waitForJob(queued.job_id, job => {
+      const { deleted = 0 } = job.progress || {};
+      setLoadingText(`Eliminando... ${deleted} de ${job.params.matched} batches`);
+    });
 
     if (result.success) {
       showNotification(
@@ -322,6 +342,7 @@ async function handleDelete() {
     console.error('Error eliminando batches:', error);
     showNotification(`Error al eliminar: ${error.message}`, 'error');
   } finally {
+    setLoadingText('Procesando...');
     showLoading(false);
   }
 }
@@ -3,8 +3,13 @@
 Script para sincronizar máscaras de QUALITY_IEMSA con batches
 """
 
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from batch_id_extraction import extract_batch_ids
+from batch_loader import iter_chunks
 from db import get_db, get_training_db
-import re
 
 def main():
     print("=" * 70)
@@ -23,38 +28,24 @@ def main():
 
     masks_col = training_db["training_metrics.masks.files"]
 
-    # Obtener todas las máscaras
+    # Batches existentes: solo id y estado actual (dict para el join por ID)
+    batches = {b["id"]: b for b in batches_col.find({}, {"id": 1, "mongo_uploaded": 1, "_id": 0})}
+
+    # Obtener todas las máscaras (cursor, sin cargar la lista completa)
     print("\n📊 Obteniendo máscaras de QUALITY_IEMSA...")
-    all_masks = list(masks_col.find({}, {"filename": 1, "uploadDate": 1, "_id": 0}))
-    print(f"✅ {len(all_masks)} máscaras encontradas")
+    all_masks = masks_col.find({}, {"filename": 1, "uploadDate": 1, "_id": 0}).batch_size(1000)
 
-    # Extraer batch IDs de los nombres de archivos
+    # Asociar cada archivo con su batch con el mismo extractor que /api/sync-batch-files
+    # masks_batch_000040F.tar.xz -> batch_000040F
+    # masks_batch_T000044.tar.xz -> batch_T000044
     batch_mask_map = {}
-
-    for mask in all_masks:
-        filename = mask.get("filename", "")
-
-        # Patrones:
-        # masks_batch_000040F.tar.xz -> batch_000040F
-        # masks_batch_T000044.tar.xz -> batch_T000044
-
-        # Patrón 1: batch_XXXXXF
-        match_f = re.search(r'batch_(\d+F)', filename, re.IGNORECASE)
-        if match_f:
-            batch_id = f"batch_{match_f.group(1)}"
-            if batch_id not in batch_mask_map:
-                batch_mask_map[batch_id] = []
-            batch_mask_map[batch_id].append(mask)
-            continue
-
-        # Patrón 2: batch_TXXXXXX
-        match_t = re.search(r'batch_(T\d+)', filename, re.IGNORECASE)
-        if match_t:
-            batch_id = f"batch_{match_t.group(1)}"
-            if batch_id not in batch_mask_map:
-                batch_mask_map[batch_id] = []
-            batch_mask_map[batch_id].append(mask)
-            continue
+    unmatched = 0
+    for chunk in iter_chunks(all_masks, 1000):
+        for mask, batch_id in zip(chunk, extract_batch_ids([m.get("filename") for m in chunk])):
+            if batch_id in batches:
+                batch_mask_map.setdefault(batch_id, []).append(mask)
+            else:
+                unmatched += 1
 
     print(f"\n📋 Batches con máscaras encontrados: {len(batch_mask_map)}")
 
@@ -66,29 +57,20 @@ def main():
     # Actualizar batches en la base de datos
     print(f"\n🔄 Actualizando {len(batch_mask_map)} batches...")
 
-    updated_count = 0
-    not_found_count = 0
+    not_found_count = unmatched
     already_updated_count = 0
+    operations = []
 
     for batch_id, masks in batch_mask_map.items():
-        # Verificar si el batch existe
-        batch = batches_col.find_one({"id": batch_id})
-
-        if not batch:
-            not_found_count += 1
-            print(f"  ⚠️  Batch {batch_id} no encontrado en la base de datos")
-            continue
-
         # Verificar si ya está marcado como subido
-        if batch.get("mongo_uploaded", False):
+        if batches[batch_id].get("mongo_uploaded", False):
             already_updated_count += 1
             continue
 
         # Obtener información del último archivo subido
-        latest_mask = max(masks, key=lambda x: x.get("uploadDate", ""))
+        latest_mask = max(masks, key=lambda x: x.get("uploadDate") or datetime.min)
 
-        # Actualizar batch
-        batches_col.update_one(
+        operations.append(UpdateOne(
             {"id": batch_id},
             {
                 "$set": {
@@ -98,15 +80,19 @@ def main():
                         "last_file_upload": latest_mask.get("uploadDate"),
                         "has_files": True
                     }
-                }
+                },
+                "$inc": {"rev": 1}
             }
-        )
-        updated_count += 1
+        ))
+
+    if operations:
+        batches_col.bulk_write(operations, ordered=False)
+    updated_count = len(operations)
 
     print(f"\n✅ Actualización completada:")
     print(f"   • Batches actualizados: {updated_count}")
     print(f"   • Ya estaban actualizados: {already_updated_count}")
-    print(f"   • No encontrados en DB: {not_found_count}")
+    print(f"   • Archivos sin batch en DB: {not_found_count}")
 
     # Verificar resultado final
     total_uploaded = batches_col.count_documents({"mongo_uploaded": True})
@@ -18,10 +18,11 @@ Fecha: 2025-10-10
 """
 
 import sys
-import re
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
 
+from batch_id_extraction import extract_batch_ids
+
 # Configuración
 MONGO_URI = "mongodb://127.0.0.1:27018"
 SEGMENTACION_DB = "segmentacion_db"
@@ -153,19 +154,32 @@ def test_batch_id_extraction():
         ("masks_batch_9.tar.xz", "9"),
         ("Batch_20250909T0001.tar.xz", "20250909T0001"),
         ("masks_20251002T132967.tar.xz", "20251002T132967"),
+        ("masks_batch_000040F.tar.xz", "000040F"),
+        ("masks_batch_T000044.tar.xz", "T000044"),
+        ("masks_batch_5 (1).tar.xz", "5"),
+        # Sin prefijo "batch"/"masks_": no deben crear batches
+        ("2025_backup.tar.xz", None),
+        ("t1.zip", None),
+        ("T000044.tar.xz", None),
+        ("masks_2025_backup.tar.xz", None),
+        ("rebatch_5.zip", None),
     ]
 
-    pattern = r'[Bb]atch[_\-]?(\d+[A-Z]?\d*)'
     all_passed = True
 
-    for filename, expected_id in test_cases:
-        matches = re.findall(pattern, filename)
-        if matches:
-            extracted_id = matches[0]
-            if extracted_id == expected_id:
-                print_success(f"{filename} → batch_{extracted_id}")
+    # Extractor común de la app (batch_id_extraction)
+    for (filename, expected_id), extracted_id in zip(test_cases, extract_batch_ids(f for f, _ in test_cases)):
+        if expected_id is None:
+            if extracted_id is None:
+                print_success(f"{filename} → sin ID (correcto)")
+            else:
+                print_error(f"{filename} → {extracted_id} (no debería extraer ID)")
+                all_passed = False
+        elif extracted_id:
+            if extracted_id == f"batch_{expected_id}":
+                print_success(f"{filename} → {extracted_id}")
             else:
-                print_error(f"{filename} → batch_{extracted_id} (esperaba: batch_{expected_id})")
+                print_error(f"{filename} → {extracted_id} (esperaba: batch_{expected_id})")
                 all_passed = False
         else:
             print_error(f"{filename} → No se pudo extraer ID")
@@ -191,36 +205,21 @@ def test_sync_simulation(client):
         training_db = client[TRAINING_DB]
         masks_col = training_db["training_metrics.masks.files"]
 
-        # Extraer números de batch
-        batch_numbers = {}
-        for batch in batches:
-            batch_id = batch["id"]
-            match = re.search(r'(\d+[A-Z]?\d*)', batch_id)
-            if match:
-                batch_numbers[batch_id] = match.group(1)
-
-        if not batch_numbers:
-            print_warning("No se pudieron extraer números de batch")
-            return False
-
-        # Buscar archivos que coincidan
-        all_numbers = list(batch_numbers.values())
-        numbers_pattern = "|".join(all_numbers)
-        mega_pattern = f"(masks_)?(batch_|Batch_)?({numbers_pattern})"
-
-        files = list(masks_col.find(
-            {"filename": {"$regex": mega_pattern, "$options": "i"}},
-            {"filename": 1}
-        ))
+        # Mismo extractor que la sincronización de la app: ID del nombre y join por ID
+        batch_ids = [batch["id"] for batch in batches]
+        wanted = set(batch_ids)
+        files = list(masks_col.find({}, {"filename": 1, "_id": 0}))
+        batch_file_map = {}
+        for file, batch_id in zip(files, extract_batch_ids([f.get("filename") for f in files])):
+            if batch_id in wanted:
+                batch_file_map.setdefault(batch_id, []).append(file)
+        matched_files = sum(len(matching) for matching in batch_file_map.values())
 
-        print_success(f"Encontrados {len(files)} archivos que coinciden con {len(batch_numbers)} batches")
+        print_success(f"Encontrados {matched_files} archivos que coinciden con {len(batch_ids)} batches")
 
         # Mapear archivos a batches
-        batch_file_map = {}
-        for batch_id, batch_num in batch_numbers.items():
-            matching_files = [f for f in files if batch_num in f.get("filename", "")]
-            batch_file_map[batch_id] = matching_files
-
+        for batch_id in batch_ids:
+            matching_files = batch_file_map.get(batch_id, [])
             if matching_files:
                 print_success(f"{batch_id} → {len(matching_files)} archivo(s) encontrado(s)")
             else:
@@ -228,7 +227,7 @@ def test_sync_simulation(client):
 
         # Resumen
         batches_with_files = sum(1 for files in batch_file_map.values() if files)
-        print_info(f"\nResumen: {batches_with_files}/{len(batch_numbers)} batches tienen archivos")
+        print_info(f"\nResumen: {batches_with_files}/{len(batch_ids)} batches tienen archivos")
 
         return True
 